@@ -0,0 +1,234 @@
+"""Load test for api_server against a local stand-in for the store websites
+
+Usage:
+    python api_loadtest.py --clients 50 --duration 10 --store-latency 0.2
+
+Starts a fake Rimi/Maxima/Lidl server on localhost, points the scrapers
+at it, runs the API in-process and hammers it with concurrent keep-alive
+clients. Reports requests/s, latency percentiles and how many upstream
+store requests were actually made.
+"""
+import argparse
+import asyncio
+import html
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from api_server import ApiServer, default_scrapers
+from scrapers.health import store_health
+from database.db_manager import DatabaseManager
+
+QUERIES = ['olas', 'piens', 'maize', 'sviests', 'siers', 'kafija', 'āboli', 'banāni']
+
+
+def rimi_page(products, embedded=True, promotions=False):
+    """A Rimi search page with the markup around each card that the real site has
+
+    embedded adds the per-card analytics JSON that the fast path reads;
+    without it the scraper has to fall back to the DOM. promotions adds
+    the crossed-out original price a promotions page shows.
+    """
+    cards = []
+    for i, (name, price) in enumerate(products):
+        data = ''
+        if embedded:
+            product = json.dumps({'id': str(i), 'name': name, 'price': price, 'currency': 'EUR'})
+            data = f' data-gtm-eec-product="{html.escape(product)}"'
+        original = ''
+        if promotions:
+            original = f'<span class="price-tag__original-price">{price * 1.25:.2f} €</span>'
+        cards.append(
+            f'<div class="product-grid__item"><div class="js-product-container card"{data}>'
+            f'<a href="/p/{i}" class="card__url"><div class="card__image-wrapper">'
+            f'<img data-src="/images/{i}.jpg" alt="{html.escape(name)}" class="lazy"></div>'
+            f'<div class="card__details"><p class="card__name">{html.escape(name)}</p>'
+            f'<div class="card__price-wrapper">{original}<div class="price-tag card__price" data-price="{price}">'
+            f'<span>{int(price)}</span><div><sup>{round(price % 1 * 100):02d}</sup><sub>€/gab.</sub></div>'
+            f'</div></div></div></a><form class="card__add-to-cart"><button type="submit">Pievienot</button>'
+            f'</form></div></div>'
+        )
+    return (
+        '<html><head><title>Meklēt</title><script src="/app.js"></script></head><body>'
+        '<nav class="header">' + '<a href="/c">Kategorija</a>' * 40 + '</nav>'
+        '<main><ul class="product-grid">' + ''.join(cards) + '</ul></main>'
+        '<footer>' + '<p>Rimi Latvia</p>' * 20 + '</footer></body></html>'
+    )
+
+
+class StandInStore:
+    """Serves canned search and promotion responses in each store's format"""
+
+    def __init__(self, latency=0.2, products_per_query=20, failing_store=None, fail_latency=5.0,
+                 slow_fraction=0.0, slow_latency=2.0, rimi_embedded=True):
+        self.latency = latency
+        self.products_per_query = products_per_query
+        self.rimi_embedded = rimi_embedded
+        # Fault injection: one store that hangs then errors, and occasional slow responses
+        self.failing_store = failing_store.lower() if failing_store else None
+        self.fail_latency = fail_latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.hits = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _products(self, query):
+        rng = random.Random(query)
+        return [(f"{query.capitalize()} {i}", round(rng.uniform(0.5, 5), 2)) for i in range(self.products_per_query)]
+
+    def _handler(self):
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with store._lock:
+                    store.hits += 1
+                url = urlsplit(self.path)
+                if store.failing_store and url.path.startswith(f"/{store.failing_store}"):
+                    time.sleep(store.fail_latency)
+                    self.send_error(503)
+                    return
+                if store.slow_fraction and random.random() < store.slow_fraction:
+                    time.sleep(store.slow_latency)
+                else:
+                    time.sleep(store.latency)
+                params = parse_qs(url.query)
+                query = (params.get('query') or params.get('q') or ['olas'])[0]
+                products = store._products(query)
+
+                if url.path.startswith('/lidl/'):
+                    body = json.dumps({'products': [
+                        {'name': name, 'price': {'amount': price}, 'slug': f"p{i}"}
+                        for i, (name, price) in enumerate(products)
+                    ]})
+                    content_type = 'application/json'
+                elif url.path.startswith('/maxima/'):
+                    body = json.dumps({'items': [
+                        {'name': name, 'price': price, 'slug': f"p{i}"}
+                        for i, (name, price) in enumerate(products)
+                    ]})
+                    content_type = 'application/json'
+                else:
+                    body = rimi_page(products, store.rimi_embedded, promotions=url.path.endswith('/akcijas'))
+                    content_type = 'text/html'
+
+                payload = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def point_scrapers_at(scrapers, base_url):
+    """Redirect the real scrapers to the stand-in server"""
+    for store_name, scraper in scrapers.items():
+        scraper.base_url = f"{base_url}/{store_name.lower()}"
+    return scrapers
+
+
+async def read_response(reader):
+    """Read one HTTP response, plain or chunked, returns the status code"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {k.strip().lower(): v.strip() for k, v in (l.split(':', 1) for l in lines[1:] if ':' in l)}
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return status
+
+
+async def client(port, route, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while time.perf_counter() < deadline:
+            query = random.choice(QUERIES)
+            start = time.perf_counter()
+            writer.write(f"GET /{route}?q={query} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('utf-8'))
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(clients, duration, route, store_latency, failing_store=None, slow_fraction=0.0):
+    store = StandInStore(latency=store_latency, failing_store=failing_store, slow_fraction=slow_fraction).start()
+    db_path = os.path.join(tempfile.mkdtemp(prefix='grocery_guru_load_'), 'load.db')
+    api = ApiServer(DatabaseManager(db_path), point_scrapers_at(default_scrapers(), store.url))
+    server = await api.start('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(port, route, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    await api.close()
+    store.stop()
+
+    latencies.sort()
+    report = {
+        'route': route,
+        'clients': clients,
+        'duration_s': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'upstream_requests': store.hits,
+        'store_latency_ms': store_latency * 1000,
+        'failing_store': failing_store,
+        'slow_fraction': slow_fraction,
+        'store_health': store_health.snapshot()
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Grocery Guru API")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--route', choices=['search', 'compare'], default='compare')
+    parser.add_argument('--store-latency', type=float, default=0.2, help="seconds the stand-in store takes per request")
+    parser.add_argument('--failing-store', help="make this store hang for 5s and answer 503")
+    parser.add_argument('--slow-fraction', type=float, default=0.0, help="fraction of store responses that take 2s")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.duration, args.route, args.store_latency, args.failing_store, args.slow_fraction))
+
+
+if __name__ == '__main__':
+    main()
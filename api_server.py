@@ -0,0 +1,468 @@
+"""Local HTTP/JSON API over the scrapers and DatabaseManager
+
+Usage:
+    python api_server.py --host 127.0.0.1 --port 8080
+
+Endpoints (all GET):
+    /search?q=olas              NDJSON stream, one line per store as it completes
+    /compare?q=olas             prices per product across stores
+    /history?name=..&store=..   price history, optional &days=
+    /discounts?store=Rimi       NDJSON stream of promotions per store
+    /lists                      shopping lists
+    /lists/<id>                 items in a shopping list
+    /basket?list_id=1           cost of a shopping list at every store
+    /snapshot?since=120345      binary price snapshot, a delta when since is given
+    /prices?name=..             latest price at every store, from the memory-mapped price file
+    /stores/nearest?lat=..&lon=..
+                                nearest store branches, optional &k= and &chain=; bundled
+                                branches are flagged "approximate"
+    /basket/nearby?lat=..&lon=..&items=olas|piens
+                                cheapest way to buy the items (or &list_id=) at the nearest
+                                branch of each chain within &radius_km= (default 3), over up
+                                to &max_stops= stores with travel at &cost_per_km=
+    /health                     circuit breaker state and latency per store
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from scrapers.rimi_scraper import RimiScraper
+from scrapers.maxima_scraper import MaximaScraper
+from scrapers.lidl_scraper import LidlScraper
+from scrapers.health import store_health
+from database.db_manager import DatabaseManager
+from database.snapshot_sync import export_snapshot
+from database.price_snapshot import PriceSnapshot, SnapshotMaintainer, snapshot_path
+from database.store_locator import BasketPlanner, BranchIndex, branch_json, load_branches, MAX_RADIUS_KM, MAX_STOPS
+from utils.metrics import metrics
+from utils.profiler import add_profile_argument, start_profiler
+
+REQUESTS = metrics.counter('api_requests_total', 'API requests by route and status', ('route', 'status'))
+REQUEST_SECONDS = metrics.histogram('api_request_seconds', 'API request latency', ('route',))
+COALESCED = metrics.counter(
+    'api_coalesced_total',
+    'Upstream calls joined by another request instead of being made again',
+    ('kind',)
+)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls into one shared upstream call"""
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def do(self, key, fn):
+        """Await fn() unless a call with the same key is already running, then join it"""
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._in_flight.pop(key, None))
+        else:
+            COALESCED.inc(kind=key[0])
+        # A client hanging up must not cancel the call other clients wait on
+        return await asyncio.shield(future)
+
+    def __len__(self):
+        return len(self._in_flight)
+
+
+class ApiServer:
+    def __init__(self, db_manager, scrapers, max_workers=16, price_snapshot=None, branch_index=None):
+        self.db_manager = db_manager
+        self.scrapers = scrapers
+        self.price_snapshot = price_snapshot
+        self.branch_index = branch_index
+        self.planner = None
+        if branch_index is not None and price_snapshot is not None:
+            self.planner = BasketPlanner(branch_index, price_snapshot)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='api')
+        self.flights = SingleFlight()
+        self.routes = {
+            '/search': self.search,
+            '/compare': self.compare,
+            '/history': self.history,
+            '/discounts': self.discounts,
+            '/lists': self.lists,
+            '/basket': self.basket,
+            '/snapshot': self.snapshot,
+            '/prices': self.prices,
+            '/stores/nearest': self.nearest_stores,
+            '/basket/nearby': self.nearby_basket,
+            '/health': self.health
+        }
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        logging.info(f"API listening on http://{host}:{port}")
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # Upstream calls
+
+    async def search_store(self, store_name, query):
+        """Scrape one store and save the results, shared by identical concurrent queries"""
+        key = ('search', store_name, query.casefold())
+        products = await self.flights.do(key, lambda: self._scrape(store_name, query))
+        return store_name, products
+
+    async def _scrape(self, store_name, query):
+        products = await self._run(self.scrapers[store_name].search_product, query)
+        # Answer waiting clients right away; saving happens in the background,
+        # one write transaction per store shard rather than one per result
+        self._run(self.db_manager.add_products, products)
+        return products
+
+    async def store_discounts(self, store_name):
+        key = ('discounts', store_name)
+        discounts = await self.flights.do(key, lambda: self._run(self.scrapers[store_name].get_discounts))
+        return store_name, discounts
+
+    # Routes
+
+    def _query(self, params):
+        query = params.get('q', '').strip()
+        if not query:
+            raise HttpError(400, "missing query parameter q")
+        return query
+
+    async def search(self, params):
+        query = self._query(params)
+        pending = [self.search_store(store_name, query) for store_name in self.scrapers]
+
+        async def stream():
+            for next_result in asyncio.as_completed(pending):
+                store_name, products = await next_result
+                yield {'store': store_name, 'status': store_health.status(store_name), 'products': products}
+        return stream()
+
+    async def compare(self, params):
+        query = self._query(params)
+        results = await asyncio.gather(*(self.search_store(store_name, query) for store_name in self.scrapers))
+        comparison = {}
+        for store_name, products in results:
+            for product in products:
+                comparison.setdefault(product['name'], dict.fromkeys(self.scrapers))[store_name] = product['price']
+        return {
+            'query': query,
+            'stores': {store_name: store_health.status(store_name) for store_name in self.scrapers},
+            'products': [{'name': name, 'prices': prices} for name, prices in comparison.items()]
+        }
+
+    async def health(self, params):
+        return {'stores': store_health.snapshot()}
+
+    async def history(self, params):
+        name = params.get('name')
+        store = params.get('store')
+        if not name or not store:
+            raise HttpError(400, "name and store are required")
+        history = await self._run(self.db_manager.get_product_price_history_by_name, name, store)
+        if params.get('days'):
+            if not params['days'].isdigit():
+                raise HttpError(400, "days must be a whole number")
+            since = (datetime.now() - timedelta(days=int(params['days']))).isoformat()
+            history = [row for row in history if row[1] >= since]
+        return {
+            'name': name,
+            'store': store,
+            'history': [{'price': price, 'recorded_at': recorded_at} for price, recorded_at in history]
+        }
+
+    async def discounts(self, params):
+        store = params.get('store')
+        if store and store not in self.scrapers:
+            raise HttpError(404, f"unknown store {store}")
+        pending = [self.store_discounts(store_name) for store_name in ([store] if store else self.scrapers)]
+
+        async def stream():
+            for next_result in asyncio.as_completed(pending):
+                store_name, discounts = await next_result
+                yield {'store': store_name, 'discounts': discounts}
+        return stream()
+
+    async def lists(self, params, list_id=None):
+        if list_id is None:
+            return {'lists': await self._run(self.db_manager.get_shopping_lists)}
+        return {'list_id': list_id, 'items': await self._run(self.db_manager.get_shopping_list_items, list_id)}
+
+    async def basket(self, params):
+        try:
+            list_id = int(params.get('list_id', ''))
+        except ValueError:
+            raise HttpError(400, "list_id must be an integer")
+        costs = await self._run(self.db_manager.get_basket_costs, list_id)
+        complete = {store: cost for store, cost in costs.items() if not cost['missing']}
+        cheapest = min(complete, key=lambda store: complete[store]['total']) if complete else None
+        return {'list_id': list_id, 'stores': costs, 'cheapest_store': cheapest}
+
+    async def prices(self, params):
+        name = params.get('name')
+        if not name:
+            raise HttpError(400, "missing query parameter name")
+        if self.price_snapshot is None or not self.price_snapshot.available:
+            raise HttpError(404, "no price snapshot available")
+        # Lookups are a binary search over a mapped file, cheap enough for the event loop
+        prices = self.price_snapshot.prices(name)
+        if not prices:
+            raise HttpError(404, f"unknown product {name}")
+        lowest = self.price_snapshot.lowest(name)
+        return {
+            'name': name,
+            'prices': prices,
+            'cheapest_store': lowest[1],
+            'version': self.price_snapshot.version
+        }
+
+    def _number(self, params, key, default=None, low=None, high=None):
+        value = params.get(key)
+        if value is None:
+            if default is None:
+                raise HttpError(400, f"missing query parameter {key}")
+            return default
+        try:
+            number = float(value)
+        except ValueError:
+            raise HttpError(400, f"{key} must be a number")
+        if not math.isfinite(number) or (low is not None and number < low) or (high is not None and number > high):
+            raise HttpError(400, f"{key} must be between {low} and {high}")
+        return number
+
+    def _location(self, params):
+        if self.branch_index is None:
+            raise HttpError(404, "no store locations loaded")
+        return self._number(params, 'lat', low=-90, high=90), self._number(params, 'lon', low=-180, high=180)
+
+    async def nearest_stores(self, params):
+        lat, lon = self._location(params)
+        k = int(self._number(params, 'k', 5, 1, 50))
+        chain = params.get('chain')
+        if chain and chain not in self.branch_index.chains:
+            raise HttpError(404, f"unknown chain {chain}")
+        # Grid lookups over a few cells, cheap enough for the event loop
+        nearest = self.branch_index.nearest(lat, lon, k, chain)
+        return {
+            'lat': lat,
+            'lon': lon,
+            'stores': [branch_json(branch, distance) for distance, branch in nearest]
+        }
+
+    async def nearby_basket(self, params):
+        lat, lon = self._location(params)
+        if self.planner is None or not self.price_snapshot.available:
+            raise HttpError(404, "no price snapshot available")
+        radius_km = self._number(params, 'radius_km', 3.0, 0, MAX_RADIUS_KM)
+        max_stops = int(self._number(params, 'max_stops', 1, 1, MAX_STOPS))
+        cost_per_km = self._number(params, 'cost_per_km', 0.0, 0, 100)
+        if params.get('items'):
+            items = {}
+            for name in filter(None, (name.strip() for name in params['items'].split('|'))):
+                items[name] = items.get(name, 0) + 1
+        elif params.get('list_id'):
+            try:
+                list_id = int(params['list_id'])
+            except ValueError:
+                raise HttpError(400, "list_id must be an integer")
+            items = {}
+            for item in await self._run(self.db_manager.get_shopping_list_items, list_id):
+                items[item['name']] = items.get(item['name'], 0) + item['quantity']
+        else:
+            raise HttpError(400, "items or list_id is required")
+        if not items:
+            raise HttpError(404, "no items to price")
+        # A handful of snapshot lookups and routes over the chains in reach, fine on the event loop
+        plan = self.planner.plan(lat, lon, items, radius_km, max_stops, cost_per_km)
+        return {'lat': lat, 'lon': lon, 'radius_km': radius_km, 'version': self.price_snapshot.version, **plan}
+
+    async def snapshot(self, params):
+        since = params.get('since')
+        if since is not None and not since.isdigit():
+            raise HttpError(400, "since must be a snapshot version")
+
+        def build():
+            buffer = io.BytesIO()
+            export_snapshot(self.db_manager.db_path, buffer, int(since) if since else None)
+            return buffer.getvalue()
+        return await self._run(build)
+
+    # HTTP plumbing
+
+    def _resolve(self, path):
+        if path.startswith('/lists/'):
+            try:
+                list_id = int(path[len('/lists/'):])
+            except ValueError:
+                raise HttpError(404, "not found")
+            return '/lists', lambda params: self.lists(params, list_id)
+        handler = self.routes.get(path)
+        if handler is None:
+            raise HttpError(404, "not found")
+        return path, handler
+
+    async def handle_connection(self, reader, writer):
+        """Serve keep-alive HTTP/1.1 requests on one connection"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                await self.handle_request(method, target, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, writer, keep_alive):
+        url = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = 'unknown'
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            if method != 'GET':
+                raise HttpError(405, "only GET is supported")
+            route, handler = self._resolve(url.path)
+            result = await handler(params)
+            status = 200
+            if hasattr(result, '__aiter__'):
+                if not await self._send_stream(writer, result, keep_alive, target):
+                    status = 500
+            elif isinstance(result, bytes):
+                await self._send(writer, 200, result, keep_alive, 'application/octet-stream')
+            else:
+                await self._send(writer, 200, result, keep_alive)
+        except HttpError as e:
+            status = e.status
+            await self._send(writer, e.status, {'error': str(e)}, keep_alive)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            logging.error(f"Error handling {target}: {str(e)}")
+            status = 500
+            await self._send(writer, 500, {'error': 'internal error'}, keep_alive)
+        REQUESTS.inc(route=route, status=str(status))
+        REQUEST_SECONDS.observe(loop.time() - start, route=route)
+
+    async def _send(self, writer, status, body, keep_alive, content_type='application/json; charset=utf-8'):
+        payload = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+        )
+        await writer.drain()
+
+    async def _send_stream(self, writer, chunks, keep_alive, target):
+        """Send an async iterator of objects as chunked NDJSON, flushing each line
+
+        Returns False if the iterator failed part way. The 200 headers are
+        already out by then, so the failure is reported as a final error
+        line and the body is still terminated properly.
+        """
+        writer.write(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        ok = True
+        try:
+            async for chunk in chunks:
+                self._write_chunk(writer, chunk)
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            logging.error(f"Error streaming {target}: {str(e)}")
+            self._write_chunk(writer, {'error': 'internal error'})
+            ok = False
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return ok
+
+    @staticmethod
+    def _write_chunk(writer, obj):
+        line = json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n'
+        writer.write(f"{len(line):x}\r\n".encode('latin-1') + line + b'\r\n')
+
+
+def default_scrapers():
+    return {
+        'Rimi': RimiScraper(),
+        'Maxima': MaximaScraper(),
+        'Lidl': LidlScraper()
+    }
+
+
+async def serve(host, port, db_path):
+    db_manager = DatabaseManager(db_path)
+    price_snapshot = PriceSnapshot(snapshot_path(db_path))
+    maintainer = SnapshotMaintainer(db_manager, price_snapshot.path)
+    if not price_snapshot.available:
+        maintainer.rebuild()
+        price_snapshot.reload()
+    branch_index = BranchIndex(load_branches(db_path))
+    server = ApiServer(db_manager, default_scrapers(), price_snapshot=price_snapshot, branch_index=branch_index)
+    await server.start(host, port)
+    async with server.server:
+        await server.server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grocery Guru HTTP API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default='grocery_guru.db')
+    parser.add_argument('--metrics-port', type=int, help="also serve Prometheus metrics on this port")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    start_profiler('api', args.profile)
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    try:
+        asyncio.run(serve(args.host, args.port, args.db))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
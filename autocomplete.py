@@ -0,0 +1,179 @@
+import bisect
+import heapq
+import threading
+import unicodedata
+from tkinter import ttk
+
+
+def normalize(text: str) -> str:
+    """Casefold and strip diacritics so 'sviests' matches 'Sviests' and 'Šķiņķis' matches 'skinkis'"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class ProductIndex:
+    """In-memory prefix index over product names for search-as-you-type
+
+    Every word of a name is indexed, so 'piens' finds 'Rimi piens 2%'. Keys
+    live in a sorted list, plus a short one for recent additions, and a
+    prefix lookup is a pair of binary searches in each.
+    Results are ranked by a popularity score that grows every time a
+    product is scraped again or picked by the user.
+    """
+
+    # Above this many matching keys, scan products in popularity order instead
+    WIDE_PREFIX = 2000
+    # Keys of added products wait in a small sorted list until there are
+    # this many, then are merged into the main list outside the lock
+    MERGE_PENDING = 4096
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []  # entry id -> (name, store)
+        self.padded = []  # entry id -> ' ' + normalized name, for word-boundary matching
+        self.scores = []  # entry id -> popularity
+        self.ids = {}  # (name, store) -> entry id
+        self._keys = []  # sorted (normalized suffix starting at a word, entry id)
+        self._pending = []  # sorted keys of products added since the last merge
+        self._merging = []  # pending keys being merged into _keys
+        self._replay = None  # adds made while a build runs, applied to the new index
+        self._by_score = []  # entry ids, most popular first
+        self.ready = False
+
+    def build(self, products):
+        """Build the index in one pass from dicts with name, store and popularity
+
+        The new index is built without the lock and swapped in, so searches
+        keep working meanwhile, and products added during the build are kept.
+        """
+        with self._lock:
+            self._replay = []
+        fresh = ProductIndex()
+        keys = []
+        for product in products:
+            entry_id = fresh._new_entry(product['name'], product['store'], product.get('popularity', 0))
+            keys.extend(fresh._entry_keys(entry_id))
+        keys.sort()
+        by_score = sorted(range(len(fresh.entries)), key=fresh.scores.__getitem__, reverse=True)
+        with self._lock:
+            self.entries, self.padded, self.scores, self.ids = fresh.entries, fresh.padded, fresh.scores, fresh.ids
+            self._keys, self._pending, self._merging, self._by_score = keys, [], [], by_score
+            replay, self._replay = self._replay, None
+            for name, store, weight in replay:
+                self._add(name, store, weight)
+            self.ready = True
+
+    def add(self, name: str, store: str, weight: int = 1):
+        """Insert a product or bump its popularity, e.g. from a DB upsert"""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((name, store, weight))
+            self._add(name, store, weight)
+            if len(self._pending) < self.MERGE_PENDING or self._merging:
+                return
+            keys, merging = self._keys, self._pending
+            self._merging, self._pending = merging, []
+        # Searches read _merging meanwhile; timsort joins the two sorted runs
+        merged = keys + merging
+        merged.sort()
+        with self._lock:
+            # A build swapped in a new index while merging; it has these products
+            if self._keys is keys:
+                self._keys = merged
+            self._merging = []
+
+    def _add(self, name, store, weight):
+        entry_id = self.ids.get((name, store))
+        if entry_id is not None:
+            self.scores[entry_id] += weight
+            return
+        entry_id = self._new_entry(name, store, weight)
+        for key in self._entry_keys(entry_id):
+            bisect.insort(self._pending, key)
+        # New products start unpopular; the next build re-ranks exactly
+        self._by_score.append(entry_id)
+
+    def search(self, prefix: str, limit: int = 10, store: str = None) -> list:
+        """Get the top (name, store) pairs with a word starting with prefix"""
+        prefix = normalize(prefix.strip())
+        if not prefix:
+            return []
+        with self._lock:
+            ranges = []
+            for keys in (self._keys, self._merging, self._pending):
+                lo = bisect.bisect_left(keys, (prefix,))
+                ranges.append((keys, lo, bisect.bisect_left(keys, (prefix + '\uffff',), lo)))
+
+            if sum(hi - lo for _, lo, hi in ranges) > self.WIDE_PREFIX:
+                # Popular matches are dense in a wide range, so a scan
+                # down the popularity order stops after a few hundred ids
+                matches = []
+                needle = ' ' + prefix
+                for entry_id in self._by_score:
+                    if store and self.entries[entry_id][1] != store:
+                        continue
+                    if needle in self.padded[entry_id]:
+                        matches.append(entry_id)
+                        if len(matches) == limit:
+                            break
+            else:
+                candidates = {entry_id for keys, lo, hi in ranges for _, entry_id in keys[lo:hi]}
+                if store:
+                    candidates = [i for i in candidates if self.entries[i][1] == store]
+                matches = heapq.nlargest(limit, candidates, key=self.scores.__getitem__)
+            return [self.entries[i] for i in matches]
+
+    def _new_entry(self, name, store, score):
+        entry_id = len(self.entries)
+        self.entries.append((name, store))
+        self.padded.append(' ' + ' '.join(normalize(name).split()))
+        self.scores.append(score)
+        self.ids[(name, store)] = entry_id
+        return entry_id
+
+    def _entry_keys(self, entry_id):
+        words = self.padded[entry_id].split()
+        return [(' '.join(words[i:]), entry_id) for i in range(len(words))]
+
+
+class AutocompleteCombobox(ttk.Combobox):
+    """Combobox whose dropdown is filled lazily from a ProductIndex"""
+
+    def __init__(self, parent, index, limit=15, delay_ms=150, formatter=None, unique=False, **kwargs):
+        super().__init__(parent, postcommand=self.refresh_suggestions, **kwargs)
+        self.index = index
+        self.limit = limit
+        self.delay_ms = delay_ms
+        self.formatter = formatter or (lambda name, store: f"{name} ({store})")
+        self.unique = unique  # collapse the same name from several stores
+        self.suggestions = {}  # display text -> (name, store)
+        self._after_id = None
+
+        self.bind('<KeyRelease>', self._on_key)
+        self.bind('<<ComboboxSelected>>', self._on_selected, add='+')
+
+    def refresh_suggestions(self):
+        """Query the index for the current text and fill the dropdown"""
+        self._after_id = None
+        suggestions = {}
+        # Fetch extra results so collapsing duplicate names still fills the list
+        fetch = self.limit * 3 if self.unique else self.limit
+        for name, store in self.index.search(self.get(), fetch):
+            suggestions.setdefault(self.formatter(name, store), (name, store))
+            if len(suggestions) == self.limit:
+                break
+        self.suggestions = suggestions
+        self['values'] = list(suggestions)
+
+    def _on_key(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        # Debounce: only query once typing pauses
+        if self._after_id:
+            self.after_cancel(self._after_id)
+        self._after_id = self.after(self.delay_ms, self.refresh_suggestions)
+
+    def _on_selected(self, event=None):
+        product = self.suggestions.get(self.get())
+        if product:
+            self.index.add(*product, weight=5)
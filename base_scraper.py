@@ -1,36 +1,177 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import time
+from urllib.parse import urljoin
 import requests
-from bs4 import BeautifulSoup
 import logging
+from utils.metrics import metrics, span
+from .health import store_health, CircuitOpenError
+
+REQUEST_SECONDS = metrics.histogram(
+    'scraper_request_seconds',
+    'Latency of HTTP requests to store websites',
+    ('store', 'endpoint')
+)
+RESPONSE_BYTES = metrics.counter(
+    'scraper_response_bytes_total',
+    'Bytes downloaded from store websites',
+    ('store', 'endpoint')
+)
+RESPONSES = metrics.counter(
+    'scraper_responses_total',
+    'HTTP responses from store websites by status code, or error for failed requests',
+    ('store', 'endpoint', 'status')
+)
+PARSE_SECONDS = metrics.histogram(
+    'scraper_parse_seconds',
+    'Time spent parsing store responses into products',
+    ('store', 'endpoint')
+)
+EXTRACTION_PATHS = metrics.counter(
+    'scraper_extraction_path_total',
+    'Pages parsed, by how the products were extracted from them',
+    ('store', 'endpoint', 'path')
+)
 
 class BaseScraper(ABC):
+    store_name = None
+    # Seconds before a request to the store is abandoned
+    request_timeout = 10.0
+    # How products were extracted from the last page parsed, see _record_extraction
+    last_extraction_path = None
+    
     def __init__(self):
+        self.health = store_health.get(self.store_name)
         self.session = requests.Session()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
     @abstractmethod
-    def search_product(self, query: str) -> list:
-        """Search for a product and return a list of results"""
+    def request(self, kind: str, target: str = None, page: int = None) -> tuple:
+        """(url, params) to GET for a page kind
+        
+        Kinds are 'search' (target is the query), 'promotions' and
+        'product' (target is the product page URL). page picks a page of
+        search results, None for the first.
+        """
         pass
     
     @abstractmethod
+    def parse(self, kind: str, body: bytes) -> tuple:
+        """Parse a downloaded page into (extraction path, iterable of results)
+        
+        Results are ProductRecords for 'search', DiscountRecords for
+        'promotions' and the price for 'product'. Parsing only reads body,
+        base_url and store_name, so it can run in another process.
+        """
+        pass
+    
+    def fetch(self, kind: str, target: str = None, page: int = None) -> bytes:
+        """Download a page's raw bytes without parsing them"""
+        url, params = self.request(kind, target, page)
+        return self._get(url, kind, params=params).content
+    
+    def parse_page(self, kind: str, body: bytes) -> list:
+        """Parse a page in this process, timing it and recording the extraction path
+        
+        parse() may return a lazy generator, so the results are built into a
+        list inside the timer, as parse_in_worker does.
+        """
+        with self._parsing(kind):
+            path, results = self.parse(kind, body)
+            results = list(results)
+        self._record_extraction(kind, path)
+        return results
+    
+    def iter_search_product(self, query: str):
+        """Search for a product, yielding a ProductRecord per result
+        
+        Request errors, including CircuitOpenError, propagate so callers can
+        tell a failing store from one with no results.
+        """
+        yield from self.parse_page('search', self.fetch('search', query))
+    
+    def search_product(self, query: str) -> list:
+        """Search for a product and return a list of results, empty if the store failed"""
+        try:
+            return [record.to_dict() for record in self.iter_search_product(query)]
+        except Exception as e:
+            logging.error(f"Error searching {self.store_name} products: {str(e)}")
+            return []
+    
     def get_product_price(self, product_url: str) -> float:
         """Get the current price for a specific product"""
-        pass
+        try:
+            return next(iter(self.parse_page('product', self.fetch('product', product_url))), None)
+        except Exception as e:
+            logging.error(f"Error getting product price: {str(e)}")
+            return None
     
-    @abstractmethod
-    def get_discounts(self) -> list:
-        """Get current discounts/promotions"""
-        pass
+    def iter_discounts(self):
+        """Get current discounts/promotions, yielding a DiscountRecord at a time
+        
+        Request errors propagate, as in iter_search_product.
+        """
+        yield from self.parse_page('promotions', self.fetch('promotions'))
     
-    def _make_request(self, url: str) -> BeautifulSoup:
-        """Make an HTTP request and return BeautifulSoup object"""
+    def get_discounts(self) -> list:
+        """Get current discounts/promotions, empty if the store failed"""
         try:
-            response = self.session.get(url, headers=self.headers)
-            response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
+            return [record.to_dict() for record in self.iter_discounts()]
         except Exception as e:
-            logging.error(f"Error fetching {url}: {str(e)}")
+            logging.error(f"Error getting {self.store_name} discounts: {str(e)}")
+            return []
+    
+    def _get(self, url: str, endpoint: str, **kwargs) -> requests.Response:
+        """GET a store URL, recording latency, size and status code
+        
+        Fails fast with CircuitOpenError while the store's circuit is open,
+        and races a duplicate request when this one runs past the store's p95.
+        """
+        labels = {'store': self.store_name, 'endpoint': endpoint}
+        if not self.health.allow():
+            RESPONSES.inc(status='circuit_open', **labels)
+            raise CircuitOpenError(f"{self.store_name} is unavailable, not calling {url}")
+        kwargs.setdefault('timeout', self.health.timeout(self.request_timeout))
+        start = time.perf_counter()
+        with span('http.get', url=url, **labels):
+            try:
+                response = self.health.hedged(self.session.get, url, headers=self.headers, **kwargs)
+            except Exception as e:
+                RESPONSES.inc(status='error', **labels)
+                self.health.record(False, time.perf_counter() - start, e)
+                raise
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+        # 4xx is the store answering, only server errors count against its health
+        self.health.record(
+            response.status_code < 500,
+            time.perf_counter() - start,
+            None if response.status_code < 500 else f"HTTP {response.status_code}"
+        )
+        RESPONSES.inc(status=str(response.status_code), **labels)
+        RESPONSE_BYTES.inc(len(response.content), **labels)
+        response.raise_for_status()
+        return response
+        
+    def _absolute_url(self, url):
+        """Resolve a possibly relative or protocol-relative link against the store's site"""
+        if not url:
             return None
+        # Site-relative links hang off base_url, the way the scrapers build page URLs
+        if url.startswith('/') and not url.startswith('//'):
+            return self.base_url + url
+        return urljoin(self.base_url + '/', url)
+        
+    def _record_extraction(self, endpoint: str, path: str):
+        """Note how products were pulled out of a page, e.g. embedded JSON or the DOM"""
+        self.last_extraction_path = path
+        EXTRACTION_PATHS.inc(store=self.store_name, endpoint=endpoint, path=path)
+        
+    @contextmanager
+    def _parsing(self, endpoint: str):
+        """Time the parse stage of a request"""
+        labels = {'store': self.store_name, 'endpoint': endpoint}
+        with span('parse', **labels), PARSE_SECONDS.time(**labels):
+            yield
@@ -0,0 +1,584 @@
+"""Benchmark DatabaseManager and the data paths built on it at several scales
+
+Usage:
+    python benchmark.py --scales 1000,10000,100000 --output report.json
+    python benchmark.py --compare baseline.json report.json --threshold 1.25
+    python benchmark.py --records 20000
+    python benchmark.py --rimi-pages 200
+    python benchmark.py --store-pages 50 --output parsing.json
+    python benchmark.py --ingest 200
+    python benchmark.py --bulk-import 1000000
+    python benchmark.py --locator 20000
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from database.db_manager import DatabaseManager
+from utils.export import ShoppingListExporter
+from utils.synthetic_data import generate, product_name, write_market_submissions, STORES
+from utils.profiler import add_profile_argument, start_profiler
+
+# Price history rows generated per product at every scale
+HISTORY_PER_PRODUCT = 100
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Time fn() and summarise the runs in seconds"""
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    runs.sort()
+    return {
+        'repeat': repeat,
+        'min': runs[0],
+        'median': statistics.median(runs),
+        'p95': runs[min(len(runs) - 1, int(len(runs) * 0.95))],
+        'mean': statistics.fmean(runs)
+    }
+
+
+def sample_products(db_path, count, rng):
+    """Pick existing (id, name, store) rows to query"""
+    with sqlite3.connect(db_path) as conn:
+        max_id = conn.execute('SELECT MAX(id) FROM products').fetchone()[0]
+        ids = [rng.randint(1, max_id) for _ in range(count)]
+        return [
+            conn.execute('SELECT id, name, store FROM products WHERE id = ?', (product_id,)).fetchone()
+            for product_id in ids
+        ]
+
+
+def run_scale(db_path, products, repeat, rng):
+    """Run every benchmark against one generated database"""
+    db = DatabaseManager(db_path)
+    exporter = ShoppingListExporter(db)
+    samples = sample_products(db_path, 20, rng)
+    names = [name for _, name, _ in samples]
+    list_ids = [shopping_list['id'] for shopping_list in db.get_shopping_lists()[:20]]
+    picks = iter(range(10 ** 9))
+
+    def pick(values):
+        return values[next(picks) % len(values)]
+
+    benchmarks = {
+        'db.get_all_products': lambda: db.get_all_products(),
+        'db.get_product_popularity': lambda: db.get_product_popularity(),
+        'db.get_product_price_history': lambda: db.get_product_price_history(pick(samples)[0]),
+        'db.get_product_price_history_by_name': lambda: db.get_product_price_history_by_name(*pick(samples)[1:]),
+        'db.get_shopping_lists': lambda: db.get_shopping_lists(),
+        'db.get_shopping_list_items': lambda: db.get_shopping_list_items(pick(list_ids)),
+        'db.get_lowest_price': lambda: db.get_lowest_price(pick(names)),
+        'db.get_lowest_prices': lambda: db.get_lowest_prices(names),
+        'db.get_price_alerts': lambda: db.get_price_alerts({name: 5.0 for name in names}),
+        'db.add_product.update': lambda: db.add_product(*pick(samples)[1:], round(rng.uniform(0.5, 10), 2)),
+        'db.add_product.insert': lambda: db.add_product(product_name(rng, rng.randrange(10 ** 9)), rng.choice(STORES), 1.99),
+        'db.create_shopping_list': lambda: db.create_shopping_list('Benchmark'),
+        'db.add_item_to_list': lambda: db.add_item_to_list(pick(list_ids), pick(samples)[0], 1),
+        'export.calculate_savings': lambda: exporter.calculate_savings(db.get_shopping_list_items(pick(list_ids))),
+        # What search_products does per query: one upsert per result per store
+        'search_products.db_writes': lambda: [
+            db.add_product(name, store, round(rng.uniform(0.5, 10), 2))
+            for _, name, store in samples[:20]
+            for store in STORES
+        ],
+    }
+
+    try:
+        from utils.price_history import PriceSeriesCache
+        series = PriceSeriesCache(db)
+        benchmarks['price_history.load_series'] = lambda: series.load(*pick(samples)[1:], 365)
+    except ImportError as e:
+        print(f"Skipping price history benchmark: {e}")
+
+    results = []
+    for name, fn in benchmarks.items():
+        result = measure(fn, repeat)
+        result.update({'name': name, 'scale': products})
+        results.append(result)
+        print(f"  {name:<40} median {result['median'] * 1000:9.2f} ms   p95 {result['p95'] * 1000:9.2f} ms")
+
+    # Full-table streaming is timed once, it is the slowest by far
+    result = measure(lambda: sum(1 for _ in db.iter_price_history()), repeat=1, warmup=0)
+    result.update({'name': 'db.iter_price_history', 'scale': products})
+    results.append(result)
+    print(f"  {'db.iter_price_history':<40} {result['median']:9.2f} s")
+    return results
+
+
+def _allocated(build):
+    """Bytes still allocated by the object build() returns"""
+    tracemalloc.start()
+    try:
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return size
+
+
+def run_records(count, store_latency=0.0):
+    """Compare list-of-dicts scraper results with streamed ProductRecords
+
+    Memory is what `count` products take to hold. Latency is time to the
+    first result and to the last, for each scraper against a local
+    stand-in store serving `count` products per search.
+    """
+    from scrapers.records import ProductRecord
+    from api_loadtest import StandInStore, point_scrapers_at
+    from api_server import default_scrapers
+
+    rng = random.Random(1)
+    rows = [(product_name(rng, i), rng.choice(STORES), round(rng.uniform(0.3, 15), 2)) for i in range(count)]
+    # Fresh strings, as a parser would produce them, rather than shared literals
+    dict_bytes = _allocated(lambda: [
+        {'name': name, 'price': price, 'store': ''.join(store), 'url': f"https://example.lv/p/{i}"}
+        for i, (name, store, price) in enumerate(rows)
+    ])
+    record_bytes = _allocated(lambda: [
+        ProductRecord.from_price(name, ''.join(store), price, f"https://example.lv/p/{i}")
+        for i, (name, store, price) in enumerate(rows)
+    ])
+    report = {
+        'products': count,
+        'memory': {
+            'list_of_dicts_bytes': dict_bytes,
+            'records_bytes': record_bytes,
+            'ratio': round(record_bytes / dict_bytes, 3)
+        },
+        'latency': {}
+    }
+    # Name and URL strings are the same in both, the difference is the containers
+    print(f"Holding {count} products: dicts {dict_bytes / 1e6:.1f} MB, records {record_bytes / 1e6:.1f} MB")
+
+    store = StandInStore(latency=store_latency, products_per_query=count).start()
+    try:
+        scrapers = point_scrapers_at(default_scrapers(), store.url)
+        for store_name, scraper in scrapers.items():
+            scraper.search_product('piens')  # warm up the connection
+            start = time.perf_counter()
+            products = scraper.search_product('piens')
+            list_total = time.perf_counter() - start
+
+            start = time.perf_counter()
+            first = None
+            streamed = 0
+            for _ in scraper.iter_search_product('piens'):
+                if first is None:
+                    first = time.perf_counter() - start
+                streamed += 1
+            stream_total = time.perf_counter() - start
+
+            report['latency'][store_name] = {
+                'list_first_and_last_s': round(list_total, 4),
+                'stream_first_s': round(first or 0, 4),
+                'stream_last_s': round(stream_total, 4),
+                'results': streamed
+            }
+            print(
+                f"  {store_name:<8} list: all {len(products)} after {list_total * 1000:8.1f} ms   "
+                f"stream: first after {(first or 0) * 1000:8.1f} ms, all after {stream_total * 1000:8.1f} ms"
+            )
+    finally:
+        store.stop()
+    return report
+
+
+def run_rimi_extraction(pages, products_per_page=60):
+    """CPU time per Rimi search page for the embedded-JSON path and the DOM fallback"""
+    from api_loadtest import StandInStore, point_scrapers_at, QUERIES
+    from api_server import default_scrapers
+
+    report = {'pages': pages, 'products_per_page': products_per_page, 'paths': {}}
+    for embedded in (True, False):
+        store = StandInStore(latency=0.0, products_per_query=products_per_page, rimi_embedded=embedded).start()
+        try:
+            scraper = point_scrapers_at(default_scrapers(), store.url)['Rimi']
+            bodies = [scraper.fetch('search', QUERIES[i % len(QUERIES)]) for i in range(pages)]
+        finally:
+            store.stop()
+        # Time parsing alone on the fetched pages
+        start = time.process_time()
+        products = sum(1 for body in bodies for _ in scraper.parse_page('search', body))
+        cpu = time.process_time() - start
+        report['paths'][scraper.last_extraction_path] = {
+            'cpu_ms_per_page': round(cpu / pages * 1000, 3),
+            'products': products
+        }
+        print(f"  {scraper.last_extraction_path:<10} {cpu / pages * 1000:8.2f} ms CPU per page, {products} products")
+    paths = list(report['paths'].values())
+    if len(paths) == 2 and paths[0]['cpu_ms_per_page']:
+        report['speedup'] = round(paths[1]['cpu_ms_per_page'] / paths[0]['cpu_ms_per_page'], 1)
+        print(f"  embedded JSON is {report['speedup']}x cheaper than the DOM")
+    return report
+
+
+def store_pages(store, kind, variant, products):
+    """A page body in the store's format, for parsing benchmarks"""
+    from api_loadtest import rimi_page
+
+    filler = '<nav class="header">' + '<a href="/c">Kategorija</a>' * 40 + '</nav>'
+    if kind == 'product':
+        element = {
+            'Rimi': f'<div class="price-tag card__price" data-price="{products[0][1]}"><span>{products[0][1]}</span></div>',
+            'Maxima': f'<span class="product-price">€{products[0][1]:.2f}</span>'.replace('.', ','),
+            'Lidl': f'<span class="pricebox__price">{products[0][1]:.2f} €</span>'
+        }[store]
+        return f"<html><body>{filler}<main><h1>{products[0][0]}</h1>{element}</main></body></html>".encode('utf-8')
+    if store == 'Rimi':
+        return rimi_page(products, embedded=variant == 'embedded', promotions=kind == 'promotions').encode('utf-8')
+    if store == 'Maxima':
+        if kind == 'search':
+            items = [
+                {'name': name, 'price': price, 'slug': f"p{i}", 'image': f"/images/{i}.jpg"}
+                for i, (name, price) in enumerate(products)
+            ]
+        else:
+            items = [
+                {'name': name, 'original_price': round(price * 1.25, 2), 'discount_price': price,
+                 'slug': f"p{i}", 'valid_until': '2026-12-31', 'image': f"/images/{i}.jpg"}
+                for i, (name, price) in enumerate(products)
+            ]
+        return json.dumps({'items': items}).encode('utf-8')
+    images = lambda i: [{'url': f"https://images.lidl.lv/{i}-{size}.jpg"} for size in (200, 600)]
+    if kind == 'search':
+        return json.dumps({'products': [
+            {'name': name, 'price': {'amount': price}, 'slug': f"p{i}", 'images': images(i)}
+            for i, (name, price) in enumerate(products)
+        ]}).encode('utf-8')
+    return json.dumps({'items': [
+        {'name': name, 'regularPrice': {'amount': round(price * 1.25, 2)}, 'discountPrice': {'amount': price},
+         'slug': f"p{i}", 'validUntil': '2026-12-31', 'images': images(i)}
+        for i, (name, price) in enumerate(products)
+    ]}).encode('utf-8')
+
+
+STORE_PAGE_CASES = [
+    ('Rimi', 'search', 'embedded'), ('Rimi', 'search', 'dom'),
+    ('Rimi', 'promotions', 'embedded'), ('Rimi', 'promotions', 'dom'),
+    ('Rimi', 'product', 'dom'),
+    ('Maxima', 'search', 'json'), ('Maxima', 'promotions', 'json'), ('Maxima', 'product', 'dom'),
+    ('Lidl', 'search', 'json'), ('Lidl', 'promotions', 'json'), ('Lidl', 'product', 'dom'),
+]
+
+
+def run_store_extraction(pages, output, products_per_page=60, repeat=5, seed=42):
+    """Time parsing each store's page kinds, per page
+
+    Uses only scraper.parse(kind, body), so a report from any revision can
+    be checked against another with --compare, e.g. hand-written scrapers
+    against spec-driven ones.
+    """
+    from api_server import default_scrapers
+
+    rng = random.Random(seed)
+    scrapers = default_scrapers()
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'started_at': datetime.now().isoformat(),
+            'pages': pages
+        },
+        'results': []
+    }
+    for store, kind, variant in STORE_PAGE_CASES:
+        bodies = [
+            store_pages(store, kind, variant, [
+                (product_name(rng, rng.randrange(10 ** 6)), round(rng.uniform(0.3, 15), 2))
+                for _ in range(products_per_page)
+            ])
+            for _ in range(pages)
+        ]
+        scraper = scrapers[store]
+        counted = []
+
+        def parse_all():
+            counted.clear()
+            for body in bodies:
+                _, results = scraper.parse(kind, body)
+                counted.append(sum(1 for _ in results))
+
+        result = measure(parse_all, repeat)
+        for key in ('min', 'median', 'p95', 'mean'):
+            result[key] /= pages
+        result.update({'name': f"parse.{store}.{kind}.{variant}", 'scale': products_per_page, 'results': sum(counted)})
+        report['results'].append(result)
+        print(f"  {result['name']:<32} median {result['median'] * 1000:8.3f} ms per page, {sum(counted)} results")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+    return report
+
+
+def _ingest_store(db_path, store, batches, batch_size, seed):
+    """One store's writer process: add_products in batches, like a crawl worker saving results"""
+    rng = random.Random(seed)
+    db = DatabaseManager(db_path)
+    for batch in range(batches):
+        db.add_products([
+            {'name': product_name(rng, rng.randrange(batch_size * 20)), 'store': store,
+             'price': round(rng.uniform(0.3, 15), 2), 'url': f"https://example.lv/{store}/{batch}"}
+            for _ in range(batch_size)
+        ])
+
+
+def run_ingest(batches, batch_size=50, seed=42):
+    """Rows saved per second by one writer process per store, single-file and sharded
+
+    In the single-file layout the writers queue on one write lock; sharded,
+    each store has its own file and lock.
+    """
+    import multiprocessing
+
+    report = {'batches_per_store': batches, 'batch_size': batch_size, 'stores': list(STORES), 'layouts': {}}
+    for layout in ('single', 'sharded'):
+        data_dir = tempfile.mkdtemp(prefix='grocery_guru_ingest_')
+        db_path = os.path.join(data_dir, 'ingest.db')
+        DatabaseManager(db_path, sharded=layout == 'sharded' or None)
+        writers = [
+            multiprocessing.Process(target=_ingest_store, args=(db_path, store, batches, batch_size, seed + i))
+            for i, store in enumerate(STORES)
+        ]
+        start = time.perf_counter()
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        elapsed = time.perf_counter() - start
+        rows = len(STORES) * batches * batch_size
+        report['layouts'][layout] = {'seconds': round(elapsed, 3), 'rows_per_s': round(rows / elapsed)}
+        print(f"  {layout:<8} {rows} rows by {len(STORES)} writers in {elapsed:6.2f}s, {rows / elapsed:8.0f} rows/s")
+    layouts = report['layouts']
+    report['speedup'] = round(layouts['sharded']['rows_per_s'] / layouts['single']['rows_per_s'], 2)
+    print(f"  sharded ingests {report['speedup']}x as fast")
+    return report
+
+
+def run_bulk_import(rows, seed=42):
+    """Rows per second and peak memory importing a file of crowd-sourced market prices"""
+    from database.bulk_import import import_file
+
+    data_dir = tempfile.mkdtemp(prefix='grocery_guru_bulk_')
+    path = write_market_submissions(os.path.join(data_dir, 'submissions.csv'), rows, seed=seed)
+    db_manager = DatabaseManager(os.path.join(data_dir, 'bulk.db'))
+    summary = import_file(db_manager, path, os.path.join(data_dir, 'rejects.csv'))
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        summary['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        summary['peak_rss_mb'] = None  # Windows
+    print(
+        f"  {summary['rows']} rows in {summary['seconds']:.1f}s, {summary['rows_per_s']} rows/s, "
+        f"{summary['rejected']} rejected, peak RSS {summary['peak_rss_mb']} MB"
+    )
+    return summary
+
+
+def run_locator(queries, products=2000, basket_size=10, seed=42):
+    """Microseconds per nearest-store query, grid against a scan, and basket plans per second"""
+    from database.price_snapshot import PriceSnapshot, SnapshotMaintainer, snapshot_path
+    from database.store_locator import BasketPlanner, BranchIndex, load_branches
+
+    rng = random.Random(seed)
+    data_dir = tempfile.mkdtemp(prefix='grocery_guru_locator_')
+    db_manager = DatabaseManager(os.path.join(data_dir, 'locator.db'))
+    index = BranchIndex(load_branches(db_manager.db_path))
+    # Shoppers within 5 km of a branch, the way the population clusters
+    points = []
+    for _ in range(queries):
+        branch = rng.choice(index.branches)
+        points.append((branch.lat + rng.uniform(-0.045, 0.045), branch.lon + rng.uniform(-0.08, 0.08)))
+
+    def scan(lat, lon, k):
+        return sorted((index.distance(lat, lon, b.lat, b.lon), b) for b in index.branches)[:k]
+
+    report = {'branches': len(index), 'queries': queries, 'cell_km': index.cell_km, 'microseconds': {}}
+    for name, fn in (
+        ('nearest_5', lambda lat, lon: index.nearest(lat, lon, 5)),
+        ('nearest_1_per_chain', lambda lat, lon: index.nearest(lat, lon, 1, 'Lidl')),
+        ('within_3km', lambda lat, lon: index.within(lat, lon, 3.0)),
+        ('scan_5', lambda lat, lon: scan(lat, lon, 5))
+    ):
+        start = time.perf_counter()
+        for lat, lon in points:
+            fn(lat, lon)
+        report['microseconds'][name] = round((time.perf_counter() - start) / queries * 1e6, 1)
+        print(f"  {name:<22} {report['microseconds'][name]:8.1f} us/query")
+
+    names = [product_name(rng, serial) for serial in range(products)]
+    db_manager.add_products([
+        {'name': name, 'store': store, 'price': round(rng.uniform(0.3, 15.0), 2)}
+        for name in names for store in rng.sample(STORES, rng.randint(1, len(STORES)))
+    ])
+    SnapshotMaintainer(db_manager, snapshot_path(db_manager.db_path)).rebuild()
+    planner = BasketPlanner(index, PriceSnapshot(snapshot_path(db_manager.db_path)), cost_per_km=0.3)
+    baskets = [{name: rng.randint(1, 3) for name in rng.sample(names, basket_size)} for _ in range(200)]
+    report['plans_per_s'] = {}
+    for max_stops in (1, 2, 3):
+        plans = min(queries, 5000)
+        start = time.perf_counter()
+        for i in range(plans):
+            lat, lon = points[i]
+            planner.plan(lat, lon, baskets[i % len(baskets)], radius_km=3.0, max_stops=max_stops)
+        report['plans_per_s'][max_stops] = round(plans / (time.perf_counter() - start))
+        print(f"  {basket_size}-item basket within 3 km, up to {max_stops} stops: {report['plans_per_s'][max_stops]} plans/s")
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(scales, repeat, output, data_dir=None, seed=42):
+    rng = random.Random(seed)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'started_at': datetime.now().isoformat(),
+            'history_per_product': HISTORY_PER_PRODUCT
+        },
+        'results': []
+    }
+    data_dir = data_dir or tempfile.mkdtemp(prefix='grocery_guru_bench_')
+    for products in scales:
+        db_path = os.path.join(data_dir, f"bench_{products}.db")
+        if not os.path.exists(db_path):
+            print(f"Generating {products} products into {db_path}")
+            generate(
+                db_path,
+                products=products,
+                history_rows=products * HISTORY_PER_PRODUCT,
+                lists=max(10, products // 100),
+                seed=seed,
+                progress=lambda message: print(f"  {message}")
+            )
+        print(f"Scale {products} products")
+        # The write benchmarks change the data, so every run works on a fresh
+        # copy and a reused --data-dir always starts from the generated state
+        fd, run_path = tempfile.mkstemp(prefix=f"bench_{products}_run_", suffix='.db', dir=data_dir)
+        os.close(fd)
+        try:
+            shutil.copy(db_path, run_path)
+            report['results'].extend(run_scale(run_path, products, repeat, rng))
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(run_path + suffix):
+                    os.remove(run_path + suffix)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}")
+    return report
+
+
+def compare(baseline_path, current_path, threshold=1.25):
+    """Print median changes between two reports, returns the regressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['name'], r['scale']): r for r in json.load(f)['results']}
+    with open(current_path, encoding='utf-8') as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for result in current:
+        before = baseline.get((result['name'], result['scale']))
+        if not before or not before['median']:
+            continue
+        ratio = result['median'] / before['median']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        print(f"{result['name']:<40} {result['scale']:>9} {before['median'] * 1000:10.2f} -> {result['median'] * 1000:10.2f} ms  x{ratio:5.2f} {flag}")
+        if ratio > threshold:
+            regressions.append((result['name'], result['scale'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grocery Guru database benchmarks")
+    parser.add_argument('--scales', default='1000,10000,100000', help="comma separated product counts")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_report.json')
+    parser.add_argument('--data-dir', help="reuse generated databases from this directory")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+    parser.add_argument('--threshold', type=float, default=1.25, help="median slowdown ratio counted as a regression")
+    parser.add_argument('--records', type=int, metavar='COUNT', help="compare dict and ProductRecord scraper results instead")
+    parser.add_argument('--rimi-pages', type=int, metavar='COUNT', help="compare Rimi embedded-JSON and DOM extraction instead")
+    parser.add_argument('--store-pages', type=int, metavar='COUNT', help="time parsing COUNT pages of each store page kind instead")
+    parser.add_argument('--bulk-import', type=int, metavar='ROWS', help="time importing ROWS generated market price submissions instead")
+    parser.add_argument('--locator', type=int, metavar='QUERIES', help="time nearest-store queries and nearby basket plans instead")
+    parser.add_argument('--ingest', type=int, metavar='BATCHES', help="compare parallel per-store writers on single-file and sharded databases instead")
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    start_profiler('benchmark', args.profile, all_threads=True)
+
+    if args.rimi_pages:
+        report = run_rimi_extraction(args.rimi_pages)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    if args.store_pages:
+        run_store_extraction(args.store_pages, args.output, repeat=args.repeat)
+        return
+
+    if args.bulk_import:
+        report = run_bulk_import(args.bulk_import)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    if args.locator:
+        report = run_locator(args.locator)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    if args.ingest:
+        report = run_ingest(args.ingest)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    if args.records:
+        report = run_records(args.records)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+
+    if args.compare:
+        regressions = compare(*args.compare, threshold=args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+    scales = [int(scale) for scale in args.scales.split(',')]
+    run(scales, args.repeat, args.output, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,434 @@
+"""Bulk import of crowd-sourced local market prices
+
+Usage:
+    python bulk_import.py import --db grocery_guru.db submissions.csv --rejects rejects.csv
+    python bulk_import.py import --db grocery_guru.db liepaja.jsonl --markets markets.json
+    python bulk_import.py import --db grocery_guru.db new.csv --allow-new-markets
+
+Submissions are CSV (comma, semicolon or tab separated, with a header
+row) or JSON Lines, one observation per row:
+
+    name       product as written by the contributor, e.g. 'Kartupeļi'
+    price      '1.20', '1,20' or '€1.20'
+    unit       kg, g, l, ml, gab (pieces) or saišķis (bunch), or aliases
+               such as 'kilo' or 'pcs'; may be left out when the name ends
+               in a size ('Medus 500g')
+    quantity   of the unit the price is for, default 1
+    market     market name, e.g. 'Pētertirgus'
+    stall      optional, also used to find the market when that is empty
+    date       optional, '2024-05-18', '18.05.2024' or an ISO timestamp,
+               defaults to today
+
+Rows go through four stages, a batch at a time so memory stays flat:
+a streaming parse, validation of prices, units and dates with numpy over
+the whole batch, normalisation of market and stall names to a store
+name, and set-based upserts with DatabaseManager.import_prices. A
+product is saved as '<name> <quantity><unit>', like the store products,
+and the market is its store. Every rejected row is written to the
+reject report with its line number and the reason.
+
+Rows from markets that are not in MARKETS or a --markets file are
+rejected as 'unknown market': every market is a store, a misspelt one
+would become a new store, and the price snapshot and the sharded layout
+hold a bounded number of stores. --allow-new-markets accepts them under
+their own name.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from datetime import datetime, timedelta
+import numpy as np
+from utils.metrics import metrics, span
+from utils.profiler import add_profile_argument, start_profiler
+
+BATCH_SIZE = 20000
+
+ROWS_IMPORTED = metrics.counter(
+    'bulk_import_rows_total',
+    'Submitted market price rows by outcome',
+    ('outcome',)
+)
+
+# unit -> (canonical unit, how many base units one of it is)
+UNIT_ALIASES = {
+    'kg': ('kg', 1.0), 'kilo': ('kg', 1.0), 'kilogram': ('kg', 1.0), 'kilograms': ('kg', 1.0),
+    'g': ('g', 0.001), 'gr': ('g', 0.001), 'grams': ('g', 0.001),
+    'l': ('l', 1.0), 'litrs': ('l', 1.0), 'litri': ('l', 1.0), 'litre': ('l', 1.0), 'liter': ('l', 1.0),
+    'ml': ('ml', 0.001), 'gab': ('gab', 1.0), 'gab.': ('gab', 1.0), 'gb': ('gab', 1.0), 'pcs': ('gab', 1.0),
+    'pc': ('gab', 1.0), 'piece': ('gab', 1.0), 'saišķis': ('saišķis', 1.0), 'saiš.': ('saišķis', 1.0),
+    'bunch': ('saišķis', 1.0)
+}
+# Highest believable price per base unit (kg, l, piece, bunch), in euro
+MAX_UNIT_PRICE = {'kg': 150.0, 'g': 150.0, 'l': 100.0, 'ml': 100.0, 'gab': 100.0, 'saišķis': 20.0}
+MIN_PRICE = 0.01
+MAX_QUANTITY = 1000
+
+# Canonical market -> other ways contributors write it, including stalls
+MARKETS = {
+    'Liepājas Pētertirgus': ['Pētertirgus', 'Peter market', 'Liepājas tirgus', 'Liepaja market'],
+    'Liepājas Ezerkrasta tirgus': ['Ezerkrasta tirgus', 'Ezerkrasts'],
+    'Rīgas Centrāltirgus': ['Centrāltirgus', 'Riga Central Market', 'Rīgas tirgus'],
+    'Āgenskalna tirgus': ['Āgenskalns', 'Agenskalna market'],
+    'Kalnciema tirgus': ['Kalnciema kvartāls'],
+    'Ventspils tirgus': ['Ventspils market']
+}
+
+# Metric units and pieces are written against the number, like the stores' '500g' and '6gab'
+COMPACT_UNITS = ('kg', 'g', 'l', 'ml', 'gab')
+SIZE_SUFFIX = re.compile(r'(\d+(?:[.,]\d+)?)\s*(kg|g|l|ml|gab)$', re.IGNORECASE)
+CURRENCY = re.compile(r'\s|€|eur', re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
+def _fold(text):
+    """Key for matching names: lower case, no diacritics, single spaces"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def _clean(text):
+    return ' '.join(str(text).split()).strip(' "\'')
+
+
+# UNIT_ALIASES by folded alias, as units are read
+_UNITS = {_fold(alias): unit for alias, unit in UNIT_ALIASES.items()}
+
+
+class MarketNames:
+    """Maps market and stall names as contributors write them to one store name"""
+
+    def __init__(self, markets=None, known_only=True):
+        self.known_only = known_only
+        self.aliases = {}
+        for market, aliases in (markets or MARKETS).items():
+            for alias in [market] + list(aliases):
+                self.aliases[_fold(alias)] = market
+
+    @classmethod
+    def from_file(cls, path, known_only=True):
+        """Markets from a JSON file of {market: [aliases and stall names]}, added to the built-in ones"""
+        with open(path, encoding='utf-8') as f:
+            markets = {market: list(aliases) for market, aliases in MARKETS.items()}
+            for market, aliases in json.load(f).items():
+                markets.setdefault(market, []).extend(aliases)
+        return cls(markets, known_only)
+
+    def store(self, market, stall):
+        """Store name for a row, or None when the market is unknown and new ones are not accepted"""
+        for name in (market, stall):
+            if name:
+                found = self.aliases.get(_fold(name))
+                if found:
+                    return found
+        if self.known_only or not market:
+            return None
+        # A market not seen before keeps its own name, tidied so variants still meet
+        return market[:1].upper() + market[1:]
+
+
+def read_rows(path, file_format=None):
+    """Yield (line number, row dict or None, raw text) from a CSV or JSON Lines file
+
+    The row is None when the line cannot be parsed at all.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if file_format == 'jsonl':
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_number, None, line.rstrip('\n')
+                    continue
+                if isinstance(row, dict):
+                    # Lists or objects where a value belongs are kept as text, to be rejected
+                    row = {
+                        _fold(key): value if value is None or isinstance(value, (str, int, float)) else json.dumps(value)
+                        for key, value in row.items()
+                    }
+                else:
+                    row = None
+                yield line_number, row, line.rstrip('\n')
+            return
+        sample = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = [_fold(column) for column in next(reader, [])]
+        for values in reader:
+            if not values:
+                continue
+            # The reader's line_num is the last physical line of the row
+            yield reader.line_num, dict(zip(header, values)), dialect.delimiter.join(values)
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_price(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = CURRENCY.sub('', str(value or ''))
+    if ',' in text:
+        # '1,20' and '1.234,50' use a decimal comma
+        text = text.replace('.', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def _parse_quantity(value):
+    if value in (None, ''):
+        return 1.0
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+
+def _parse_date(value, today):
+    if value in (None, ''):
+        return today
+    text = str(value).strip()
+    try:
+        date = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        # Stored times are local and naive, like the scrapers'
+        return date.astimezone().replace(tzinfo=None) if date.tzinfo else date
+    except ValueError:
+        pass
+    for pattern in ('%d.%m.%Y', '%d.%m.%y'):
+        try:
+            return datetime.strptime(text, pattern)
+        except ValueError:
+            pass
+    return None
+
+
+def _each_distinct(values, parse):
+    """parse(value) for every value, parsing each distinct value once
+
+    Contributors repeat the same units, markets, dates and prices over
+    and over, so a batch has few distinct values per column.
+    """
+    parsed = {}
+    for value in values:
+        if value not in parsed:
+            parsed[value] = parse(value)
+    return [parsed[value] for value in values]
+
+
+def _name_and_size(value):
+    """Cleaned product name and the (unit, amount) of its size suffix, if any ('Medus 500g')"""
+    name = _clean(value) if value is not None else ''
+    match = SIZE_SUFFIX.search(name)
+    return name, (match.group(2).lower(), float(match.group(1).replace(',', '.'))) if match else None
+
+
+def _unit(value):
+    if value in (None, ''):
+        return None
+    return _UNITS.get(_fold(str(value)), (False, 0.0))
+
+
+def validate_batch(batch, markets, today=None):
+    """Split parsed rows into accepted observations and rejects
+
+    Returns (accepted, rejects): accepted is a list of (line number,
+    (name, store, price, recorded_at), raw text), rejects of (line number,
+    reason, detail, raw text). Columns are parsed once per distinct
+    value, and prices, quantities and their ranges are checked with numpy
+    over the whole batch.
+    """
+    today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    latest = today + timedelta(days=2)
+    rejects = []
+    rows = []
+    for line_number, row, raw in batch:
+        if row is None:
+            rejects.append((line_number, 'unreadable row', '', raw))
+        else:
+            rows.append((line_number, row, raw))
+    if not rows:
+        return [], rejects
+
+    def column(field):
+        return [row.get(field) for _, row, _ in rows]
+
+    names = _each_distinct(column('name'), _name_and_size)
+    prices = np.array(_each_distinct(column('price'), _parse_price), dtype=np.float64)
+    quantities = np.array(_each_distinct(column('quantity'), _parse_quantity), dtype=np.float64)
+    units = _each_distinct(column('unit'), _unit)
+    stores = _each_distinct(
+        list(zip(column('market'), column('stall'))),
+        lambda place: markets.store(_clean(place[0] or ''), _clean(place[1] or ''))
+    )
+    dates = _each_distinct(column('date'), lambda value: _parse_date(value, today))
+    recorded = _each_distinct(dates, lambda date: date.isoformat() if date else None)
+    for i, unit in enumerate(units):
+        if unit is None:
+            size = names[i][1]
+            if size:
+                # The price is for the size in the name, 500 g of honey
+                unit, scale = _UNITS[size[0]]
+                units[i] = (unit, scale * size[1])
+            else:
+                units[i] = ('', 0.0)
+
+    scales = np.array([scale for _, scale in units], dtype=np.float64)
+    limits = np.array([MAX_UNIT_PRICE.get(unit, 0.0) for unit, _ in units], dtype=np.float64) * scales * quantities
+    bad_price = ~np.isfinite(prices)
+    bad_quantity = ~np.isfinite(quantities) | (quantities <= 0) | (quantities > MAX_QUANTITY)
+    out_of_range = ~bad_price & ((prices < MIN_PRICE) | (prices > limits))
+    rounded = np.round(np.nan_to_num(prices), 2).tolist()
+
+    accepted = []
+    seen = {}
+    for i, (line_number, row, raw) in enumerate(rows):
+        name, size = names[i]
+        unit = units[i][0]
+        store = stores[i]
+        recorded_at = dates[i]
+        reason = detail = None
+        if not name:
+            reason = 'missing name'
+        elif unit is False:
+            reason, detail = 'unknown unit', row.get('unit')
+        elif unit == '':
+            reason = 'missing unit'
+        elif bad_price[i]:
+            reason, detail = 'price not a number', row.get('price')
+        elif bad_quantity[i]:
+            reason, detail = 'bad quantity', row.get('quantity')
+        elif out_of_range[i]:
+            reason, detail = 'price out of range', f"{prices[i]:g} for {quantities[i]:g} {unit}"
+        elif store is None:
+            reason, detail = 'unknown market', row.get('market') or row.get('stall')
+        elif recorded_at is None:
+            reason, detail = 'unreadable date', row.get('date')
+        elif recorded_at > latest:
+            reason, detail = 'date in the future', row.get('date')
+        if reason is not None:
+            rejects.append((line_number, reason, '' if detail is None else str(detail), raw))
+            continue
+
+        if not size:
+            quantity = f"{quantities[i]:g}"
+            name = f"{name} {quantity}{unit}" if unit in COMPACT_UNITS else f"{name} {quantity} {unit}"
+        observation = (name, store, rounded[i], recorded[i])
+        first = seen.setdefault(observation, line_number)
+        if first != line_number:
+            rejects.append((line_number, 'duplicate', f"of line {first}", raw))
+            continue
+        accepted.append((line_number, observation, raw))
+    return accepted, rejects
+
+
+class RejectReport:
+    """CSV of rejected rows (line, reason, detail, row), written as the import goes"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.reasons = Counter()
+        self._file = None
+        self._writer = None
+        if path:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'reason', 'detail', 'row'])
+
+    def add(self, line_number, reason, detail, raw):
+        self.reasons[reason] += 1
+        if self._writer:
+            self._writer.writerow([line_number, reason, detail, raw])
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def import_file(db_manager, path, rejects_path=None, markets=None, file_format=None, batch_size=BATCH_SIZE):
+    """Import a CSV or JSON Lines file of market prices, returns a summary"""
+    markets = markets or MarketNames()
+    started = time.perf_counter()
+    summary = {'rows': 0, 'imported': 0, 'rejected': 0, 'products_added': 0, 'products_updated': 0}
+    with RejectReport(rejects_path) as report, span('bulk_import', file=os.path.basename(path)):
+        for batch in _batched(read_rows(path, file_format), batch_size):
+            summary['rows'] += len(batch)
+            accepted, rejects = validate_batch(batch, markets)
+            result = db_manager.import_prices([observation for _, observation, _ in accepted])
+            for index in result['duplicates']:
+                line_number, _, raw = accepted[index]
+                rejects.append((line_number, 'already recorded', '', raw))
+            summary['imported'] += len(accepted) - len(result['duplicates'])
+            summary['products_added'] += result['products_added']
+            summary['products_updated'] += result['products_updated']
+            rejects.sort(key=lambda reject: reject[0])
+            for reject in rejects:
+                report.add(*reject)
+            summary['rejected'] += len(rejects)
+    ROWS_IMPORTED.inc(summary['imported'], outcome='imported')
+    ROWS_IMPORTED.inc(summary['rejected'], outcome='rejected')
+    summary['reject_reasons'] = dict(report.reasons.most_common())
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+    summary['rows_per_s'] = round(summary['rows'] / max(summary['seconds'], 1e-9))
+    logging.info(f"Imported {summary['imported']} of {summary['rows']} rows from {path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import of crowd-sourced market prices")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="import a CSV or JSON Lines file")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--db', default='grocery_guru.db')
+    import_parser.add_argument('--rejects', help="write rejected rows and reasons to this CSV file")
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'), help="defaults to the file extension")
+    import_parser.add_argument('--markets', help="JSON file of {market: [aliases and stall names]}")
+    import_parser.add_argument(
+        '--allow-new-markets', action='store_true', help="import markets not listed as new stores instead of rejecting them"
+    )
+    import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    start_profiler(f"bulk-{args.command}", args.profile)
+    from database.db_manager import DatabaseManager
+    if args.markets:
+        markets = MarketNames.from_file(args.markets, not args.allow_new_markets)
+    else:
+        markets = MarketNames(known_only=not args.allow_new_markets)
+    summary = import_file(DatabaseManager(args.db), args.path, args.rejects, markets, args.format, args.batch_size)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
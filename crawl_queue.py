@@ -0,0 +1,588 @@
+"""Lease-based crawl work queue shared by any number of worker processes
+
+Tasks are (store, kind, target) triples:
+    query   target is a search term, results come from search_product
+    url     target is a product page, name is the product to update
+    page    target is a listing page name, 'discounts' fetches promotions
+
+Workers claim a batch of tasks with a lease, extend it with heartbeats
+while they work and complete each task after its results are saved. A
+task whose lease runs out (its worker crashed or hung) is handed to the
+next worker that claims, until it has been attempted max_attempts times.
+
+The SQLite backend needs nothing but a shared file. RedisQueueBackend
+works with redis-py or any client with the same API, e.g. fakeredis.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from utils.metrics import metrics, span
+from scrapers.records import ProductRecord
+from scrapers.parse_pool import PageJob
+
+TASKS = metrics.counter('crawl_tasks_total', 'Crawl tasks finished by store, kind and outcome', ('store', 'kind', 'outcome'))
+TASK_SECONDS = metrics.histogram('crawl_task_seconds', 'Time to fetch and save one crawl task', ('store', 'kind'))
+RATE_LIMIT_WAIT_SECONDS = metrics.histogram('crawl_rate_limit_wait_seconds', 'Time spent waiting for a store rate limit slot', ('store',))
+
+KINDS = ('query', 'url', 'page')
+
+# Requests per second allowed against each store, across every worker
+DEFAULT_RATE_LIMITS = {'Rimi': 2.0, 'Maxima': 2.0, 'Lidl': 2.0}
+
+
+def make_task(store, kind, target, name=None):
+    if kind not in KINDS:
+        raise ValueError(f"unknown task kind {kind}")
+    return {'store': store, 'kind': kind, 'target': target, 'name': name}
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class SQLiteQueueBackend:
+    """Crawl tasks in an SQLite table, safe for processes sharing the file"""
+
+    def __init__(self, db_path='grocery_guru.db', busy_timeout=30.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    store TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    name TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at TIMESTAMP,
+                    UNIQUE (store, kind, target)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_crawl_tasks_status ON crawl_tasks (status, store, lease_expires)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_rate_limits (
+                    store TEXT PRIMARY KEY,
+                    next_slot REAL NOT NULL
+                )
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _run(self, fn):
+        conn = self._transaction()
+        try:
+            result = fn(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def enqueue(self, tasks) -> int:
+        """Add tasks, finished ones with the same (store, kind, target) are queued again"""
+        now = datetime.now().isoformat()
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT INTO crawl_tasks (store, kind, target, name, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (store, kind, target) DO UPDATE
+                SET status = 'pending', attempts = 0, last_error = NULL, updated_at = excluded.updated_at
+                WHERE status IN ('done', 'failed')
+            ''', [(t['store'], t['kind'], t['target'], t.get('name'), now) for t in tasks])
+            return conn.total_changes - before
+        return self._run(insert)
+
+    def claim(self, worker_id, limit, lease_seconds, stores=None, max_attempts=3) -> list:
+        """Lease up to limit pending or expired tasks to worker_id"""
+        now = time.time()
+        store_filter = ''
+        params = [now, max_attempts]
+        if stores:
+            store_filter = f"AND store IN ({','.join('?' * len(stores))})"
+            params.extend(stores)
+        params.append(limit)
+
+        def lease(conn):
+            # Expired leases past their last attempt are given up on
+            conn.execute('''
+                UPDATE crawl_tasks SET status = 'failed', lease_owner = NULL, last_error = 'lease expired'
+                WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?
+            ''', (now, max_attempts))
+            rows = conn.execute(f'''
+                SELECT id, store, kind, target, name, attempts FROM crawl_tasks
+                WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                AND attempts < ? {store_filter}
+                ORDER BY id LIMIT ?
+            ''', params).fetchall()
+            conn.executemany('''
+                UPDATE crawl_tasks
+                SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            ''', [(worker_id, now + lease_seconds, row[0]) for row in rows])
+            return [
+                {'id': id, 'store': store, 'kind': kind, 'target': target, 'name': name, 'attempts': attempts + 1}
+                for id, store, kind, target, name, attempts in rows
+            ]
+        return self._run(lease)
+
+    def heartbeat(self, worker_id, task_ids, lease_seconds) -> list:
+        """Extend leases still held by worker_id, returns the ids it still owns"""
+        expires = time.time() + lease_seconds
+
+        def extend(conn):
+            owned = []
+            for task_id in task_ids:
+                cursor = conn.execute('''
+                    UPDATE crawl_tasks SET lease_expires = ?
+                    WHERE id = ? AND status = 'leased' AND lease_owner = ?
+                ''', (expires, task_id, worker_id))
+                if cursor.rowcount:
+                    owned.append(task_id)
+            return owned
+        return self._run(extend)
+
+    def complete(self, worker_id, task_id) -> bool:
+        return self._finish(worker_id, task_id, 'done', None)
+
+    def fail(self, worker_id, task_id, error, max_attempts=3) -> bool:
+        """Give the task back for a retry, or mark it failed after max_attempts"""
+        def release(conn):
+            cursor = conn.execute('''
+                UPDATE crawl_tasks
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            ''', (max_attempts, error, datetime.now().isoformat(), task_id, worker_id))
+            return cursor.rowcount > 0
+        return self._run(release)
+
+    def _finish(self, worker_id, task_id, status, error):
+        def finish(conn):
+            cursor = conn.execute('''
+                UPDATE crawl_tasks
+                SET status = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            ''', (status, error, datetime.now().isoformat(), task_id, worker_id))
+            return cursor.rowcount > 0
+        return self._run(finish)
+
+    def reserve_slot(self, store, interval) -> float:
+        """Reserve the next request slot for store, returns the time it starts"""
+        def reserve(conn):
+            row = conn.execute('SELECT next_slot FROM crawl_rate_limits WHERE store = ?', (store,)).fetchone()
+            slot = max(time.time(), row[0] if row else 0.0)
+            conn.execute('''
+                INSERT INTO crawl_rate_limits (store, next_slot) VALUES (?, ?)
+                ON CONFLICT (store) DO UPDATE SET next_slot = excluded.next_slot
+            ''', (store, slot + interval))
+            return slot
+        return self._run(reserve)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT store,
+                       CASE WHEN status = 'leased' AND lease_expires < ? THEN 'expired' ELSE status END,
+                       COUNT(*)
+                FROM crawl_tasks GROUP BY 1, 2
+            ''', (now,)).fetchall()
+        stats = {}
+        for store, status, count in rows:
+            stats.setdefault(store, {})[status] = count
+        return stats
+
+
+class RedisQueueBackend:
+    """Crawl tasks in Redis for workers that do not share a filesystem
+
+    Each task is a hash, pending task ids sit in one sorted set per store
+    and leased ids in a sorted set scored by lease expiry. Every state
+    change hinges on a single ZREM/ZPOPMIN succeeding, so two workers
+    never hold the same lease.
+    """
+
+    def __init__(self, client=None, url='redis://localhost:6379/0', prefix='grocery_guru:crawl'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("redis is required for the Redis crawl queue, install it with pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(part) for part in parts))
+
+    @staticmethod
+    def _text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def _task(self, task_id):
+        fields = {self._text(k): self._text(v) for k, v in self.client.hgetall(self._key('task', task_id)).items()}
+        if not fields:
+            return None
+        return {
+            'id': int(task_id), 'store': fields['store'], 'kind': fields['kind'], 'target': fields['target'],
+            'name': fields.get('name') or None, 'attempts': int(fields.get('attempts', 0))
+        }
+
+    def enqueue(self, tasks) -> int:
+        added = 0
+        for task in tasks:
+            identity = json.dumps([task['store'], task['kind'], task['target']], ensure_ascii=False)
+            task_id = self.client.hget(self._key('ids'), identity)
+            if task_id is None:
+                task_id = self.client.incr(self._key('next_id'))
+                if not self.client.hsetnx(self._key('ids'), identity, task_id):
+                    continue  # another process queued it first
+            else:
+                task_id = int(task_id)
+                if self._text(self.client.hget(self._key('task', task_id), 'status')) not in ('done', 'failed'):
+                    continue
+            self.client.hset(self._key('task', task_id), mapping={
+                'store': task['store'], 'kind': task['kind'], 'target': task['target'],
+                'name': task.get('name') or '', 'status': 'pending', 'attempts': 0,
+                'lease_owner': '', 'last_error': ''
+            })
+            self.client.sadd(self._key('stores'), task['store'])
+            self.client.zadd(self._key('pending', task['store']), {task_id: task_id})
+            added += 1
+        return added
+
+    def _requeue_expired(self, max_attempts):
+        now = time.time()
+        for task_id in self.client.zrangebyscore(self._key('leased'), '-inf', now):
+            # Only the process whose ZREM succeeds moves the task
+            if not self.client.zrem(self._key('leased'), task_id):
+                continue
+            task = self._task(self._text(task_id))
+            if task is None:
+                continue
+            if task['attempts'] >= max_attempts:
+                self.client.hset(self._key('task', task['id']), mapping={'status': 'failed', 'last_error': 'lease expired'})
+            else:
+                self.client.hset(self._key('task', task['id']), mapping={'status': 'pending', 'lease_owner': ''})
+                self.client.zadd(self._key('pending', task['store']), {task['id']: task['id']})
+
+    def claim(self, worker_id, limit, lease_seconds, stores=None, max_attempts=3) -> list:
+        self._requeue_expired(max_attempts)
+        stores = stores or sorted(self._text(s) for s in self.client.smembers(self._key('stores')))
+        claimed = []
+        for store in stores:
+            while len(claimed) < limit:
+                popped = self.client.zpopmin(self._key('pending', store))
+                if not popped:
+                    break
+                task_id = int(self._text(popped[0][0]))
+                key = self._key('task', task_id)
+                self.client.hset(key, mapping={'status': 'leased', 'lease_owner': worker_id})
+                attempts = self.client.hincrby(key, 'attempts', 1)
+                self.client.zadd(self._key('leased'), {task_id: time.time() + lease_seconds})
+                task = self._task(task_id)
+                task['attempts'] = attempts
+                claimed.append(task)
+        return claimed
+
+    def _owns(self, worker_id, task_id):
+        key = self._key('task', task_id)
+        return (self._text(self.client.hget(key, 'status')) == 'leased'
+                and self._text(self.client.hget(key, 'lease_owner')) == worker_id)
+
+    def heartbeat(self, worker_id, task_ids, lease_seconds) -> list:
+        expires = time.time() + lease_seconds
+        owned = []
+        for task_id in task_ids:
+            # xx: only extend leases that have not been taken back
+            if self._owns(worker_id, task_id) and self.client.zadd(self._key('leased'), {task_id: expires}, xx=True, ch=True):
+                owned.append(task_id)
+        return owned
+
+    def complete(self, worker_id, task_id) -> bool:
+        if not self._owns(worker_id, task_id) or not self.client.zrem(self._key('leased'), task_id):
+            return False
+        self.client.hset(self._key('task', task_id), mapping={'status': 'done', 'lease_owner': '', 'last_error': ''})
+        return True
+
+    def fail(self, worker_id, task_id, error, max_attempts=3) -> bool:
+        if not self._owns(worker_id, task_id) or not self.client.zrem(self._key('leased'), task_id):
+            return False
+        task = self._task(task_id)
+        if task['attempts'] >= max_attempts:
+            self.client.hset(self._key('task', task_id), mapping={'status': 'failed', 'lease_owner': '', 'last_error': error})
+        else:
+            self.client.hset(self._key('task', task_id), mapping={'status': 'pending', 'lease_owner': '', 'last_error': error})
+            self.client.zadd(self._key('pending', task['store']), {task_id: task_id})
+        return True
+
+    def reserve_slot(self, store, interval) -> float:
+        key = self._key('rate', store)
+
+        def reserve(pipe):
+            current = pipe.get(key)
+            slot = max(time.time(), float(current) if current is not None else 0.0)
+            pipe.multi()
+            pipe.set(key, repr(slot + interval))
+            return slot
+        # WATCH/MULTI retries if another worker moved the slot meanwhile
+        return self.client.transaction(reserve, key, value_from_callable=True)
+
+    def stats(self) -> dict:
+        stats = {}
+        for store in sorted(self._text(s) for s in self.client.smembers(self._key('stores'))):
+            stats[store] = {'pending': self.client.zcard(self._key('pending', store))}
+        stats['leased'] = self.client.zcard(self._key('leased'))
+        return stats
+
+
+class CrawlQueue:
+    """Queue front end with lease and retry settings shared by all workers"""
+
+    def __init__(self, backend, lease_seconds=60.0, max_attempts=3):
+        self.backend = backend
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def enqueue(self, tasks) -> int:
+        return self.backend.enqueue(list(tasks))
+
+    def claim(self, worker_id, limit=10, stores=None) -> list:
+        return self.backend.claim(worker_id, limit, self.lease_seconds, stores, self.max_attempts)
+
+    def heartbeat(self, worker_id, task_ids) -> list:
+        return self.backend.heartbeat(worker_id, list(task_ids), self.lease_seconds)
+
+    def complete(self, worker_id, task_id) -> bool:
+        return self.backend.complete(worker_id, task_id)
+
+    def fail(self, worker_id, task_id, error) -> bool:
+        return self.backend.fail(worker_id, task_id, error, self.max_attempts)
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+class RateLimiter:
+    """Per-store request spacing shared through the queue backend"""
+
+    def __init__(self, backend, rate_limits=None):
+        self.backend = backend
+        self.intervals = {
+            store: 1.0 / rate for store, rate in (rate_limits or DEFAULT_RATE_LIMITS).items() if rate
+        }
+
+    def wait(self, store):
+        interval = self.intervals.get(store)
+        if not interval:
+            return
+        start = time.time()
+        slot = self.backend.reserve_slot(store, interval)
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        RATE_LIMIT_WAIT_SECONDS.observe(time.time() - start, store=store)
+
+
+class CrawlWorker:
+    """Claims batches of tasks, scrapes them and saves results through DatabaseManager"""
+
+    # Crawl task kinds and the scraper page kind each one fetches
+    PAGE_KINDS = {'query': 'search', 'url': 'product', 'page': 'promotions'}
+
+    def __init__(self, queue, db_manager, scrapers, worker_id=None, batch_size=10,
+                 rate_limits=None, stores=None, idle_sleep=1.0, pipeline=None):
+        """pipeline, a ParsePipeline, fetches a whole batch concurrently and parses it
+        in worker processes. Without one tasks run one at a time on this thread.
+        """
+        self.queue = queue
+        self.pipeline = pipeline
+        self.db_manager = db_manager
+        self.scrapers = scrapers
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(queue.backend, rate_limits)
+        self.stores = stores or list(scrapers)
+        self.idle_sleep = idle_sleep
+        self._held = set()
+        self._held_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.processed = 0
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, max_tasks=None, exit_when_idle=False):
+        """Work until stopped, max_tasks are done, or (exit_when_idle) the queue is empty"""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True, name=f"heartbeat-{self.worker_id}")
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                if max_tasks is not None and self.processed >= max_tasks:
+                    break
+                limit = self.batch_size if max_tasks is None else min(self.batch_size, max_tasks - self.processed)
+                tasks = self.queue.claim(self.worker_id, limit, self.stores)
+                if not tasks:
+                    if exit_when_idle:
+                        break
+                    self._stop.wait(self.idle_sleep)
+                    continue
+                with self._held_lock:
+                    self._held.update(task['id'] for task in tasks)
+                if self.pipeline is not None:
+                    self.process_batch(tasks)
+                else:
+                    for task in tasks:
+                        if self._stop.is_set():
+                            break
+                        self.process(task)
+                # Anything left over (stopped mid batch) goes back to the queue
+                with self._held_lock:
+                    leftover, self._held = list(self._held), set()
+                for task_id in leftover:
+                    self.queue.fail(self.worker_id, task_id, 'worker stopped')
+        finally:
+            self._stop.set()
+            heartbeat.join()
+        return self.processed
+
+    def _heartbeat_loop(self):
+        interval = self.queue.lease_seconds / 3
+        while not self._stop.wait(interval):
+            with self._held_lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                owned = set(self.queue.heartbeat(self.worker_id, held))
+            except Exception as e:
+                logging.error(f"Crawl heartbeat failed: {str(e)}")
+                continue
+            with self._held_lock:
+                # Tasks finished since the heartbeat started are not lost
+                lost = (set(held) - owned) & self._held
+                self._held -= lost
+            if lost:
+                logging.warning(f"Worker {self.worker_id} lost leases on tasks {sorted(lost)}")
+
+    def process(self, task):
+        store, kind = task['store'], task['kind']
+        start = time.perf_counter()
+        with self._held_lock:
+            if task['id'] not in self._held:
+                return  # lease lost while waiting in the batch
+        try:
+            self.rate_limiter.wait(store)
+            with span('crawl.task', store=store, kind=kind, target=task['target']):
+                self._save(task, self.fetch(task))
+            outcome = 'done' if self.queue.complete(self.worker_id, task['id']) else 'lease_lost'
+        except Exception as e:
+            outcome = self._fail(task, e)
+        self._finish(task, outcome, start)
+
+    def process_batch(self, tasks):
+        """Fetch a batch concurrently, parse it in the pipeline's processes, save as pages finish"""
+        start = time.perf_counter()
+        jobs = []
+        for task in tasks:
+            try:
+                page_kind, target = self._page(task)
+            except ValueError as e:
+                self._finish(task, self._fail(task, e), start)
+                continue
+            jobs.append(PageJob(task['store'], page_kind, target, task))
+
+        def before_fetch(job):
+            with self._held_lock:
+                if job.tag['id'] not in self._held:
+                    raise RuntimeError("lease lost before fetch")
+            self.rate_limiter.wait(job.store)
+
+        results = self.pipeline.run(jobs, before_fetch=before_fetch)
+        try:
+            for job, parsed, error in results:
+                task = job.tag
+                with self._held_lock:
+                    if task['id'] not in self._held:
+                        continue  # lease lost while the page was in the pipeline
+                try:
+                    if error is not None:
+                        raise error
+                    with span('crawl.save', store=task['store'], kind=task['kind'], target=task['target']):
+                        self._save(task, self._to_products(task, parsed))
+                    outcome = 'done' if self.queue.complete(self.worker_id, task['id']) else 'lease_lost'
+                except Exception as e:
+                    outcome = self._fail(task, e)
+                self._finish(task, outcome, start)
+                if self._stop.is_set():
+                    break
+        finally:
+            results.close()
+
+    def _save(self, task, products):
+        if products and not self.db_manager.add_products(products):
+            raise RuntimeError("saving results failed")
+
+    def _fail(self, task, error):
+        logging.error(f"Crawl task {task['id']} ({task['store']} {task['kind']} {task['target']}) failed: {str(error)}")
+        self.queue.fail(self.worker_id, task['id'], str(error))
+        return 'error'
+
+    def _finish(self, task, outcome, start):
+        with self._held_lock:
+            self._held.discard(task['id'])
+        self.processed += 1
+        TASKS.inc(store=task['store'], kind=task['kind'], outcome=outcome)
+        TASK_SECONDS.observe(time.perf_counter() - start, store=task['store'], kind=task['kind'])
+
+    def _page(self, task) -> tuple:
+        """(scraper page kind, target) a task fetches"""
+        page_kind = self.PAGE_KINDS.get(task['kind'])
+        if page_kind is None or (task['kind'] == 'page' and task['target'] != 'discounts'):
+            raise ValueError(f"unsupported task {task['kind']} {task['target']}")
+        return page_kind, task['target'] if page_kind != 'promotions' else None
+
+    def fetch(self, task) -> list:
+        """Fetch and parse a task's page, returns products to save
+
+        Request and parse errors propagate, so the task is retried like
+        one that failed in the pipeline.
+        """
+        scraper = self.scrapers[task['store']]
+        page_kind, target = self._page(task)
+        return self._to_products(task, scraper.parse_page(page_kind, scraper.fetch(page_kind, target)))
+
+    def _to_products(self, task, parsed) -> list:
+        """Turn a task's parsed page into the products to save"""
+        if task['kind'] == 'url':
+            parsed = list(parsed)
+            if not parsed:
+                raise ValueError("no price found on product page")
+            return [{'name': task['name'], 'store': task['store'], 'price': parsed[0], 'url': task['target']}]
+        if task['kind'] == 'page':
+            return [
+                ProductRecord(item.name, item.store, item.discount_cents, item.url, item.image_url)
+                for item in parsed
+            ]
+        return list(parsed)
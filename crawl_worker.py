@@ -0,0 +1,206 @@
+"""Run crawl workers against the shared crawl queue
+
+Usage:
+    python crawl_worker.py enqueue --queries piens,maize,olas
+    python crawl_worker.py enqueue --known-products --discounts
+    python crawl_worker.py work --processes 4
+    python crawl_worker.py --sharded work --processes 4
+    python crawl_worker.py --parse-processes 4 --fetch-threads 16 --batch-size 50 work
+    python crawl_worker.py stats
+    python crawl_worker.py bench --workers 1,2,4,8 --tasks 200
+
+Workers on other hosts point at the same queue with --redis-url, or at
+the same SQLite file on a shared disk with --db.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from database.crawl_queue import CrawlQueue, CrawlWorker, SQLiteQueueBackend, RedisQueueBackend, make_task
+from database.db_manager import DatabaseManager
+from database.price_snapshot import SnapshotMaintainer, snapshot_path
+from scrapers.parse_pool import ParsePipeline
+from utils.profiler import add_profile_argument, start_profiler
+from api_server import default_scrapers
+
+
+def open_queue(args):
+    if args.redis_url:
+        backend = RedisQueueBackend(url=args.redis_url)
+    else:
+        backend = SQLiteQueueBackend(args.queue_db or args.db)
+    return CrawlQueue(backend, lease_seconds=args.lease, max_attempts=args.max_attempts)
+
+
+def parse_rate_limits(text):
+    """'Rimi=2,Lidl=5' -> {'Rimi': 2.0, 'Lidl': 5.0}"""
+    if not text:
+        return None
+    limits = {}
+    for part in text.split(','):
+        store, rate = part.split('=')
+        limits[store.strip()] = float(rate)
+    return limits
+
+
+def enqueue(args):
+    queue = open_queue(args)
+    stores = args.stores.split(',') if args.stores else list(default_scrapers())
+    tasks = []
+    queries = [q.strip() for q in (args.queries or '').split(',') if q.strip()]
+    if args.queries_file:
+        with open(args.queries_file, encoding='utf-8') as f:
+            queries.extend(line.strip() for line in f if line.strip())
+    tasks.extend(make_task(store, 'query', query) for store in stores for query in queries)
+    if args.known_products:
+        for product in DatabaseManager(args.db).get_product_urls():
+            if product['store'] in stores:
+                tasks.append(make_task(product['store'], 'url', product['url'], product['name']))
+    if args.discounts:
+        tasks.extend(make_task(store, 'page', 'discounts') for store in stores)
+    print(f"Queued {queue.enqueue(tasks)} of {len(tasks)} tasks")
+
+
+def _worker_process(args, exit_when_idle=False, max_tasks=None, scraper_base_url=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(message)s')
+    # Follows the parent's --profile decision through GROCERY_GURU_PROFILE
+    start_profiler('crawl-worker')
+    scrapers = default_scrapers()
+    if scraper_base_url:
+        from api_loadtest import point_scrapers_at
+        point_scrapers_at(scrapers, scraper_base_url)
+    pipeline = None
+    if args.parse_processes is not None:
+        pipeline = ParsePipeline(scrapers, fetch_workers=args.fetch_threads, parse_workers=args.parse_processes)
+    db_manager = DatabaseManager(args.db, sharded=args.sharded or None)
+    # Keep the memory-mapped latest-price file in step with what this worker saves
+    snapshot = SnapshotMaintainer(db_manager, snapshot_path(args.db), delay=5.0)
+    worker = CrawlWorker(
+        open_queue(args),
+        db_manager,
+        scrapers,
+        batch_size=args.batch_size,
+        rate_limits=parse_rate_limits(args.rate_limits),
+        stores=args.stores.split(',') if args.stores else None,
+        pipeline=pipeline
+    )
+    try:
+        return worker.run(max_tasks=max_tasks, exit_when_idle=exit_when_idle)
+    except KeyboardInterrupt:
+        worker.stop()
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        snapshot.flush()
+
+
+def work(args):
+    if args.sharded:
+        # Migrate once here rather than in every worker
+        DatabaseManager(args.db, sharded=True)
+    if args.processes == 1:
+        _worker_process(args, args.exit_when_idle)
+        return
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(args, args.exit_when_idle), name=f"crawl-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+def stats(args):
+    print(json.dumps(open_queue(args).stats(), indent=2))
+
+
+def bench(args):
+    """Time a fixed batch of query tasks at several worker counts against a stand-in store"""
+    from api_loadtest import StandInStore
+    store = StandInStore(latency=args.store_latency, rimi_embedded=not args.dom_pages).start()
+    results = []
+    try:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            data_dir = tempfile.mkdtemp(prefix='grocery_guru_crawl_')
+            run_args = argparse.Namespace(**vars(args))
+            run_args.db = os.path.join(data_dir, 'crawl.db')
+            run_args.queue_db = None
+            queue = open_queue(run_args)
+            stores = list(default_scrapers())
+            queue.enqueue(make_task(stores[i % len(stores)], 'query', f"prece {i}") for i in range(args.tasks))
+            if args.sharded:
+                DatabaseManager(run_args.db, sharded=True)
+
+            started = time.perf_counter()
+            processes = [
+                multiprocessing.Process(target=_worker_process, args=(run_args, True, None, store.url))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - started
+            done = sum(counts.get('done', 0) for counts in queue.stats().values())
+            results.append({'workers': workers, 'tasks': done, 'seconds': round(elapsed, 2), 'tasks_per_s': round(done / elapsed, 1)})
+            print(json.dumps(results[-1]))
+    finally:
+        store.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grocery Guru crawl queue workers")
+    parser.add_argument('--db', default='grocery_guru.db', help="database results are saved to")
+    parser.add_argument('--queue-db', help="SQLite file holding the queue, defaults to --db")
+    parser.add_argument('--redis-url', help="use a Redis queue instead of SQLite")
+    parser.add_argument('--lease', type=float, default=60.0, help="lease length in seconds")
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--stores', help="comma separated stores to work on")
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--rate-limits', help="requests per second per store, e.g. Rimi=2,Lidl=5")
+    parser.add_argument('--parse-processes', type=int,
+                        help="fetch each batch on threads and parse it in this many processes, 0 parses on the fetch threads")
+    parser.add_argument('--fetch-threads', type=int, default=8, help="download threads per worker with --parse-processes")
+    parser.add_argument('--sharded', action='store_true',
+                        help="store each store's products in its own file so workers write in parallel, migrating --db if needed")
+    add_profile_argument(parser)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help="add crawl tasks")
+    enqueue_parser.add_argument('--queries', help="comma separated search terms")
+    enqueue_parser.add_argument('--queries-file', help="file with one search term per line")
+    enqueue_parser.add_argument('--known-products', action='store_true', help="refresh every product page in the database")
+    enqueue_parser.add_argument('--discounts', action='store_true', help="fetch each store's promotions")
+    enqueue_parser.set_defaults(func=enqueue)
+
+    work_parser = commands.add_parser('work', help="claim and run tasks")
+    work_parser.add_argument('--processes', type=int, default=1)
+    work_parser.add_argument('--exit-when-idle', action='store_true')
+    work_parser.set_defaults(func=work)
+
+    stats_parser = commands.add_parser('stats', help="task counts per store and status")
+    stats_parser.set_defaults(func=stats)
+
+    bench_parser = commands.add_parser('bench', help="measure throughput against a local stand-in store")
+    bench_parser.add_argument('--workers', default='1,2,4,8')
+    bench_parser.add_argument('--tasks', type=int, default=200)
+    bench_parser.add_argument('--store-latency', type=float, default=0.1)
+    bench_parser.add_argument('--dom-pages', action='store_true', help="serve Rimi pages without embedded JSON, so parsing is CPU heavy")
+    bench_parser.set_defaults(func=bench)
+
+    args = parser.parse_args()
+    start_profiler('crawl', args.profile)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
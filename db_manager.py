@@ -1,30 +1,75 @@
 import sqlite3
 import logging
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from utils.metrics import metrics, instrumented
+from .sharding import connect, ensure_shard, is_sharded, migrate_to_shards, shard_paths
+
+ROWS_WRITTEN = metrics.counter(
+    'db_rows_written_total',
+    'Rows inserted or updated in the database',
+    ('table',)
+)
+LOCK_WAIT_SECONDS = metrics.histogram(
+    'db_lock_wait_seconds',
+    'Time spent waiting for the SQLite write lock',
+    ('method',)
+)
+
+
+timed_query = instrumented('db_query_seconds', 'Latency of DatabaseManager methods', 'db')
+
 
 class DatabaseManager:
-    def __init__(self, db_path='grocery_guru.db'):
+    """All reads and writes of the Grocery Guru database
+
+    With sharded=True products and price history are kept in one file per
+    store (see sharding.py) and a single-file database is migrated; with
+    the default None the layout already on disk is used. The API is the
+    same in both layouts.
+    """
+    
+    def __init__(self, db_path='grocery_guru.db', sharded=None):
         self.db_path = db_path
+        self.upsert_listeners = []
+        if sharded and not is_sharded(db_path):
+            self.sharded = False
+            self.setup_database()
+            summary = migrate_to_shards(db_path)
+            logging.info(f"Moved {db_path} into per-store shards: {summary['stores']}")
+        self.sharded = is_sharded(db_path)
+        # store -> shard path, filled in as stores are written
+        self._shards = shard_paths(db_path) if self.sharded else {}
         self.setup_database()
         
+    def _connect(self):
+        """Connection for reads, products and price_history span every store's shard"""
+        if self.sharded:
+            return connect(self.db_path)
+        return sqlite3.connect(self.db_path)
+        
+    def _query_shards(self, sql, params=()):
+        """Rows of sql run on each store's shard, for queries that stay within one store"""
+        rows = []
+        # Re-read the registry, other processes may have added stores
+        for path in shard_paths(self.db_path).values():
+            with sqlite3.connect(path) as conn:
+                rows.extend(conn.execute(sql, params).fetchall())
+        return rows
+        
+    def _shard_path(self, store):
+        path = self._shards.get(store)
+        if path is None:
+            path = self._shards[store] = ensure_shard(self.db_path, store)
+        return path
+        
     def setup_database(self):
         """Create necessary tables if they don't exist"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # Products table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS products (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        store TEXT NOT NULL,
-                        price REAL NOT NULL,
-                        url TEXT,
-                        last_updated TIMESTAMP
-                    )
-                ''')
-                
                 # Shopping lists table
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS shopping_lists (
@@ -46,75 +91,268 @@ class DatabaseManager:
                     )
                 ''')
                 
-                # Price history table
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS price_history (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        product_id INTEGER,
-                        price REAL NOT NULL,
-                        recorded_at TIMESTAMP,
-                        FOREIGN KEY (product_id) REFERENCES products (id)
-                    )
-                ''')
+                # Products and price history live in the store shards in the sharded layout
+                if not self.sharded:
+                    # Products table
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS products (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            name TEXT NOT NULL,
+                            store TEXT NOT NULL,
+                            price REAL NOT NULL,
+                            url TEXT,
+                            last_updated TIMESTAMP
+                        )
+                    ''')
+                    
+                    # Price history table
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS price_history (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            product_id INTEGER,
+                            price REAL NOT NULL,
+                            recorded_at TIMESTAMP,
+                            FOREIGN KEY (product_id) REFERENCES products (id)
+                        )
+                    ''')
+                    
+                    # Product photos, added after the first release
+                    columns = {row[1] for row in cursor.execute('PRAGMA table_info(products)')}
+                    if 'image_url' not in columns:
+                        cursor.execute('ALTER TABLE products ADD COLUMN image_url TEXT')
+                    
+                    # Upserts and snapshot imports look products up by name and store
+                    cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS idx_products_name_store
+                        ON products (name, store)
+                    ''')
+                    
+                    # Product history pages and bulk imports' duplicate checks
+                    cursor.execute('''
+                        CREATE INDEX IF NOT EXISTS idx_price_history_product_time
+                        ON price_history (product_id, recorded_at)
+                    ''')
                 
                 conn.commit()
         except Exception as e:
             logging.error(f"Error setting up database: {str(e)}")
             
-    def add_product(self, name: str, store: str, price: float, url: str = None):
+    @contextmanager
+    def _write_connection(self, method: str, store: str = None):
+        """Open a connection holding the write lock, recording how long it took to get
+        
+        In the sharded layout, writes for a store lock only that store's shard.
+        """
+        conn = sqlite3.connect(self._shard_path(store) if self.sharded and store else self.db_path)
+        try:
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, method=method)
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            
+    @timed_query
+    def add_product(self, name: str, store: str, price: float, url: str = None, image_url: str = None):
         """Add or update a product in the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+            with self._write_connection('add_product', store) as conn:
+                product_id = self._upsert_product(
+                    conn.cursor(), name, store, price, url, datetime.now().isoformat(), image_url
+                )
                 
-                # Check if product exists
-                cursor.execute('''
-                    SELECT id, price FROM products 
-                    WHERE name = ? AND store = ?
-                ''', (name, store))
-                
-                result = cursor.fetchone()
-                current_time = datetime.now().isoformat()
-                
-                if result:
-                    product_id, old_price = result
-                    # Update existing product
-                    cursor.execute('''
-                        UPDATE products 
-                        SET price = ?, last_updated = ? 
-                        WHERE id = ?
-                    ''', (price, current_time, product_id))
-                    
-                    # Add to price history if price changed
-                    if old_price != price:
-                        cursor.execute('''
-                            INSERT INTO price_history (product_id, price, recorded_at)
-                            VALUES (?, ?, ?)
-                        ''', (product_id, price, current_time))
-                else:
-                    # Insert new product
-                    cursor.execute('''
-                        INSERT INTO products (name, store, price, url, last_updated)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (name, store, price, url, current_time))
-                    
-                    product_id = cursor.lastrowid
-                    # Add first price history entry
-                    cursor.execute('''
-                        INSERT INTO price_history (product_id, price, recorded_at)
-                        VALUES (?, ?, ?)
-                    ''', (product_id, price, current_time))
-                
-                conn.commit()
-                return product_id
+            self._notify_upsert(name, store, price)
+            return product_id
         except Exception as e:
             logging.error(f"Error adding/updating product: {str(e)}")
             return None
             
+    @timed_query
+    def add_products(self, products: list) -> int:
+        """Add or update many products (dicts or ProductRecords), one transaction per store shard"""
+        try:
+            # A single file is one shard for every store
+            by_store = {}
+            for product in products:
+                by_store.setdefault(product['store'] if self.sharded else None, []).append(product)
+            current_time = datetime.now().isoformat()
+            for store, store_products in by_store.items():
+                with self._write_connection('add_products', store) as conn:
+                    cursor = conn.cursor()
+                    for product in store_products:
+                        self._upsert_product(
+                            cursor, product['name'], product['store'], product['price'], product.get('url'),
+                            current_time, product.get('image_url')
+                        )
+                        
+            for product in products:
+                self._notify_upsert(product['name'], product['store'], product['price'])
+            return len(products)
+        except Exception as e:
+            logging.error(f"Error adding/updating products: {str(e)}")
+            return 0
+            
+    @timed_query
+    def import_prices(self, rows: list) -> dict:
+        """Record many (name, store, price, recorded_at) observations with set-based SQL
+        
+        Unlike add_products every row becomes a price history entry at its
+        own recorded_at, and a product's current price only moves to an
+        observation newer than its last update, so old submissions backfill
+        history. Rows already in the history (same product, price and
+        recorded_at) are skipped. Returns counts and the indexes of the
+        skipped rows in 'duplicates'. Errors are raised, not logged.
+        """
+        summary = {'products_added': 0, 'products_updated': 0, 'history_rows': 0, 'duplicates': []}
+        by_store = {}
+        for index, row in enumerate(rows):
+            by_store.setdefault(row[1] if self.sharded else None, []).append((index,) + tuple(row[:4]))
+        changed = []
+        for store, store_rows in by_store.items():
+            with self._write_connection('import_prices', store) as conn:
+                conn.execute('''
+                    CREATE TEMP TABLE import_rows (
+                        seq INTEGER PRIMARY KEY,
+                        name TEXT,
+                        store TEXT,
+                        price REAL,
+                        recorded_at TEXT,
+                        product_id INTEGER
+                    )
+                ''')
+                conn.executemany(
+                    'INSERT INTO import_rows (seq, name, store, price, recorded_at) VALUES (?, ?, ?, ?, ?)', store_rows
+                )
+                find_products = '''
+                    UPDATE import_rows SET product_id = (
+                        SELECT id FROM products p WHERE p.name = import_rows.name AND p.store = import_rows.store
+                    )
+                    WHERE product_id IS NULL
+                '''
+                conn.execute(find_products)
+                
+                duplicates = [seq for seq, in conn.execute('''
+                    SELECT seq FROM import_rows r
+                    WHERE product_id IS NOT NULL AND EXISTS (
+                        SELECT 1 FROM price_history ph
+                        WHERE ph.product_id = r.product_id AND ph.price = r.price AND ph.recorded_at = r.recorded_at
+                    )
+                ''')]
+                if duplicates:
+                    conn.executemany('DELETE FROM import_rows WHERE seq = ?', ((seq,) for seq in duplicates))
+                    summary['duplicates'].extend(duplicates)
+                    
+                # The newest observation of each product, the latest submitted on ties
+                latest = '''
+                    SELECT name, store, price, recorded_at, product_id FROM (
+                        SELECT *, ROW_NUMBER() OVER (
+                            PARTITION BY name, store ORDER BY recorded_at DESC, seq DESC
+                        ) AS newest
+                        FROM import_rows
+                    )
+                    WHERE newest = 1
+                '''
+                summary['products_added'] += conn.execute(f'''
+                    INSERT INTO products (name, store, price, last_updated)
+                    SELECT name, store, price, recorded_at FROM ({latest}) WHERE product_id IS NULL
+                ''').rowcount
+                conn.execute(find_products)
+                
+                conn.execute(f'''
+                    CREATE TEMP TABLE import_latest AS
+                    SELECT product_id, price, recorded_at FROM ({latest})
+                ''')
+                conn.execute('CREATE UNIQUE INDEX temp.idx_import_latest ON import_latest (product_id)')
+                summary['products_updated'] += conn.execute('''
+                    UPDATE products
+                    SET (price, last_updated) = (
+                        SELECT price, recorded_at FROM import_latest l WHERE l.product_id = products.id
+                    )
+                    WHERE id IN (
+                        SELECT l.product_id FROM import_latest l
+                        JOIN products p ON p.id = l.product_id
+                        WHERE l.recorded_at > COALESCE(p.last_updated, '')
+                    )
+                ''').rowcount
+                summary['history_rows'] += conn.execute('''
+                    INSERT INTO price_history (product_id, price, recorded_at)
+                    SELECT product_id, price, recorded_at FROM import_rows ORDER BY recorded_at, seq
+                ''').rowcount
+                changed.extend(conn.execute('''
+                    SELECT p.name, p.store, p.price FROM products p
+                    JOIN import_latest l ON l.product_id = p.id
+                '''))
+                
+        ROWS_WRITTEN.inc(summary['products_added'] + summary['products_updated'], table='products')
+        ROWS_WRITTEN.inc(summary['history_rows'], table='price_history')
+        for name, store, price in changed:
+            self._notify_upsert(name, store, price)
+        return summary
+        
+    def _upsert_product(self, cursor, name, store, price, url, current_time, image_url=None):
+        # Check if product exists
+        cursor.execute('''
+            SELECT id, price FROM products 
+            WHERE name = ? AND store = ?
+        ''', (name, store))
+        
+        result = cursor.fetchone()
+        
+        if result:
+            product_id, old_price = result
+            # Update existing product, keeping a known photo when this result has none
+            cursor.execute('''
+                UPDATE products 
+                SET price = ?, last_updated = ?, image_url = COALESCE(?, image_url)
+                WHERE id = ?
+            ''', (price, current_time, image_url, product_id))
+            
+            ROWS_WRITTEN.inc(table='products')
+            
+            # Add to price history if price changed
+            if old_price != price:
+                cursor.execute('''
+                    INSERT INTO price_history (product_id, price, recorded_at)
+                    VALUES (?, ?, ?)
+                ''', (product_id, price, current_time))
+                ROWS_WRITTEN.inc(table='price_history')
+        else:
+            # Insert new product
+            cursor.execute('''
+                INSERT INTO products (name, store, price, url, last_updated, image_url)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (name, store, price, url, current_time, image_url))
+            
+            product_id = cursor.lastrowid
+            # Add first price history entry
+            cursor.execute('''
+                INSERT INTO price_history (product_id, price, recorded_at)
+                VALUES (?, ?, ?)
+            ''', (product_id, price, current_time))
+            ROWS_WRITTEN.inc(table='products')
+            ROWS_WRITTEN.inc(table='price_history')
+        return product_id
+            
+    def add_upsert_listener(self, callback):
+        """Register callback(name, store, price) to run after every product upsert"""
+        self.upsert_listeners.append(callback)
+        
+    def _notify_upsert(self, name, store, price):
+        for callback in self.upsert_listeners:
+            try:
+                callback(name, store, price)
+            except Exception as e:
+                logging.error(f"Error in upsert listener: {str(e)}")
+            
+    @timed_query
     def get_product_price_history(self, product_id: int) -> list:
         """Get price history for a specific product"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT price, recorded_at 
@@ -127,40 +365,43 @@ class DatabaseManager:
             logging.error(f"Error getting price history: {str(e)}")
             return []
             
+    @timed_query
     def create_shopping_list(self, name: str) -> int:
         """Create a new shopping list"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_connection('create_shopping_list') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO shopping_lists (name, created_at)
                     VALUES (?, ?)
                 ''', (name, datetime.now().isoformat()))
-                conn.commit()
+                ROWS_WRITTEN.inc(table='shopping_lists')
                 return cursor.lastrowid
         except Exception as e:
             logging.error(f"Error creating shopping list: {str(e)}")
             return None
             
+    @timed_query
     def add_item_to_list(self, list_id: int, product_id: int, quantity: int = 1):
         """Add an item to a shopping list"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_connection('add_item_to_list') as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO shopping_list_items (list_id, product_id, quantity)
                     VALUES (?, ?, ?)
                 ''', (list_id, product_id, quantity))
-                conn.commit()
+                ROWS_WRITTEN.inc(table='shopping_list_items')
                 return True
         except Exception as e:
             logging.error(f"Error adding item to shopping list: {str(e)}")
             return False
             
+    @timed_query
     def get_all_products(self) -> list:
         """Get all products from the database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT DISTINCT name, store 
@@ -173,10 +414,68 @@ class DatabaseManager:
             logging.error(f"Error getting all products: {str(e)}")
             return []
             
+    @timed_query
+    def get_product_urls(self, store: str = None) -> list:
+        """Get name, store and page URL of every product that has one"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT name, store, url
+                    FROM products
+                    WHERE url IS NOT NULL AND (? IS NULL OR store = ?)
+                ''', (store, store))
+                return [{'name': name, 'store': store, 'url': url} for name, store, url in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Error getting product URLs: {str(e)}")
+            return []
+            
+    @timed_query
+    def get_product_images(self) -> dict:
+        """Get {name: image URL} for every product with a photo, from any store"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT name, MIN(image_url)
+                    FROM products
+                    WHERE image_url IS NOT NULL
+                    GROUP BY name
+                ''')
+                return dict(cursor.fetchall())
+        except Exception as e:
+            logging.error(f"Error getting product images: {str(e)}")
+            return {}
+            
+    @timed_query
+    def get_product_popularity(self) -> list:
+        """Get every product with how often its price has been recorded"""
+        try:
+            query = '''
+                SELECT p.name, p.store, COUNT(ph.id)
+                FROM products p
+                LEFT JOIN price_history ph ON ph.product_id = p.id
+                GROUP BY p.id
+            '''
+            if self.sharded:
+                # A product's history is in its store's shard, so count shard by shard
+                rows = self._query_shards(query)
+            else:
+                with sqlite3.connect(self.db_path) as conn:
+                    rows = conn.execute(query).fetchall()
+            return [
+                {'name': name, 'store': store, 'popularity': popularity}
+                for name, store, popularity in rows
+            ]
+        except Exception as e:
+            logging.error(f"Error getting product popularity: {str(e)}")
+            return []
+            
+    @timed_query
     def get_product_price_history_by_name(self, name: str, store: str) -> list:
         """Get price history for a product by name and store"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT ph.price, ph.recorded_at
@@ -190,19 +489,21 @@ class DatabaseManager:
             logging.error(f"Error getting price history by name: {str(e)}")
             return []
             
+    @timed_query
     def get_shopping_list_items(self, list_id: int) -> list:
         """Get all items in a shopping list with their details"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT p.name, sli.quantity, p.store, p.price
+                    SELECT sli.id, p.name, sli.quantity, p.store, p.price
                     FROM shopping_list_items sli
                     JOIN products p ON sli.product_id = p.id
                     WHERE sli.list_id = ?
                 ''', (list_id,))
                 
-                results = cursor.fetchall()
+                # In the order added; ORDER BY would copy every shard of the sharded layout
+                results = sorted(cursor.fetchall())
                 return [
                     {
                         'name': name,
@@ -210,16 +511,56 @@ class DatabaseManager:
                         'store': store,
                         'price': price
                     }
-                    for name, quantity, store, price in results
+                    for _, name, quantity, store, price in results
                 ]
         except Exception as e:
             logging.error(f"Error getting shopping list items: {str(e)}")
             return []
             
+    @timed_query
+    def get_basket_costs(self, list_id: int) -> dict:
+        """Get the cost of a shopping list at every store that sells its items
+        
+        Items are matched across stores by product name. Returns
+        store -> {'total': float, 'missing': [names the store does not sell]}.
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # Grouped here rather than in SQL: an aggregate over the
+                # sharded layout's products view would copy every shard first
+                cursor.execute('''
+                    SELECT listed.name, sli.quantity, p.store, p.price
+                    FROM shopping_list_items sli
+                    JOIN products listed ON sli.product_id = listed.id
+                    JOIN products p ON p.name = listed.name
+                    WHERE sli.list_id = ?
+                ''', (list_id,))
+                rows = {}
+                for name, quantity, store, price in cursor.fetchall():
+                    row = rows.setdefault((name, store), [0, price])
+                    row[0] += quantity
+                    row[1] = price
+                
+            names = {name for name, _ in rows}
+            baskets = {}
+            for (name, store), (quantity, price) in rows.items():
+                basket = baskets.setdefault(store, {'total': 0.0, 'items': set()})
+                basket['total'] += price * quantity
+                basket['items'].add(name)
+            return {
+                store: {'total': round(basket['total'], 2), 'missing': sorted(names - basket['items'])}
+                for store, basket in baskets.items()
+            }
+        except Exception as e:
+            logging.error(f"Error getting basket costs: {str(e)}")
+            return {}
+            
+    @timed_query
     def get_lowest_price(self, product_name: str) -> float:
         """Get the lowest current price for a product across all stores"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT MIN(price)
@@ -233,11 +574,78 @@ class DatabaseManager:
             logging.error(f"Error getting lowest price: {str(e)}")
             return None
             
+    @timed_query
+    def get_lowest_prices(self, product_names: list) -> dict:
+        """Get the lowest current price of many products in batched queries"""
+        try:
+            lowest = {}
+            names = list(dict.fromkeys(product_names))
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # Stay well under SQLite's bound parameter limit
+                for start in range(0, len(names), 500):
+                    chunk = names[start:start + 500]
+                    cursor.execute(f'''
+                        SELECT name, MIN(price)
+                        FROM products
+                        WHERE name IN ({','.join('?' * len(chunk))})
+                        GROUP BY name
+                    ''', chunk)
+                    lowest.update(cursor.fetchall())
+            return lowest
+        except Exception as e:
+            logging.error(f"Error getting lowest prices: {str(e)}")
+            return {}
+            
+    @timed_query
+    def get_shopping_lists(self) -> list:
+        """Get all shopping lists, newest first"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, name, created_at
+                    FROM shopping_lists
+                    ORDER BY id DESC
+                ''')
+                return [
+                    {'id': list_id, 'name': name, 'created_at': created_at}
+                    for list_id, name, created_at in cursor.fetchall()
+                ]
+        except Exception as e:
+            logging.error(f"Error getting shopping lists: {str(e)}")
+            return []
+            
+    def iter_price_history(self, batch_size: int = 10000):
+        """Yield (name, store, price, recorded_at) for all price history without loading it all
+        
+        Sharded, each store's history comes in turn rather than interleaved.
+        """
+        paths = list(shard_paths(self.db_path).values()) if self.sharded else [self.db_path]
+        for path in paths:
+            conn = sqlite3.connect(path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT p.name, p.store, ph.price, ph.recorded_at
+                    FROM price_history ph
+                    JOIN products p ON ph.product_id = p.id
+                    ORDER BY ph.id
+                ''')
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield from rows
+            finally:
+                conn.close()
+            
+    @timed_query
     def get_price_alerts(self, max_price_dict: dict) -> list:
         """Get products that are now below their alert price"""
         try:
             alerts = []
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 for product_name, max_price in max_price_dict.items():
@@ -4,16 +4,125 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from datetime import datetime
+import csv
 import os
+from database.db_manager import DatabaseManager
+from database.price_snapshot import PriceSnapshot
+from utils.metrics import span
+from utils.profiler import start_profiler
+
+PRICE_HISTORY_HEADER = ['Product', 'Store', 'Price', 'Recorded At']
+
+
+@lru_cache(maxsize=1)
+def get_styles():
+    """Build the PDF styles once per process and share them between exports"""
+    sample = getSampleStyleSheet()
+    return {
+        'sample': sample,
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=sample['Heading1'],
+            fontSize=24,
+            spaceAfter=30
+        ),
+        'date': ParagraphStyle(
+            'Date',
+            parent=sample['Normal'],
+            fontSize=12,
+            textColor=colors.gray
+        ),
+        'savings': ParagraphStyle(
+            'Savings',
+            parent=sample['Normal'],
+            fontSize=12,
+            textColor=colors.green
+        ),
+        'table': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 14),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('BOX', (0, 0), (-1, -1), 2, colors.black),
+        ])
+    }
+
+
+# Per-process exporter used by batch export workers
+_worker_exporter = None
+
+
+def _init_worker(db_path, snapshot_path=None):
+    global _worker_exporter
+    # Worker processes inherit GROCERY_GURU_PROFILE and profile themselves
+    start_profiler('export-worker')
+    _worker_exporter = ShoppingListExporter(
+        DatabaseManager(db_path),
+        PriceSnapshot(snapshot_path) if snapshot_path else None
+    )
+    get_styles()
+
+
+def _export_list_job(job):
+    list_id, output_path = job
+    return list_id, output_path if _worker_exporter.export_to_pdf(list_id, output_path) else None
+
+
+def write_csv(rows, output_path, header=None):
+    """Stream rows into a CSV file as they are produced, returns the row count"""
+    count = 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_xlsx(rows, output_path, header=None, sheet_title='Export'):
+    """Stream rows into an XLSX file using openpyxl's write-only mode"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("XLSX export requires openpyxl (pip install openpyxl)")
+
+    # Write-only workbooks flush each row instead of keeping the sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    count = 0
+    if header:
+        sheet.append(header)
+    for row in rows:
+        sheet.append(list(row))
+        count += 1
+    workbook.save(output_path)
+    return count
+
 
 class ShoppingListExporter:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, price_snapshot=None):
         self.db_manager = db_manager
-        self.styles = getSampleStyleSheet()
+        self.price_snapshot = price_snapshot
+        self.styles = get_styles()['sample']
         
     def export_to_pdf(self, shopping_list_id, output_path):
         """Export shopping list to PDF"""
+        with span('export.pdf', list_id=shopping_list_id):
+            return self._export_to_pdf(shopping_list_id, output_path)
+            
+    def _export_to_pdf(self, shopping_list_id, output_path):
         try:
             # Get shopping list items
             items = self.db_manager.get_shopping_list_items(shopping_list_id)
@@ -33,26 +142,16 @@ class ShoppingListExporter:
             # Prepare story (content)
             story = []
             
+            styles = get_styles()
+            
             # Add title
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=self.styles['Heading1'],
-                fontSize=24,
-                spaceAfter=30
-            )
-            title = Paragraph("Shopping List", title_style)
+            title = Paragraph("Shopping List", styles['title'])
             story.append(title)
             
             # Add date
-            date_style = ParagraphStyle(
-                'Date',
-                parent=self.styles['Normal'],
-                fontSize=12,
-                textColor=colors.gray
-            )
             date = Paragraph(
                 f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-                date_style
+                styles['date']
             )
             story.append(date)
             story.append(Spacer(1, 20))
@@ -75,35 +174,16 @@ class ShoppingListExporter:
             
             # Create table
             table = Table(table_data, colWidths=[200, 70, 100, 100])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, -1), (-1, -1), colors.black),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, -1), (-1, -1), 12),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('BOX', (0, 0), (-1, -1), 2, colors.black),
-            ]))
+            table.setStyle(styles['table'])
             
             story.append(table)
             
             # Add savings information
             story.append(Spacer(1, 20))
-            savings_style = ParagraphStyle(
-                'Savings',
-                parent=self.styles['Normal'],
-                fontSize=12,
-                textColor=colors.green
-            )
             savings = self.calculate_savings(items)
             savings_text = Paragraph(
                 f"Potential savings: €{savings:.2f} by choosing the best prices",
-                savings_style
+                styles['savings']
             )
             story.append(savings_text)
             
@@ -114,12 +194,45 @@ class ShoppingListExporter:
             print(f"Error exporting to PDF: {e}")
             return False
             
+    def export_many(self, list_ids, output_dir, max_workers=None):
+        """Export many shopping lists to PDF in parallel worker processes
+        
+        Returns a dict of list_id -> output path, or None where it failed.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        jobs = (
+            (list_id, os.path.join(output_dir, f"shopping_list_{list_id}.pdf"))
+            for list_id in list_ids
+        )
+        results = {}
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(self.db_manager.db_path, self.price_snapshot.path if self.price_snapshot else None)
+        ) as executor:
+            for list_id, output_path in executor.map(_export_list_job, jobs, chunksize=16):
+                results[list_id] = output_path
+        return results
+        
+    def export_price_history(self, output_path):
+        """Stream the whole price history to CSV or XLSX, picked by file extension"""
+        with span('export.history'):
+            rows = self.db_manager.iter_price_history()
+            if output_path.lower().endswith('.xlsx'):
+                return write_xlsx(rows, output_path, PRICE_HISTORY_HEADER, 'Price History')
+            return write_csv(rows, output_path, PRICE_HISTORY_HEADER)
+        
     def calculate_savings(self, items):
         """Calculate potential savings by comparing with lowest prices"""
+        # Lowest prices across all stores, from the snapshot file when there is one
+        names = [item['name'] for item in items]
+        if self.price_snapshot is not None and self.price_snapshot.available:
+            lowest_prices = self.price_snapshot.lowest_prices(names)
+        else:
+            lowest_prices = self.db_manager.get_lowest_prices(names)
         total_savings = 0
         for item in items:
-            # Get lowest price for this product across all stores
-            lowest_price = self.db_manager.get_lowest_price(item['name'])
+            lowest_price = lowest_prices.get(item['name'])
             if lowest_price and lowest_price < item['price']:
                 total_savings += (item['price'] - lowest_price) * item['quantity']
         return total_savings
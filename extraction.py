@@ -0,0 +1,516 @@
+"""Compile declarative store specs into extraction plans
+
+compile_spec() turns a spec from store_specs into a StorePlan, once per
+store. The work the hand-written scrapers repeated for every item is done
+up front instead:
+
+    JSON fields  dotted paths become generated Python that reads an item
+                 with plain subscripts, not a walk over the path per field
+    CSS fields   'tag.class' selectors become bs4 find() calls and a
+                 SoupStrainer for the page, richer ones are compiled once
+                 by soupsieve
+    records      each endpoint gets one generated function that loops over
+                 the items of a page and yields ProductRecords,
+                 DiscountRecords or prices, see EndpointPlan.records.source
+
+SpecScraper runs a plan, so a store is its spec and a small subclass.
+"""
+import json
+import logging
+import re
+from html import unescape
+from itertools import islice
+from bs4 import BeautifulSoup, SoupStrainer
+from .base_scraper import BaseScraper
+from .records import ProductRecord, DiscountRecord, to_cents
+
+# Record fields per page kind, in the order the records take them
+RECORD_FIELDS = {
+    'search': ('name', 'price', 'url', 'image'),
+    'promotions': ('name', 'original_price', 'discount_price', 'url', 'valid_until', 'image'),
+    'product': ('price',)
+}
+PRICE_FIELDS = ('price', 'original_price', 'discount_price')
+# Links resolved against the store's site
+LINK_FIELDS = ('url', 'image')
+PRICE_PARSERS = {'decimal': to_cents, 'cents': int}
+
+# 'div', '.card' or 'div.card' can be a plain find(), anything else goes to soupsieve
+SIMPLE_SELECTOR = re.compile(r'^([a-zA-Z][\w-]*)?(?:\.([\w-]+))?$')
+
+JSON_LD = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+CARD_HREF = re.compile(r'<a\b[^>]*href=["\']([^"\']+)["\']')
+CARD_IMAGE = re.compile(r'<img\b[^>]*?\b(?:data-src|src)=["\']([^"\']+)["\']')
+
+
+def _unescape(value):
+    # Attribute JSON is mostly &quot;, a plain replace is far cheaper than html.unescape
+    value = value.replace('&quot;', '"')
+    return unescape(value) if '&' in value else value
+
+
+def _ld_products(node):
+    """Yield every schema.org Product in a decoded JSON-LD document"""
+    if isinstance(node, list):
+        for item in node:
+            yield from _ld_products(item)
+    elif isinstance(node, dict):
+        kind = node.get('@type')
+        if kind == 'Product' or (isinstance(kind, list) and 'Product' in kind):
+            yield node
+        for key in ('@graph', 'itemListElement', 'item'):
+            if key in node:
+                yield from _ld_products(node[key])
+
+
+def _ld_item(product):
+    offers = product.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    image = product.get('image')
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get('url')
+    price = offers.get('price', offers.get('lowPrice'))
+    if price is None or not product.get('name'):
+        return None
+    return {
+        'name': unescape(product['name']).strip(),
+        'price': price,
+        'original_price': offers.get('highPrice'),
+        'href': product.get('url') or offers.get('url'),
+        'image': image
+    }
+
+
+class EmbeddedProducts:
+    """Reads product JSON embedded in a page without parsing the HTML
+
+    Sources are schema.org JSON-LD blocks, then per-card analytics JSON in
+    a data attribute. Everything between one card's marker class and the
+    next belongs to that card.
+    """
+
+    def __init__(self, json_ld=True, card_marker=None, card_json=None, original_price_class=None):
+        self.json_ld = json_ld
+        self.card_marker = card_marker
+        self.card_product = None
+        if card_json:
+            self.card_product = re.compile(re.escape(card_json) + r'''=(?:"([^"]*)"|'([^']*)')''')
+        self.card_original_price = None
+        if original_price_class:
+            self.card_original_price = re.compile(
+                r'class=["\'][^"\']*\b' + re.escape(original_price_class) + r'\b[^"\']*["\'][^>]*>([^<]+)<'
+            )
+
+    def extract(self, html: str):
+        """(path, items) where path is 'json_ld' or 'data_attr', or (None, []) if the page has none
+
+        Items are dicts with name, price, original_price, href and image.
+        """
+        items = []
+        if self.json_ld:
+            for blob in JSON_LD.findall(html):
+                try:
+                    document = json.loads(blob)
+                except ValueError:
+                    continue
+                for product in _ld_products(document):
+                    item = _ld_item(product)
+                    if item:
+                        items.append(item)
+            if items:
+                return 'json_ld', items
+
+        if self.card_marker and self.card_product:
+            marker = self.card_marker
+            start = html.find(marker)
+            while start != -1:
+                end = html.find(marker, start + len(marker))
+                card = html[start:end if end != -1 else len(html)]
+                start = end
+                match = self.card_product.search(card)
+                if not match:
+                    continue
+                try:
+                    data = json.loads(_unescape(match.group(1) if match.group(1) is not None else match.group(2)))
+                except ValueError:
+                    continue
+                if data.get('price') is None or not data.get('name'):
+                    continue
+                href = CARD_HREF.search(card)
+                image = CARD_IMAGE.search(card)
+                original = self.card_original_price.search(card) if self.card_original_price else None
+                items.append({
+                    'name': _unescape(data['name']).strip(),
+                    'price': data['price'],
+                    'original_price': _unescape(original.group(1)).strip() if original else None,
+                    'href': _unescape(href.group(1)) if href else None,
+                    'image': _unescape(image.group(1)) if image else None
+                })
+            if items:
+                return 'data_attr', items
+        return None, []
+
+
+def _json_expression(variable, path):
+    """Python for reading a dotted path: 'images.0.url' -> item['images'][0]['url']"""
+    keys = ''.join(f"[{int(key)}]" if key.isdigit() else f"[{key!r}]" for key in path.split('.'))
+    return variable + keys
+
+
+class _Codegen:
+    """Collects the source and constants of one generated records function
+
+    The function loops over the items itself, so reading an item costs no
+    Python call beyond the record constructor and the price parser.
+    """
+
+    def __init__(self, name):
+        # Store names such as 'Top!' are not identifiers
+        self.name = re.sub(r'\W', '_', name)
+        self.lines = []
+        self.namespace = {
+            'ProductRecord': ProductRecord,
+            'DiscountRecord': DiscountRecord,
+            'MissingField': KeyError
+        }
+
+    def constant(self, prefix, value):
+        name = f"{prefix}_{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def emit(self, line, indent=0):
+        self.lines.append('    ' * indent + line)
+
+    def build(self):
+        """Compile into records(items, absolute, base, failed), a generator of results
+
+        absolute resolves links, base is the store's base URL and failed(error)
+        is called for an item that could not be read.
+        """
+        body = '\n'.join('            ' + line for line in self.lines)
+        source = (
+            f"def {self.name}(items, absolute, base, failed):\n"
+            f"    for item in items:\n"
+            f"        try:\n"
+            f"{body}\n"
+            f"        except Exception as e:\n"
+            f"            failed(e)\n"
+            f"            continue\n"
+            f"        yield record\n"
+        )
+        exec(compile(source, f"<extraction plan {self.name}>", 'exec'), self.namespace)
+        function = self.namespace[self.name]
+        function.source = source
+        return function
+
+
+def _strainer(tag, css_class):
+    """SoupStrainer for tag.class; while parsing, class is still one string such as 'card price-tag'"""
+    if not css_class:
+        return SoupStrainer(tag)
+    return SoupStrainer(tag, class_=re.compile(r'(?:^|\s)' + re.escape(css_class) + r'(?:\s|$)'))
+
+
+def _compile_selector(code, selector):
+    """(expression finding one element under item, SoupStrainer or None) for a CSS selector"""
+    if not selector:
+        return 'item', None
+    simple = SIMPLE_SELECTOR.match(selector)
+    if simple and any(simple.groups()):
+        tag, css_class = simple.groups()
+        args = ', '.join(filter(None, (repr(tag) if tag else None, f"class_={css_class!r}" if css_class else None)))
+        return f"item.find({args})", _strainer(tag, css_class)
+    import soupsieve
+    return f"{code.constant('SELECTOR', soupsieve.compile(selector))}.select_one(item)", None
+
+
+def _compile_items(selector):
+    """(function returning the item elements of a soup, SoupStrainer or None)"""
+    simple = SIMPLE_SELECTOR.match(selector)
+    if simple and any(simple.groups()):
+        tag, css_class = simple.groups()
+        kwargs = {'class_': css_class} if css_class else {}
+        return (lambda soup: soup.find_all(tag, **kwargs)), _strainer(tag, css_class)
+    import soupsieve
+    compiled = soupsieve.compile(selector)
+    return compiled.select, None
+
+
+class EndpointPlan:
+    """How to request and read one page kind of a store"""
+
+    def __init__(self, store, kind, endpoint):
+        if kind not in RECORD_FIELDS:
+            raise ValueError(f"Unknown page kind in {store} spec: {kind}")
+        if endpoint.get('format') not in ('json', 'html'):
+            raise ValueError(f"{store} {kind}: format must be 'json' or 'html'")
+        self.store = store
+        self.kind = kind
+        self.format = endpoint['format']
+        self.path = endpoint.get('path', '')
+        self.params = dict(endpoint.get('params') or {})
+        self.cents = PRICE_PARSERS[endpoint.get('price', 'decimal')]
+        self.required = [
+            field for field in RECORD_FIELDS[kind]
+            if field in endpoint['fields'] and field not in endpoint.get('optional', ())
+        ]
+        missing = [field for field in ('name',) + PRICE_FIELDS if field in RECORD_FIELDS[kind] and field not in endpoint['fields']]
+        if missing:
+            raise ValueError(f"{store} {kind}: no source for {', '.join(missing)}")
+
+        self.strainer = None
+        self.items = None
+        if self.format == 'json':
+            self.items = self._compile_json_items(endpoint.get('items'))
+            self.records = self._compile_json(endpoint, endpoint['fields'], 'json')
+        else:
+            strainers = []
+            if endpoint.get('items'):
+                self.items, strainer = _compile_items(endpoint['items'])
+                strainers.append(strainer)
+            self.records, field_strainers = self._compile_html(endpoint)
+            if not endpoint.get('items'):
+                strainers.extend(field_strainers)
+            # Only parse the part of the page the plan reads, when one strainer covers it
+            if len(strainers) == 1:
+                self.strainer = strainers[0]
+
+        self.embedded = None
+        embedded = endpoint.get('embedded')
+        if embedded:
+            self.embedded = EmbeddedProducts(
+                embedded.get('json_ld', True),
+                embedded.get('card_marker'),
+                embedded.get('card_json'),
+                embedded.get('original_price_class')
+            )
+            self.embedded_records = self._compile_json(endpoint, embedded['fields'], 'embedded')
+            # The embedded path is only taken when every item carries the prices the record needs
+            self.embedded_prices = [
+                embedded['fields'][field] for field in PRICE_FIELDS
+                if field in self.required and field in embedded['fields']
+            ]
+
+    def _compile_json_items(self, path):
+        if not path:
+            return lambda data: data
+        keys = [int(key) if key.isdigit() else key for key in path.split('.')]
+
+        def items(data):
+            try:
+                for key in keys:
+                    data = data[key]
+                return data
+            except (LookupError, TypeError):
+                return ()
+        return items
+
+    def _compile_json(self, endpoint, fields, source):
+        """Generated records function for decoded JSON items"""
+        code = _Codegen(f"{self.store}_{self.kind}_{source}")
+        optional = endpoint.get('optional', ())
+        for field, path in fields.items():
+            variable = f"v_{field}"
+            if field not in optional:
+                code.emit(f"{variable} = {_json_expression('item', path)}")
+            elif '.' not in path:
+                code.emit(f"{variable} = item.get({path!r})")
+            else:
+                code.emit('try:')
+                code.emit(f"{variable} = {_json_expression('item', path)}", 1)
+                code.emit('except (LookupError, TypeError):')
+                code.emit(f"{variable} = None", 1)
+        self._emit_record(code, endpoint, fields)
+        return code.build()
+
+    def _compile_html(self, endpoint):
+        """Generated records function for elements, cards or a whole page"""
+        code = _Codegen(f"{self.store}_{self.kind}_dom")
+        optional = endpoint.get('optional', ())
+        defaults = endpoint.get('defaults', {})
+        skip_without = endpoint.get('skip_without')
+        if not endpoint.get('items'):
+            # A product page without its price element has no price
+            skip_without = skip_without or 'price'
+        strainers = []
+        # The field an item is skipped without is looked up first
+        fields = sorted(endpoint['fields'].items(), key=lambda item: item[0] != skip_without)
+        for field, source in fields:
+            selector, _, attributes = source.partition('@')
+            element, strainer = _compile_selector(code, selector)
+            strainers.append(strainer)
+            variable = f"e_{field}"
+            code.emit(f"{variable} = {element}")
+            if field == skip_without:
+                code.emit(f"if {variable} is None:")
+                code.emit('continue', 1)
+            elif field not in optional:
+                code.emit(f"if {variable} is None:")
+                code.emit(f"raise MissingField({field!r})", 1)
+            if attributes:
+                names = attributes.split('|')
+                if len(names) == 1 and field in defaults:
+                    value = f"{variable}.get({names[0]!r}, {code.constant('DEFAULT', defaults[field])})"
+                else:
+                    value = ' or '.join(f"{variable}.get({name!r})" for name in names)
+                    if field in defaults:
+                        value += f" or {code.constant('DEFAULT', defaults[field])}"
+                    value = f"({value})"
+            else:
+                value = f"{variable}.text.strip()"
+            if field in optional and field != skip_without:
+                value = f"{value} if {variable} is not None else None"
+            code.emit(f"v_{field} = {value}")
+        self._emit_record(code, endpoint, endpoint['fields'])
+        return code.build(), strainers
+
+    def _emit_record(self, code, endpoint, fields):
+        """Turn the v_<field> variables into the record for this page kind"""
+        templates = endpoint.get('templates', {})
+        optional = endpoint.get('optional', ())
+        code.namespace['cents'] = self.cents
+        code.namespace['STORE'] = self.store
+        values = {}
+        for field in RECORD_FIELDS[self.kind]:
+            if field not in fields:
+                values[field] = 'None'
+                continue
+            value = f"v_{field}"
+            template = templates.get(field)
+            if field in LINK_FIELDS and template and template.startswith('/') and _plain_template(template):
+                # A site path needs no resolving, build it the way a hand-written scraper would
+                prefix, suffix = template.split('{}')
+                value = f"base + {prefix!r} + str({value})" + (f" + {suffix!r}" if suffix else '')
+            else:
+                if template:
+                    value = f"{code.constant('TEMPLATE', template)}.format({value})"
+                if field in LINK_FIELDS:
+                    value = f"absolute({value})"
+            if template and field in optional:
+                value = f"({value} if v_{field} is not None else None)"
+            if field in PRICE_FIELDS:
+                value = f"cents({value})"
+            values[field] = value
+        if self.kind == 'search':
+            code.emit(f"record = ProductRecord({values['name']}, STORE, {values['price']}, {values['url']}, {values['image']})")
+        elif self.kind == 'promotions':
+            code.emit(
+                f"record = DiscountRecord({values['name']}, STORE, {values['original_price']}, "
+                f"{values['discount_price']}, {values['url']}, {values['valid_until']}, {values['image']})"
+            )
+        else:
+            code.emit(f"record = {values['price']} / 100")
+
+    def parse(self, body: bytes, absolute, base):
+        """(extraction path, iterable of results) for a downloaded page"""
+        if self.format == 'json':
+            return 'json', self._results(self.records, self.items(json.loads(body)), absolute, base)
+        text = body.decode('utf-8', errors='replace')
+        if self.embedded is not None:
+            path, items = self.embedded.extract(text)
+            prices = self.embedded_prices
+            if path and all(item[key] is not None for item in items for key in prices):
+                return path, self._results(self.embedded_records, items, absolute, base)
+        soup = BeautifulSoup(text, 'html.parser', parse_only=self.strainer)
+        return 'dom', self._results(self.records, self.items(soup) if self.items else (soup,), absolute, base)
+
+    def _results(self, records, items, absolute, base):
+        results = records(items, absolute, base, self._failed)
+        if self.kind == 'product':
+            # A product page has one price, the first found
+            return list(islice(results, 1))
+        return results
+
+    def _failed(self, error):
+        logging.error(f"Error parsing {self.store} {self.kind} item: {str(error)}")
+
+
+def _plain_template(template):
+    return template.count('{}') == 1 and template.count('{') == 1 and template.count('}') == 1
+
+
+class StorePlan:
+    """A compiled store spec: request building and page parsing per page kind"""
+
+    def __init__(self, spec):
+        self.store = spec['store']
+        self.base_url = spec['base_url']
+        self.pagination = dict(spec.get('pagination') or {})
+        self.endpoints = {
+            kind: EndpointPlan(self.store, kind, endpoint)
+            for kind, endpoint in spec['endpoints'].items()
+        }
+
+    def endpoint(self, kind):
+        try:
+            return self.endpoints[kind]
+        except KeyError:
+            raise ValueError(f"Unknown page kind for {self.store}: {kind}")
+
+    def request(self, base_url, kind, target=None, page=None) -> tuple:
+        """(url, params) to GET a page kind, base_url being where the store is served from"""
+        endpoint = self.endpoint(kind)
+        if kind == 'product':
+            return target, None
+        params = {key: target if value == '{query}' else value for key, value in endpoint.params.items()}
+        if kind == 'search' and self.pagination.get('param'):
+            params[self.pagination['param']] = self.pagination.get('start', 1) if page is None else page
+            if self.pagination.get('size_param'):
+                params[self.pagination['size_param']] = self.pagination['size']
+        return base_url + endpoint.path, params or None
+
+    def search_pages(self):
+        """Page numbers to read per search"""
+        start = self.pagination.get('start', 1)
+        return range(start, start + self.pagination.get('pages', 1))
+
+    def parse(self, kind, body, absolute, base):
+        return self.endpoint(kind).parse(body, absolute, base)
+
+
+# Plans by store name, each spec is compiled once per process
+_plans = {}
+
+
+def compile_spec(spec) -> StorePlan:
+    plan = _plans.get(spec['store'])
+    if plan is None:
+        plan = _plans[spec['store']] = StorePlan(spec)
+    return plan
+
+
+class SpecScraper(BaseScraper):
+    """A scraper driven by a store spec, subclasses only set spec"""
+    spec = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.spec is not None:
+            cls.store_name = cls.spec['store']
+
+    def __init__(self):
+        super().__init__()
+        self.plan = compile_spec(self.spec)
+        self.base_url = self.spec['base_url']
+
+    def request(self, kind: str, target: str = None, page: int = None) -> tuple:
+        return self.plan.request(self.base_url, kind, target, page)
+
+    def parse(self, kind: str, body: bytes) -> tuple:
+        return self.plan.parse(kind, body, self._absolute_url, self.base_url)
+
+    def iter_search_product(self, query: str):
+        """Search for a product, reading as many result pages as the spec asks for"""
+        size = self.plan.pagination.get('size')
+        for page in self.plan.search_pages():
+            count = 0
+            for record in self.parse_page('search', self.fetch('search', query, page)):
+                count += 1
+                yield record
+            # A short page is the last one
+            if not count or (size and count < size):
+                break
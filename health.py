@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.metrics import metrics
+
+CIRCUIT_STATE = metrics.gauge('scraper_circuit_state', 'Circuit breaker state per store: 0 closed, 1 half open, 2 open', ('store',))
+CIRCUIT_TRANSITIONS = metrics.counter('scraper_circuit_transitions_total', 'Circuit breaker state changes', ('store', 'state'))
+HEDGED_REQUESTS = metrics.counter('scraper_hedged_requests_total', 'Duplicate requests sent because the first was slow', ('store', 'winner'))
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# What the UI shows for a store
+OK, DEGRADED, DOWN = 'ok', 'degraded', 'down'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a store whose circuit breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """Failure and slow-call tracking over the last few calls to one store
+
+    Closed: calls go through. Once at least min_calls outcomes are in the
+    window and the failure or slow-call rate reaches its threshold the
+    circuit opens and calls fail fast for open_seconds. Then it half
+    opens, letting probe_calls through; their success closes it again and
+    a failure opens it for another open_seconds.
+    """
+
+    def __init__(self, store, window=20, min_calls=5, failure_threshold=0.5,
+                 slow_call_seconds=5.0, slow_call_threshold=0.5, open_seconds=30.0, probe_calls=1):
+        self.store = store
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_threshold = slow_call_threshold
+        self.open_seconds = open_seconds
+        self.probe_calls = probe_calls
+        self.outcomes = deque(maxlen=window)  # (failed, slow)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, store=store)
+
+    def _transition(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state != HALF_OPEN:
+            self.probes_in_flight = 0
+        if state == CLOSED:
+            self.outcomes.clear()
+        CIRCUIT_STATE.set(STATE_VALUES[state], store=self.store)
+        CIRCUIT_TRANSITIONS.inc(store=self.store, state=state)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now, counting it as a probe when half open"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.probe_calls:
+                    return False
+                self.probes_in_flight += 1
+            return True
+
+    def record(self, success: bool, seconds: float, error=None):
+        slow = seconds >= self.slow_call_seconds
+        with self._lock:
+            if not success:
+                self.last_error = error
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self._transition(CLOSED if success and not slow else OPEN)
+                return
+            self.outcomes.append((not success, slow))
+            if self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+                calls = len(self.outcomes)
+                failure_rate = sum(failed for failed, _ in self.outcomes) / calls
+                slow_rate = sum(slow for _, slow in self.outcomes) / calls
+                if failure_rate >= self.failure_threshold or slow_rate >= self.slow_call_threshold:
+                    self._transition(OPEN)
+
+    def status(self) -> str:
+        with self._lock:
+            if self.state == OPEN:
+                return DOWN
+            if self.state == HALF_OPEN or (self.outcomes and any(failed or slow for failed, slow in list(self.outcomes)[-3:])):
+                return DEGRADED
+            return OK
+
+
+class StoreHealth:
+    """Breaker, recent latencies and hedging for one store"""
+
+    # Successful latencies needed before hedging starts
+    MIN_SAMPLES = 20
+    # Never hedge sooner than this, whatever the p95
+    MIN_HEDGE_DELAY = 0.05
+    # Hedges allowed per request, so a slow store does not get twice the traffic
+    HEDGE_BUDGET = 0.1
+    # Once latencies are known, give up on requests this many times slower than the p95
+    TIMEOUT_P95_MULTIPLE = 5
+    MIN_TIMEOUT = 2.0
+
+    def __init__(self, store, **breaker_options):
+        self.store = store
+        self.breaker = CircuitBreaker(store, **breaker_options)
+        self.latencies = deque(maxlen=200)
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return self.breaker.allow()
+
+    def record(self, success, seconds, error=None):
+        if success:
+            with self._lock:
+                self.latencies.append(seconds)
+        self.breaker.record(success, seconds, error)
+
+    def status(self) -> str:
+        return self.breaker.status()
+
+    def p95(self):
+        with self._lock:
+            if len(self.latencies) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def timeout(self, default):
+        """Request timeout: a generous multiple of the p95 once known, capped at default"""
+        p95 = self.p95()
+        if p95 is None:
+            return default
+        return min(default, max(self.MIN_TIMEOUT, self.TIMEOUT_P95_MULTIPLE * p95))
+
+    def hedge_delay(self):
+        """Seconds to wait before sending a duplicate request, or None to not hedge"""
+        p95 = self.p95()
+        if p95 is None:
+            return None
+        with self._lock:
+            self.requests += 1
+            if self.hedges >= self.HEDGE_BUDGET * self.requests:
+                return None
+        return max(p95, self.MIN_HEDGE_DELAY)
+
+    def hedged(self, send, *args, **kwargs):
+        """Call send(*args, **kwargs), racing a duplicate if it runs past the p95 delay
+
+        Only for idempotent requests: both copies may reach the store.
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return send(*args, **kwargs)
+        first = _hedge_pool.submit(send, *args, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        with self._lock:
+            self.hedges += 1
+        second = _hedge_pool.submit(send, *args, **kwargs)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    HEDGED_REQUESTS.inc(store=self.store, winner='first' if future is first else 'hedge')
+                    return future.result()
+        # Both failed: report the original request's error
+        HEDGED_REQUESTS.inc(store=self.store, winner='none')
+        return first.result()
+
+    def snapshot(self) -> dict:
+        p95 = self.p95()
+        return {
+            'status': self.status(),
+            'circuit': self.breaker.state,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'hedges': self.hedges,
+            'last_error': str(self.breaker.last_error) if self.breaker.last_error else None
+        }
+
+
+class StoreHealthRegistry:
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, store, **breaker_options) -> StoreHealth:
+        with self._lock:
+            health = self._stores.get(store)
+            if health is None:
+                health = self._stores[store] = StoreHealth(store, **breaker_options)
+            return health
+
+    def status(self, store) -> str:
+        return self.get(store).status()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stores = dict(self._stores)
+        return {store: health.snapshot() for store, health in stores.items()}
+
+
+# Threads that carry hedged requests; the caller's thread waits on them
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='hedge')
+
+store_health = StoreHealthRegistry()
@@ -1,17 +1,29 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk
 import os
-from PIL import Image, ImageTk
+import logging
 from scrapers.rimi_scraper import RimiScraper
 from scrapers.maxima_scraper import MaximaScraper
 from scrapers.lidl_scraper import LidlScraper
+from scrapers.health import store_health, DEGRADED, DOWN
 from database.db_manager import DatabaseManager
-from utils.price_history import PriceHistoryViewer
+from database.price_snapshot import PriceSnapshot, SnapshotMaintainer, build_snapshot, snapshot_path
+from utils.price_history import PriceHistoryViewer, PriceSeriesCache
 from utils.preferences import PreferencesManager
 from utils.export import ShoppingListExporter
+from utils.virtual_table import VirtualTable
+from utils.task_runner import TaskRunner
+from utils.autocomplete import ProductIndex, AutocompleteCombobox
+from utils.thumbnails import ThumbnailService, SIZES
+from utils.metrics import metrics, span, EventLoopMonitor
+from utils.profiler import add_profile_argument, start_profiler
 from tkinter import filedialog, messagebox
 
 class GroceryGuruApp:
+    # Search results are saved and shown in batches of this many records
+    SEARCH_BATCH_SIZE = 10
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Grocery Guru Latvia")
@@ -20,12 +32,33 @@ class GroceryGuruApp:
         # Initialize managers
         self.db_manager = DatabaseManager()
         self.preferences = PreferencesManager()
-        self.exporter = ShoppingListExporter(self.db_manager)
+        # Latest prices read from a memory-mapped file, rebuilt after every ingest
+        self.price_snapshot = PriceSnapshot(snapshot_path(self.db_manager.db_path))
+        self.snapshot_maintainer = SnapshotMaintainer(self.db_manager, self.price_snapshot.path)
+        self.exporter = ShoppingListExporter(self.db_manager, self.price_snapshot)
+        self.price_series = PriceSeriesCache(self.db_manager)
         self.scrapers = {
             'Rimi': RimiScraper(),
             'Maxima': MaximaScraper(),
             'Lidl': LidlScraper()
         }
+        self.tasks = TaskRunner(self.root)
+        # Product photos by name, filled from the database and from search results
+        self.thumbnails = ThumbnailService(self.root)
+        self.product_images = {}
+        self.tasks.submit(
+            lambda task: self.db_manager.get_product_images(),
+            on_result=self.on_product_images
+        )
+        
+        # Build the autocomplete index once, then keep it fresh on upserts
+        self.product_index = ProductIndex()
+        self.db_manager.add_upsert_listener(lambda name, store, price: self.product_index.add(name, store))
+        self.tasks.submit(lambda task: self.product_index.build(self.db_manager.get_product_popularity()))
+        self.search_results = {}
+        self._search_after_id = None
+        # Shopping list picked for the last single-list export
+        self.active_list_id = None
         
         # Configure style
         self.style = ttk.Style()
@@ -33,6 +66,43 @@ class GroceryGuruApp:
         self.style.configure("Title.TLabel", font=('Helvetica', 16, 'bold'))
         
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.show_snapshot_prices()
+        
+        # Instrumentation
+        self.loop_monitor = EventLoopMonitor(self.root)
+        metrics_port = os.environ.get('GROCERY_GURU_METRICS_PORT')
+        if metrics_port:
+            try:
+                metrics.start_http_server(int(metrics_port))
+            except Exception as e:
+                logging.error(f"Error starting metrics server: {str(e)}")
+        
+    def show_snapshot_prices(self):
+        """Fill the comparison table with every known price straight from the snapshot"""
+        if not self.price_snapshot.available:
+            # First run: build the file in the background and show it once ready
+            self.tasks.submit(
+                lambda task: build_snapshot(self.db_manager.db_path, self.price_snapshot.path),
+                on_result=self.on_snapshot_built
+            )
+            return
+        if not self.search_results:
+            self.price_tree.set_rows(self.price_snapshot.rows(list(self.scrapers)))
+            
+    def on_snapshot_built(self, count):
+        # reload() is False when a maintainer notification already mapped the
+        # file, so check availability rather than its result
+        self.price_snapshot.reload()
+        if self.price_snapshot.available:
+            self.show_snapshot_prices()
+            
+    def on_close(self):
+        """Cancel background work and close the window"""
+        self.tasks.shutdown()
+        self.thumbnails.shutdown()
+        self.preferences.flush()
+        self.root.destroy()
         
     def setup_ui(self):
         # Create main container
@@ -69,8 +139,10 @@ class GroceryGuruApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Export Shopping List", command=self.export_shopping_list)
+        file_menu.add_command(label="Export All Shopping Lists...", command=self.export_all_shopping_lists)
+        file_menu.add_command(label="Export Price History...", command=self.export_price_history)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
         
         # View menu
         view_menu = tk.Menu(menubar, tearoff=0)
@@ -91,17 +163,41 @@ class GroceryGuruApp:
         ttk.Label(search_frame, text="Search Products:").grid(row=0, column=0)
         self.search_entry = ttk.Entry(search_frame)
         self.search_entry.grid(row=0, column=1, padx=5)
+        self.search_entry.bind('<KeyRelease>', self.on_search_typed)
+        self.search_entry.bind('<Return>', lambda e: self.search_products())
         ttk.Button(search_frame, text="Search", command=self.search_products).grid(row=0, column=2)
+        ttk.Button(search_frame, text="Cancel", command=self.cancel_search).grid(row=0, column=3, padx=5)
+        
+        # Per-store progress
+        progress_frame = ttk.Frame(self.price_comparison_frame)
+        progress_frame.grid(row=3, column=0, pady=5, padx=10, sticky=(tk.W, tk.E))
+        
+        self.store_progress = {}
+        for i, store_name in enumerate(self.scrapers):
+            ttk.Label(progress_frame, text=f"{store_name}:").grid(row=0, column=i * 3)
+            bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100, length=100)
+            bar.grid(row=0, column=i * 3 + 1, padx=5)
+            status = ttk.Label(progress_frame, text="Idle", width=10)
+            status.grid(row=0, column=i * 3 + 2, padx=(0, 10))
+            self.store_progress[store_name] = (bar, status)
         
         # Results table
         columns = ('Product', 'Rimi', 'Maxima', 'Lidl')
-        self.price_tree = ttk.Treeview(self.price_comparison_frame, columns=columns, show='headings')
-        
-        for col in columns:
-            self.price_tree.heading(col, text=col)
-            self.price_tree.column(col, width=150)
-            
+        self.price_tree = VirtualTable(
+            self.price_comparison_frame,
+            columns,
+            formatters={store: self.format_price for store in self.scrapers},
+            image=lambda name: self.thumbnails.image(self.product_images.get(name)),
+            image_size=SIZES['row']
+        )
         self.price_tree.grid(row=1, column=0, pady=10, padx=10, sticky=(tk.W, tk.E))
+        self.price_tree.tree.bind('<<TreeviewSelect>>', lambda e: self.show_product_image(), add='+')
+        
+        # Larger photo of the selected product
+        self.product_image_label = ttk.Label(self.price_comparison_frame)
+        self.product_image_label.grid(row=1, column=1, pady=10, padx=10, sticky=tk.N)
+        self.thumbnails.add_listener(self.price_tree.refresh)
+        self.thumbnails.add_listener(self.show_product_image)
         
         # Price history button
         ttk.Button(
@@ -110,41 +206,122 @@ class GroceryGuruApp:
             command=self.show_price_history
         ).grid(row=2, column=0, pady=5)
         
+    def on_search_typed(self, event=None):
+        """Debounce keystrokes into a single search once typing pauses"""
+        if event is not None and event.keysym == 'Return':
+            return
+        if self._search_after_id:
+            self.root.after_cancel(self._search_after_id)
+        self._search_after_id = self.root.after(400, self.search_products)
+        
     def search_products(self):
-        query = self.search_entry.get()
+        if self._search_after_id:
+            self.root.after_cancel(self._search_after_id)
+            self._search_after_id = None
+        query = self.search_entry.get().strip()
         if not query:
             return
             
-        # Clear existing items
-        for item in self.price_tree.get_children():
-            self.price_tree.delete(item)
-            
-        # Search across all stores
-        all_products = {}
+        # A new query makes any search still in flight stale
+        self.tasks.cancel_group('search')
+        self.search_results = {}
+        
+        # Search across all stores in parallel
         for store_name, scraper in self.scrapers.items():
-            products = scraper.search_product(query)
-            for product in products:
-                name = product['name']
-                if name not in all_products:
-                    all_products[name] = {'Product': name, 'Rimi': '-', 'Maxima': '-', 'Lidl': '-'}
-                all_products[name][store_name] = f"€{product['price']:.2f}"
-                
-                # Save to database
-                self.db_manager.add_product(
-                    name=name,
-                    store=store_name,
-                    price=product['price'],
-                    url=product.get('url')
-                )
+            self.set_store_progress(store_name, 0, "Searching")
+            self.tasks.submit(
+                self._search_store,
+                store_name,
+                scraper,
+                query,
+                group='search',
+                on_result=lambda count, s=store_name: self.on_store_finished(s, count),
+                on_error=lambda error, s=store_name: self.set_store_progress(s, 0, self.store_status_text(s)),
+                on_progress=lambda records, s=store_name: self.on_store_results(s, records)
+            )
+            
+    def _search_store(self, task, store_name, scraper, query):
+        """Worker: stream one store's results to the table and the database in small batches"""
+        count = 0
+        with span('search.store', store=store_name, query=query):
+            batch = []
+            for record in scraper.iter_search_product(query):
+                task.check()
+                batch.append(record)
+                if len(batch) == self.SEARCH_BATCH_SIZE:
+                    count += self._save_search_batch(task, store_name, batch)
+                    batch = []
+            if batch:
+                count += self._save_search_batch(task, store_name, batch)
+        return count
+        
+    def _save_search_batch(self, task, store_name, records):
+        with span('search.save', store=store_name, products=len(records)):
+            self.db_manager.add_products(records)
+        task.report_progress(records)
+        return len(records)
+        
+    def on_store_results(self, store_name, records):
+        """Merge a batch of one store's results into the comparison table"""
+        for record in records:
+            name = record.name
+            if name not in self.search_results:
+                self.search_results[name] = {'Product': name, 'Rimi': None, 'Maxima': None, 'Lidl': None}
+            self.search_results[name][store_name] = record.price
+            if record.image_url and name not in self.product_images:
+                self.product_images[name] = record.image_url
+            self.price_series.invalidate(name, store_name)
+            
+        # Update treeview with only the rows that changed
+        self.price_tree.set_rows(self.search_results.values())
+        self.set_store_progress(store_name, 50, "Receiving")
+        
+    def on_product_images(self, images):
+        # Photos seen in this session's searches win over older ones
+        self.product_images = {**images, **self.product_images}
+        self.price_tree.refresh()
+        
+    def show_product_image(self):
+        """Show the selected product's photo, once it has loaded"""
+        row = self.price_tree.selected_row()
+        url = self.product_images.get(row['Product']) if row else None
+        photo = self.thumbnails.image(url, 'detail')
+        self.product_image_label.configure(image=photo or '')
+        # Tk only holds the image by name, the label must keep the object alive
+        self.product_image_label.image = photo
+        
+    def on_store_finished(self, store_name, count):
+        """Show the result count, or that the store is failing rather than an empty column"""
+        value = 0 if store_health.status(store_name) == DOWN else 100
+        self.set_store_progress(store_name, value, self.store_status_text(store_name, count))
+        
+    @staticmethod
+    def store_status_text(store_name, count=None):
+        """Result count and store health for a status label; no count means the request failed"""
+        status = store_health.status(store_name)
+        if status == DOWN:
+            return "Store unavailable"
+        if count is None:
+            return "Failed"
+        if status == DEGRADED:
+            return f"{count} found, store degraded"
+        return f"{count} found"
+            
+    def cancel_search(self):
+        self.tasks.cancel_group('search')
+        for store_name, (bar, status) in self.store_progress.items():
+            if bar['value'] < 100:
+                self.set_store_progress(store_name, 0, "Cancelled")
                 
-        # Update treeview
-        for product_data in all_products.values():
-            self.price_tree.insert('', 'end', values=(
-                product_data['Product'],
-                product_data['Rimi'],
-                product_data['Maxima'],
-                product_data['Lidl']
-            ))
+    def set_store_progress(self, store_name, value, text=None):
+        bar, status = self.store_progress[store_name]
+        bar['value'] = value
+        if text is not None:
+            status['text'] = text
+            
+    @staticmethod
+    def format_price(price):
+        return f"€{price:.2f}" if price is not None else '-'
             
     def show_price_history(self):
         # Get selected item
@@ -157,8 +334,13 @@ class GroceryGuruApp:
         history_window.title("Price History")
         history_window.geometry("800x600")
         
-        # Create and show price history viewer
-        viewer = PriceHistoryViewer(history_window, self.db_manager)
+        # Create and show price history viewer for the selected product
+        viewer = PriceHistoryViewer(history_window, self.db_manager, self.price_series, self.product_index)
+        row = self.price_tree.selected_row()
+        if row:
+            store = next((s for s in self.scrapers if row.get(s) is not None), None)
+            if store:
+                viewer.select_product(row['Product'], store)
         viewer.show()
         
     def setup_shopping_list_tab(self):
@@ -172,12 +354,11 @@ class GroceryGuruApp:
         
         # Shopping list
         columns = ('Item', 'Quantity', 'Estimated Price')
-        self.shopping_tree = ttk.Treeview(self.shopping_list_frame, columns=columns, show='headings')
-        
-        for col in columns:
-            self.shopping_tree.heading(col, text=col)
-            self.shopping_tree.column(col, width=150)
-            
+        self.shopping_tree = VirtualTable(
+            self.shopping_list_frame,
+            columns,
+            formatters={'Estimated Price': self.format_price}
+        )
         self.shopping_tree.grid(row=1, column=0, pady=10, padx=10, sticky=(tk.W, tk.E))
         
     def setup_discounts_tab(self):
@@ -186,19 +367,81 @@ class GroceryGuruApp:
         store_frame.grid(row=0, column=0, pady=10, padx=10, sticky=(tk.W, tk.E))
         
         ttk.Label(store_frame, text="Select Store:").grid(row=0, column=0)
-        store_combo = ttk.Combobox(store_frame, values=['All Stores', 'Rimi', 'Maxima', 'Lidl'])
+        self.discount_store_var = tk.StringVar(value='All Stores')
+        store_combo = ttk.Combobox(
+            store_frame,
+            textvariable=self.discount_store_var,
+            values=['All Stores', 'Rimi', 'Maxima', 'Lidl']
+        )
         store_combo.grid(row=0, column=1, padx=5)
-        store_combo.set('All Stores')
+        store_combo.bind('<<ComboboxSelected>>', self.filter_discounts)
+        ttk.Button(store_frame, text="Refresh", command=self.load_discounts).grid(row=0, column=2)
+        # Per store result count or failure, so a failing store is not read as "no discounts"
+        self.discount_status = ttk.Label(store_frame)
+        self.discount_status.grid(row=0, column=3, padx=10)
+        self.discount_store_status = {}
         
         # Discounts list
         columns = ('Product', 'Store', 'Original Price', 'Discount Price', 'Valid Until')
-        self.discounts_tree = ttk.Treeview(self.discounts_frame, columns=columns, show='headings')
+        self.discounts_tree = VirtualTable(
+            self.discounts_frame,
+            columns,
+            key=lambda row: (row['Product'], row['Store']),
+            formatters={
+                'Original Price': self.format_price,
+                'Discount Price': self.format_price,
+                'Valid Until': lambda value: value or '-'
+            },
+            widths={col: 120 for col in columns}
+        )
+        self.discounts_tree.grid(row=1, column=0, pady=10, padx=10, sticky=(tk.W, tk.E))
         
-        for col in columns:
-            self.discounts_tree.heading(col, text=col)
-            self.discounts_tree.column(col, width=120)
+    def load_discounts(self):
+        """Fetch current promotions from every store into the discounts table"""
+        self.tasks.cancel_group('discounts')
+        self.discount_rows = {}
+        self.discount_store_status = {store_name: "Loading" for store_name in self.scrapers}
+        self.show_discount_status()
+        for store_name, scraper in self.scrapers.items():
+            self.tasks.submit(
+                lambda task, s=scraper: [record.to_dict() for record in s.iter_discounts()],
+                group='discounts',
+                on_result=lambda discounts, s=store_name: self.on_store_discounts(s, discounts),
+                on_error=lambda error, s=store_name: self.on_store_discounts_failed(s, error)
+            )
             
-        self.discounts_tree.grid(row=1, column=0, pady=10, padx=10, sticky=(tk.W, tk.E))
+    def show_discount_status(self):
+        self.discount_status['text'] = '   '.join(
+            f"{store_name}: {text}" for store_name, text in self.discount_store_status.items()
+        )
+        
+    def on_store_discounts_failed(self, store_name, error):
+        self.discount_store_status[store_name] = self.store_status_text(store_name)
+        self.show_discount_status()
+        
+    def on_store_discounts(self, store_name, discounts):
+        self.discount_store_status[store_name] = self.store_status_text(store_name, len(discounts))
+        self.show_discount_status()
+        self.discount_rows[store_name] = [
+            {
+                'Product': discount['name'],
+                'Store': store_name,
+                'Original Price': discount['original_price'],
+                'Discount Price': discount['discount_price'],
+                'Valid Until': discount.get('valid_until')
+            }
+            for discount in discounts
+        ]
+        self.discounts_tree.set_rows(
+            row for rows in self.discount_rows.values() for row in rows
+        )
+        
+    def filter_discounts(self, event=None):
+        """Show only the discounts of the selected store"""
+        store = self.discount_store_var.get()
+        self.discounts_tree.set_filter(
+            column_filters={'Store': None if store == 'All Stores' else store}
+        )
 
     def setup_preferences_tab(self):
         """Setup preferences tab"""
@@ -232,10 +475,43 @@ class GroceryGuruApp:
         ).pack(anchor=tk.W, padx=5, pady=2)
         
     def export_shopping_list(self):
-        """Export current shopping list to PDF"""
-        # Get current shopping list ID (you'll need to track this)
-        list_id = 1  # For demonstration, you should track the active list ID
+        """Export a shopping list to PDF, asking which one when there are several"""
+        lists = self.db_manager.get_shopping_lists()
+        if not lists:
+            messagebox.showinfo("Export", "There are no shopping lists to export")
+            return
+        if len(lists) == 1:
+            self._export_list_to_pdf(lists[0]['id'])
+            return
+            
+        chooser = tk.Toplevel(self.root)
+        chooser.title("Export Shopping List")
+        chooser.transient(self.root)
+        
+        ttk.Label(chooser, text="Shopping list:").pack(anchor=tk.W, padx=10, pady=(10, 0))
+        listbox = tk.Listbox(chooser, height=min(len(lists), 15), exportselection=False)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        for shopping_list in lists:
+            listbox.insert(tk.END, f"{shopping_list['name']} ({shopping_list['created_at']})")
+        # Start from the list exported last time, or the newest one
+        ids = [shopping_list['id'] for shopping_list in lists]
+        selected = ids.index(self.active_list_id) if self.active_list_id in ids else 0
+        listbox.selection_set(selected)
+        listbox.see(selected)
+        
+        def choose(event=None):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            self.active_list_id = ids[selection[0]]
+            chooser.destroy()
+            self._export_list_to_pdf(self.active_list_id)
+            
+        listbox.bind('<Double-Button-1>', choose)
+        ttk.Button(chooser, text="Export", command=choose).pack(pady=(0, 10))
+        chooser.grab_set()
         
+    def _export_list_to_pdf(self, list_id):
         file_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF files", "*.pdf")],
@@ -243,16 +519,63 @@ class GroceryGuruApp:
         )
         
         if file_path:
-            if self.exporter.export_to_pdf(list_id, file_path):
-                messagebox.showinfo(
+            self.tasks.submit(
+                lambda task: self.exporter.export_to_pdf(list_id, file_path),
+                group='export',
+                on_result=lambda ok: self.on_export_finished(ok, file_path),
+                on_error=lambda error: self.on_export_finished(False, file_path)
+            )
+            
+    def export_all_shopping_lists(self):
+        """Export every shopping list to its own PDF in a chosen folder"""
+        output_dir = filedialog.askdirectory(title="Export All Shopping Lists")
+        if not output_dir:
+            return
+            
+        def export(task):
+            list_ids = [shopping_list['id'] for shopping_list in self.db_manager.get_shopping_lists()]
+            results = self.exporter.export_many(list_ids, output_dir)
+            return sum(1 for path in results.values() if path)
+            
+        self.tasks.submit(
+            export,
+            group='export',
+            on_result=lambda count: messagebox.showinfo(
+                "Success",
+                f"Exported {count} shopping lists to {output_dir}"
+            ),
+            on_error=lambda error: self.on_export_finished(False, output_dir)
+        )
+        
+    def export_price_history(self):
+        """Stream the full price history to a CSV or XLSX file"""
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Excel files", "*.xlsx")],
+            title="Export Price History"
+        )
+        if file_path:
+            self.tasks.submit(
+                lambda task: self.exporter.export_price_history(file_path),
+                group='export',
+                on_result=lambda count: messagebox.showinfo(
                     "Success",
-                    f"Shopping list exported to {file_path}"
-                )
-            else:
-                messagebox.showerror(
-                    "Error",
-                    "Failed to export shopping list"
-                )
+                    f"Exported {count} price records to {file_path}"
+                ),
+                on_error=lambda error: messagebox.showerror("Error", str(error))
+            )
+            
+    def on_export_finished(self, ok, file_path):
+        if ok:
+            messagebox.showinfo(
+                "Success",
+                f"Shopping list exported to {file_path}"
+            )
+        else:
+            messagebox.showerror(
+                "Error",
+                "Failed to export shopping list"
+            )
                 
     def manage_price_alerts(self):
         """Open price alert management window"""
@@ -266,10 +589,12 @@ class GroceryGuruApp:
         
         ttk.Label(product_frame, text="Product:").pack(side=tk.LEFT)
         product_var = tk.StringVar()
-        product_combo = ttk.Combobox(
+        product_combo = AutocompleteCombobox(
             product_frame,
+            self.product_index,
             textvariable=product_var,
-            values=[p['name'] for p in self.db_manager.get_all_products()]
+            formatter=lambda name, store: name,
+            unique=True
         )
         product_combo.pack(side=tk.LEFT, padx=5)
         
@@ -320,6 +645,9 @@ class GroceryGuruApp:
         update_alerts_list()
         
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grocery Guru Latvia")
+    add_profile_argument(parser)
+    start_profiler('gui', parser.parse_args().profile)
     root = tk.Tk()
     app = GroceryGuruApp(root)
     root.mainloop()
@@ -0,0 +1,303 @@
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from a fast SQLite lookup to a slow store page
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(zip(self.labelnames, key)), 'value': value} for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', key, (('le', repr(bound)),), cumulative))
+                samples.append((f'{self.name}_bucket', key, (('le', '+Inf'),), count))
+                samples.append((f'{self.name}_sum', key, (), total))
+                samples.append((f'{self.name}_count', key, (), count))
+        return samples
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {
+                    'labels': dict(zip(self.labelnames, key)),
+                    'count': count,
+                    'sum': total,
+                    'buckets': dict(zip(map(str, self.buckets), itertools.accumulate(counts)))
+                }
+                for key, (counts, total, count) in self._values.items()
+            ]
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics with Prometheus and JSON export"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, extra, value in metric.samples():
+                lines.append(f'{name}{_format_labels(metric.labelnames, key, extra)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """Get all metrics as a JSON-serialisable dict"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {'type': metric.kind, 'help': metric.documentation, 'samples': metric.snapshot()}
+            for metric in metrics
+        }
+
+    def start_http_server(self, port=9464, host='127.0.0.1'):
+        """Serve /metrics, /metrics.json and /traces from a daemon thread"""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                elif self.path == '/traces':
+                    body = json.dumps(tracer.recent()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return self._server
+
+
+class Tracer:
+    """Optional span tracing, kept in a ring buffer of finished spans"""
+
+    def __init__(self, enabled=False, max_spans=2000):
+        self.enabled = enabled
+        self._spans = deque(maxlen=max_spans)
+        self._current = contextvars.ContextVar('current_span', default=None)
+        self._ids = itertools.count(1)
+        # When set, the spans open on each thread are kept in activity,
+        # thread id -> [(name, attributes), ...], for the sampling profiler
+        self.track_activity = False
+        self.activity = {}
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not self.track_activity:
+            if not self.enabled:
+                yield None
+                return
+            with self._traced(name, attributes) as span:
+                yield span
+            return
+        stack = self.activity.setdefault(threading.get_ident(), [])
+        stack.append((name, attributes))
+        try:
+            with self._traced(name, attributes) as span:
+                yield span
+        finally:
+            stack.pop()
+
+    @contextmanager
+    def _traced(self, name, attributes):
+        if not self.enabled:
+            yield None
+            return
+        parent = self._current.get()
+        span = {
+            'name': name,
+            'span_id': next(self._ids),
+            'parent_id': parent['span_id'] if parent else None,
+            'trace_id': parent['trace_id'] if parent else None,
+            'thread': threading.current_thread().name,
+            'attributes': attributes,
+            'start': time.time()
+        }
+        if span['trace_id'] is None:
+            span['trace_id'] = span['span_id']
+        token = self._current.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = str(e)
+            raise
+        finally:
+            span['duration'] = time.perf_counter() - start
+            self._current.reset(token)
+            self._spans.append(span)
+
+    def recent(self, trace_id=None) -> list:
+        spans = list(self._spans)
+        if trace_id is not None:
+            spans = [s for s in spans if s['trace_id'] == trace_id]
+        return spans
+
+
+class EventLoopMonitor:
+    """Measures how late Tk runs a periodic callback, i.e. event-loop stalls"""
+
+    def __init__(self, root, interval_ms=100):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.stalls = metrics.histogram(
+            'ui_event_loop_stall_seconds',
+            'Delay of the Tk event loop beyond its scheduled tick'
+        )
+        self._expected = time.perf_counter() + self.interval
+        self.root.after(interval_ms, self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.stalls.observe(max(0.0, now - self._expected))
+        self._expected = now + self.interval
+        self.root.after(int(self.interval * 1000), self._tick)
+
+
+metrics = MetricsRegistry()
+tracer = Tracer(enabled=os.environ.get('GROCERY_GURU_TRACE') == '1')
+span = tracer.span
+
+
+def instrumented(histogram_name, documentation, span_prefix, label='method'):
+    """Decorator recording call latency under a label and a trace span"""
+    histogram = metrics.histogram(histogram_name, documentation, (label,))
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(f'{span_prefix}.{fn.__name__}'), histogram.time(**{label: fn.__name__}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
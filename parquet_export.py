@@ -0,0 +1,351 @@
+"""Incremental Parquet export of price history for analytics
+
+Usage:
+    python parquet_export.py export --db grocery_guru.db --out analytics/
+    python parquet_export.py weekly --out analytics/ --store Rimi
+
+Layout under the output directory:
+
+    products.parquet                                   current products, rewritten each run
+    price_history/store=Rimi/month=2024-05/part-<first id>-<last id>.parquet
+    _export_state.json                                 high-water marks (last exported history id per shard)
+
+Each run appends new part files for rows with an id above the high-water
+mark, so nothing already exported is rewritten. A sharded database has a
+mark per shard (see sharding.py), a single file one under shard 0. Readers memory-map the
+part files and stream record batches, pruning partitions by store and
+month from the directory names. Requires pyarrow.
+"""
+import argparse
+import json
+import heapq
+import os
+import tempfile
+import time
+from datetime import datetime
+from database.sharding import connect, history_sources, watermark, watermark_floor
+from utils.metrics import span
+from utils.profiler import add_profile_argument, start_profiler
+
+STATE_FILE = '_export_state.json'
+HISTORY_DIR = 'price_history'
+PRODUCTS_FILE = 'products.parquet'
+
+# Rows fetched from SQLite and converted to Arrow at a time
+BATCH_SIZE = 200000
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.compute, pyarrow.parquet
+
+
+def history_schema():
+    pa, _, _ = _arrow()
+    return pa.schema([
+        ('id', pa.int64()),
+        ('product_id', pa.int64()),
+        ('name', pa.string()),
+        ('price', pa.float64()),
+        ('recorded_at', pa.timestamp('us'))
+    ])
+
+
+def _part_range(filename):
+    """'part-000000000101-000000000250.parquet' -> (101, 250)"""
+    first, last = filename[len('part-'):-len('.parquet')].split('-')
+    return int(first), int(last)
+
+
+class ParquetExporter:
+    """Appends new price_history rows to a store/month partitioned Parquet dataset"""
+
+    def __init__(self, db_path, output_dir, batch_size=BATCH_SIZE, compression='zstd'):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.compression = compression
+
+    @property
+    def state_path(self):
+        return os.path.join(self.output_dir, STATE_FILE)
+
+    def load_state(self) -> dict:
+        """State with 'high_water_marks' as {shard id: last exported history id}"""
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {'exports': 0}
+        # JSON keys are strings; states written before sharding have one mark
+        marks = state.pop('high_water_marks', None) or {0: state.pop('high_water_mark', 0)}
+        state['high_water_marks'] = {int(shard_id): mark for shard_id, mark in marks.items()}
+        return state
+
+    def _save_state(self, state):
+        # Same write-then-rename as preferences, a crash never leaves half a state file
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, prefix='.state.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.state_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _remove_orphans(self, marks, store_shards):
+        """Delete part files left by a run that died before saving its state
+
+        A part file is judged against the mark of its store's shard.
+        """
+        history_dir = os.path.join(self.output_dir, HISTORY_DIR)
+        for directory, _, files in os.walk(history_dir):
+            store = os.path.basename(os.path.dirname(directory)).split('=', 1)[-1]
+            floor = watermark_floor(marks, store_shards.get(store, 0))
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if filename.endswith('.tmp'):
+                    os.unlink(path)
+                elif filename.startswith('part-') and _part_range(filename)[1] > floor:
+                    os.unlink(path)
+
+    def export(self) -> dict:
+        """Export rows added since the last run, returns a summary"""
+        pa, pc, pq = _arrow()
+        os.makedirs(self.output_dir, exist_ok=True)
+        state = self.load_state()
+        start_marks = state['high_water_marks']
+        started = time.perf_counter()
+
+        conn = connect(self.db_path)
+        try:
+            sources = history_sources(conn)
+            # Single-file stores are all in shard 0, left out of the map
+            self._remove_orphans(start_marks, {store: shard_id for shard_id, _, store in sources if store})
+            # Fix the upper bounds first so rows written during the export wait for the next run
+            end_marks = dict(start_marks)
+            end_marks.update(watermark(conn))
+            products = self._export_products(conn, sources, pa, pq)
+            writers = {}
+            rows = 0
+            schema = history_schema()
+            try:
+                for shard_id, source, _ in sources:
+                    start_mark, end_mark = watermark_floor(start_marks, shard_id), end_marks[shard_id]
+                    if end_mark <= start_mark:
+                        continue
+                    # Stores live in one shard each, so writers never mix ranges of two shards
+                    cursor = conn.execute(f'''
+                        SELECT ph.id, ph.product_id, p.name, p.store, ph.price, ph.recorded_at
+                        FROM {source}.price_history ph
+                        JOIN {source}.products p ON p.id = ph.product_id
+                        WHERE ph.id > ? AND ph.id <= ?
+                        ORDER BY ph.id
+                    ''', (start_mark, end_mark))
+                    while True:
+                        batch = cursor.fetchmany(self.batch_size)
+                        if not batch:
+                            break
+                        rows += len(batch)
+                        self._write_batch(batch, writers, schema, start_mark, end_mark, pa, pc, pq)
+            finally:
+                for writer, _ in writers.values():
+                    writer.close()
+        finally:
+            conn.close()
+
+        if end_marks == start_marks:
+            return {'rows': 0, 'files': 0, 'products': products, 'high_water_marks': start_marks}
+
+        # Publish the part files, then move the high-water marks past them
+        for _, tmp_path in writers.values():
+            os.replace(tmp_path, tmp_path[:-len('.tmp')])
+        state = {
+            'high_water_marks': end_marks,
+            'exports': state.get('exports', 0) + 1,
+            'last_export': datetime.now().isoformat()
+        }
+        self._save_state(state)
+        return {
+            'rows': rows,
+            'files': len(writers),
+            'products': products,
+            'high_water_marks': end_marks,
+            'seconds': round(time.perf_counter() - started, 2)
+        }
+
+    def _write_batch(self, batch, writers, schema, start_mark, end_mark, pa, pc, pq):
+        ids, product_ids, names, stores, prices, recorded = zip(*batch)
+        table = pa.table({
+            'id': pa.array(ids, pa.int64()),
+            'product_id': pa.array(product_ids, pa.int64()),
+            'name': pa.array(names, pa.string()),
+            'price': pa.array(prices, pa.float64()),
+            'recorded_at': pa.array(recorded, pa.string()).cast(pa.timestamp('us'))
+        }, schema=schema)
+        store_column = pa.array(stores, pa.string())
+        month_column = pc.utf8_slice_codeunits(pa.array(recorded, pa.string()), 0, 7)
+        keys = pc.binary_join_element_wise(store_column, month_column, '\x00')
+
+        for key in pc.unique(keys).to_pylist():
+            store, month = key.split('\x00')
+            part = table.filter(pc.equal(keys, key))
+            if (store, month) not in writers:
+                directory = os.path.join(self.output_dir, HISTORY_DIR, f"store={store}", f"month={month}")
+                os.makedirs(directory, exist_ok=True)
+                tmp_path = os.path.join(directory, f"part-{start_mark + 1:012d}-{end_mark:012d}.parquet.tmp")
+                writers[(store, month)] = (pq.ParquetWriter(tmp_path, schema, compression=self.compression), tmp_path)
+            writers[(store, month)][0].write_table(part)
+
+    def _export_products(self, conn, sources, pa, pq):
+        rows = list(heapq.merge(*(
+            conn.execute(f'SELECT id, name, store, price, url, last_updated FROM {source}.products ORDER BY id').fetchall()
+            for _, source, _ in sources
+        )))
+        columns = list(zip(*rows)) if rows else [()] * 6
+        table = pa.table({
+            'id': pa.array(columns[0], pa.int64()),
+            'name': pa.array(columns[1], pa.string()),
+            'store': pa.array(columns[2], pa.string()),
+            'price': pa.array(columns[3], pa.float64()),
+            'url': pa.array(columns[4], pa.string()),
+            'last_updated': pa.array(columns[5], pa.string()).cast(pa.timestamp('us'))
+        })
+        tmp_path = os.path.join(self.output_dir, PRODUCTS_FILE + '.tmp')
+        pq.write_table(table, tmp_path, compression=self.compression)
+        os.replace(tmp_path, os.path.join(self.output_dir, PRODUCTS_FILE))
+        return len(rows)
+
+
+class PriceHistoryReader:
+    """Memory-mapped, streaming access to an exported dataset"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def partitions(self, stores=None, start=None, end=None):
+        """Yield (store, month, path) for part files overlapping the filters
+
+        start and end are datetimes or ISO strings, compared by month.
+        """
+        history_dir = os.path.join(self.output_dir, HISTORY_DIR)
+        start_month = str(start)[:7] if start else None
+        end_month = str(end)[:7] if end else None
+        if not os.path.isdir(history_dir):
+            return
+        for store_dir in sorted(os.listdir(history_dir)):
+            store = store_dir.split('=', 1)[1]
+            if stores and store not in stores:
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(history_dir, store_dir))):
+                month = month_dir.split('=', 1)[1]
+                if (start_month and month < start_month) or (end_month and month > end_month):
+                    continue
+                directory = os.path.join(history_dir, store_dir, month_dir)
+                for filename in sorted(os.listdir(directory)):
+                    if filename.startswith('part-') and filename.endswith('.parquet'):
+                        yield store, month, os.path.join(directory, filename)
+
+    def scan(self, columns=None, stores=None, start=None, end=None, batch_size=65536):
+        """Yield (store, RecordBatch) over matching rows, one batch in memory at a time"""
+        pa, pc, pq = _arrow()
+        start_ts = pa.scalar(datetime.fromisoformat(str(start)), pa.timestamp('us')) if start else None
+        end_ts = pa.scalar(datetime.fromisoformat(str(end)), pa.timestamp('us')) if end else None
+        read_columns = list(columns) if columns else None
+        if read_columns and (start or end) and 'recorded_at' not in read_columns:
+            read_columns.append('recorded_at')
+
+        for store, month, path in self.partitions(stores, start, end):
+            # Memory-mapped so pages come from the OS cache instead of being copied in
+            with pa.memory_map(path, 'r') as source:
+                parquet_file = pq.ParquetFile(source)
+                for batch in parquet_file.iter_batches(batch_size=batch_size, columns=read_columns):
+                    if start_ts is not None or end_ts is not None:
+                        mask = None
+                        if start_ts is not None:
+                            mask = pc.greater_equal(batch.column('recorded_at'), start_ts)
+                        if end_ts is not None:
+                            upper = pc.less(batch.column('recorded_at'), end_ts)
+                            mask = upper if mask is None else pc.and_(mask, upper)
+                        batch = batch.filter(mask)
+                        if columns and 'recorded_at' not in columns:
+                            batch = batch.select(list(columns))
+                    if batch.num_rows:
+                        yield store, batch
+
+    def read_table(self, columns=None, stores=None, start=None, end=None):
+        """Collect a filtered scan into one Arrow table with a store column"""
+        pa, _, _ = _arrow()
+        tables = []
+        for store, batch in self.scan(columns, stores, start, end):
+            table = pa.Table.from_batches([batch])
+            tables.append(table.append_column('store', pa.array([store] * table.num_rows, pa.string())))
+        if not tables:
+            return None
+        return pa.concat_tables(tables)
+
+    def products(self):
+        _, _, pq = _arrow()
+        return pq.read_table(os.path.join(self.output_dir, PRODUCTS_FILE), memory_map=True)
+
+    def weekly_average(self, stores=None, start=None, end=None) -> list:
+        """Average price per store per week (weeks start on Monday), aggregated batch by batch"""
+        pa, pc, _ = _arrow()
+        totals = {}
+        for store, batch in self.scan(['price', 'recorded_at'], stores, start, end):
+            weeks = pc.floor_temporal(batch.column('recorded_at'), unit='week', week_starts_monday=True)
+            grouped = pa.table({'price': batch.column('price'), 'week': weeks}).group_by('week').aggregate(
+                [('price', 'sum'), ('price', 'count')]
+            )
+            for week, price_sum, price_count in zip(
+                grouped.column('week').to_pylist(),
+                grouped.column('price_sum').to_pylist(),
+                grouped.column('price_count').to_pylist()
+            ):
+                total = totals.setdefault((store, week), [0.0, 0])
+                total[0] += price_sum
+                total[1] += price_count
+        return [
+            {'store': store, 'week': week.date().isoformat(), 'avg_price': round(price_sum / count, 4), 'rows': count}
+            for (store, week), (price_sum, count) in sorted(totals.items())
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet analytics export of Grocery Guru price history")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="append new rows to the dataset")
+    export_parser.add_argument('--db', default='grocery_guru.db')
+    export_parser.add_argument('--out', default='analytics')
+
+    weekly_parser = commands.add_parser('weekly', help="average price by store per week")
+    weekly_parser.add_argument('--out', default='analytics')
+    weekly_parser.add_argument('--store', action='append', help="limit to a store, can be repeated")
+    weekly_parser.add_argument('--start', help="ISO date")
+    weekly_parser.add_argument('--end', help="ISO date")
+
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    start_profiler(f"parquet-{args.command}", args.profile)
+    with span(f"parquet.{args.command}"):
+        if args.command == 'export':
+            summary = ParquetExporter(args.db, args.out).export()
+            print(json.dumps(summary, indent=2))
+        else:
+            started = time.perf_counter()
+            rows = PriceHistoryReader(args.out).weekly_average(args.store, args.start, args.end)
+            for row in rows:
+                print(f"{row['store']:<8} {row['week']}  {row['avg_price']:8.3f}  ({row['rows']} rows)")
+            print(f"{len(rows)} weeks in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Scrape with network I/O on threads and parsing in worker processes
+
+BeautifulSoup and the per-card loops are CPU-bound and hold the GIL, so
+more fetch threads in one process only queue up behind one core.
+ParsePipeline splits scraping into two stages:
+
+    fetch   threads that only download raw page bytes (BaseScraper.fetch)
+    parse   a ProcessPoolExecutor running BaseScraper.parse on those bytes
+
+Bounded queues sit between the stages. When parsing falls behind, the
+fetchers block instead of piling pages up in memory. When the caller
+stops reading results, parsing stops too.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from utils.metrics import metrics, span
+from utils.profiler import start_profiler
+from .base_scraper import PARSE_SECONDS
+
+PIPELINE_PAGES = metrics.counter('parse_pipeline_pages_total', 'Pages through the parse pipeline by outcome', ('store', 'kind', 'outcome'))
+QUEUED_PAGES = metrics.gauge('parse_pipeline_queued_pages', 'Downloaded pages waiting for a parse worker')
+
+# kind is a BaseScraper page kind: 'search', 'promotions' or 'product'.
+# tag is carried through untouched for the caller, e.g. the crawl task.
+PageJob = namedtuple('PageJob', 'store kind target tag', defaults=(None, None))
+
+_DONE = object()
+
+# Scrapers built inside a parse worker process, one per class and base URL
+_worker_scrapers = {}
+
+
+def parse_in_worker(scraper_class, base_url, kind, body):
+    """Parse stage, run in a worker process: returns (path, results list, seconds)
+
+    Records come back through pickle as compact slotted objects.
+    """
+    start = time.perf_counter()
+    scraper = _worker_scrapers.get((scraper_class, base_url))
+    if scraper is None:
+        scraper = _worker_scrapers[(scraper_class, base_url)] = scraper_class()
+        scraper.base_url = base_url
+    with span('parse', store=scraper.store_name, endpoint=kind):
+        path, results = scraper.parse(kind, body)
+        results = list(results)
+    return path, results, time.perf_counter() - start
+
+
+def _pool_context():
+    # Forking a process with live fetch threads can copy held locks, so start clean workers
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class ParsePipeline:
+    """Fetch pages on threads and parse them in a process pool
+
+    parse_workers=0 parses on the fetch threads instead, the old behaviour,
+    which is useful for comparison.
+    """
+
+    def __init__(self, scrapers, fetch_workers=8, parse_workers=None, max_pending=None):
+        self.scrapers = scrapers
+        self.fetch_workers = fetch_workers
+        self.parse_workers = multiprocessing.cpu_count() if parse_workers is None else parse_workers
+        # Pages downloaded but not yet handed back to the caller, across both queues
+        self.max_pending = max_pending or max(4, self.parse_workers * 4)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=_pool_context(),
+                initializer=start_profiler,
+                initargs=('parse-worker',)
+            )
+        return self._pool
+
+    def run(self, jobs, before_fetch=None):
+        """Yield (job, results, error) for each PageJob as soon as it is parsed
+
+        Results come back in completion order, not job order. before_fetch(job)
+        runs on the fetch thread just before each download, e.g. to rate limit.
+        """
+        jobs = iter(jobs)
+        jobs_lock = threading.Lock()
+        stop = threading.Event()
+        pages = queue.Queue(maxsize=self.max_pending)
+        results = queue.Queue()
+        # One slot per page between download and the caller taking its result
+        slots = threading.BoundedSemaphore(self.max_pending)
+
+        def put(q, item):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def fetch_loop():
+            try:
+                while not stop.is_set():
+                    with jobs_lock:
+                        job = next(jobs, None)
+                    if job is None:
+                        break
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    scraper = self.scrapers[job.store]
+                    try:
+                        if before_fetch is not None:
+                            before_fetch(job)
+                        body = scraper.fetch(job.kind, job.target)
+                    except Exception as e:
+                        results.put((job, None, e))
+                        continue
+                    if self.parse_workers == 0:
+                        try:
+                            results.put((job, scraper.parse_page(job.kind, body), None))
+                        except Exception as e:
+                            results.put((job, None, e))
+                        continue
+                    if not put(pages, (job, scraper, body)):
+                        return
+                    QUEUED_PAGES.set(pages.qsize())
+            finally:
+                put(pages, _DONE)
+
+        # Parses submitted but whose result is not yet queued
+        parsing = [0]
+        parsing_done = threading.Condition()
+
+        def dispatch_loop():
+            finished_fetchers = 0
+            while finished_fetchers < self.fetch_workers and not stop.is_set():
+                try:
+                    item = pages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    finished_fetchers += 1
+                    continue
+                QUEUED_PAGES.set(pages.qsize())
+                job, scraper, body = item
+                with parsing_done:
+                    parsing[0] += 1
+                future = self._executor().submit(parse_in_worker, type(scraper), scraper.base_url, job.kind, body)
+                future.add_done_callback(lambda f, job=job, scraper=scraper: on_parsed(job, scraper, f))
+            with parsing_done:
+                while parsing[0] and not stop.is_set():
+                    parsing_done.wait(0.1)
+            results.put(_DONE)
+
+        def on_parsed(job, scraper, future):
+            try:
+                path, parsed, seconds = future.result()
+                PARSE_SECONDS.observe(seconds, store=scraper.store_name, endpoint=job.kind)
+                scraper._record_extraction(job.kind, path)
+                results.put((job, parsed, None))
+            except Exception as e:
+                results.put((job, None, e))
+            finally:
+                with parsing_done:
+                    parsing[0] -= 1
+                    parsing_done.notify_all()
+
+        fetchers = [
+            threading.Thread(target=fetch_loop, daemon=True, name=f"fetch-{i}")
+            for i in range(self.fetch_workers)
+        ]
+        dispatcher = threading.Thread(target=dispatch_loop, daemon=True, name='parse-dispatch')
+        for thread in fetchers:
+            thread.start()
+        dispatcher.start()
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                job, parsed, error = item
+                slots.release()
+                PIPELINE_PAGES.inc(store=job.store, kind=job.kind, outcome='error' if error else 'ok')
+                if error is not None:
+                    logging.error(f"Error scraping {job.store} {job.kind} {job.target}: {str(error)}")
+                yield job, parsed, error
+        finally:
+            stop.set()
+            for thread in fetchers:
+                thread.join()
+            dispatcher.join()
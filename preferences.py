@@ -1,10 +1,58 @@
+import atexit
+import copy
 import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
 from pathlib import Path
 
+
+class SQLiteAlertStore:
+    """Price alerts kept in SQLite so each change writes one row"""
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS price_alerts (
+                    product_name TEXT PRIMARY KEY,
+                    max_price REAL NOT NULL
+                )
+            ''')
+
+    def get_all(self) -> dict:
+        with sqlite3.connect(self.db_path) as conn:
+            return dict(conn.execute('SELECT product_name, max_price FROM price_alerts'))
+
+    def set(self, product_name, max_price):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT INTO price_alerts (product_name, max_price) VALUES (?, ?)
+                ON CONFLICT(product_name) DO UPDATE SET max_price = excluded.max_price
+            ''', (product_name, max_price))
+
+    def set_many(self, alerts: dict):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany('''
+                INSERT INTO price_alerts (product_name, max_price) VALUES (?, ?)
+                ON CONFLICT(product_name) DO UPDATE SET max_price = excluded.max_price
+            ''', alerts.items())
+
+    def remove(self, product_name):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('DELETE FROM price_alerts WHERE product_name = ?', (product_name,))
+
+
 class PreferencesManager:
-    def __init__(self):
-        self.preferences_file = Path.home() / '.grocery_guru' / 'preferences.json'
+    # Seconds to wait for more changes before writing the file
+    FLUSH_DELAY = 0.5
+    # Minimum seconds between mtime checks for changes made by other processes
+    RELOAD_CHECK_INTERVAL = 1.0
+
+    def __init__(self, preferences_file=None, alerts_backend=None):
+        self.preferences_file = Path(preferences_file) if preferences_file else Path.home() / '.grocery_guru' / 'preferences.json'
         self.default_preferences = {
             'favorite_stores': [],
             'price_alerts': {},  # product_name: max_price
@@ -13,64 +61,235 @@ class PreferencesManager:
             'theme': 'light',
             'export_format': 'pdf',
             'notification_enabled': True,
-            'check_interval_hours': 24
+            'check_interval_hours': 24,
+            'alerts_backend': 'json'  # or 'sqlite' for large alert sets
         }
+        self.observers = {}  # key -> list of callback(key, old_value, new_value)
+        self._lock = threading.RLock()
+        self._dirty_keys = set()
+        # Products whose alert we added, changed or removed since the last write
+        self._dirty_alerts = set()
+        self._flush_timer = None
+        self._mtime = None
+        self._last_reload_check = 0.0
+        self.alert_store = None
         self.load_preferences()
-        
+
+        backend = alerts_backend or self.preferences.get('alerts_backend', 'json')
+        if backend == 'sqlite':
+            self.alert_store = SQLiteAlertStore(self.preferences_file.with_name('alerts.db'))
+            self._migrate_alerts()
+        atexit.register(self.flush)
+
     def load_preferences(self):
         """Load user preferences from file"""
         try:
             self.preferences_file.parent.mkdir(parents=True, exist_ok=True)
             if self.preferences_file.exists():
-                with open(self.preferences_file, 'r', encoding='utf-8') as f:
-                    self.preferences = {**self.default_preferences, **json.load(f)}
+                self.preferences = self._read_file()
             else:
-                self.preferences = self.default_preferences
-                self.save_preferences()
+                self.preferences = copy.deepcopy(self.default_preferences)
+                self._dirty_keys.update(self.preferences)
+                self.flush()
         except Exception as e:
             print(f"Error loading preferences: {e}")
-            self.preferences = self.default_preferences
-            
-    def save_preferences(self):
-        """Save user preferences to file"""
+            self.preferences = copy.deepcopy(self.default_preferences)
+
+    def _read_file(self):
+        with open(self.preferences_file, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        self._mtime = os.stat(self.preferences_file).st_mtime_ns
+        return {**copy.deepcopy(self.default_preferences), **stored}
+
+    def reload_if_changed(self):
+        """Pick up changes another process wrote, keeping our unsaved ones"""
+        now = time.monotonic()
+        if now - self._last_reload_check < self.RELOAD_CHECK_INTERVAL:
+            return
+        self._last_reload_check = now
         try:
-            with open(self.preferences_file, 'w', encoding='utf-8') as f:
-                json.dump(self.preferences, f, indent=4)
-        except Exception as e:
-            print(f"Error saving preferences: {e}")
-            
+            mtime = os.stat(self.preferences_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            try:
+                self._merge_stored()
+            except Exception as e:
+                print(f"Error reloading preferences: {e}")
+
+    def _merge_stored(self):
+        """Take the file's values for every key we have not changed ourselves
+
+        Price alerts merge per product, so alerts added by two processes
+        are both kept.
+        """
+        stored = self._read_file()
+        for key, value in stored.items():
+            if key == 'price_alerts' and self._dirty_alerts:
+                value = self._merge_alerts(value)
+            elif key in self._dirty_keys:
+                continue
+            self._update(key, value)
+
+    def _merge_alerts(self, stored):
+        ours = self.preferences.get('price_alerts') or {}
+        merged = dict(stored or {})
+        for product_name in self._dirty_alerts:
+            if product_name in ours:
+                merged[product_name] = ours[product_name]
+            else:
+                merged.pop(product_name, None)
+        return merged
+
+    def save_preferences(self):
+        """Schedule a write of changed preferences, batching rapid changes"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._flush_timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Write preferences now, atomically replacing the file"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._dirty_keys:
+                return
+            try:
+                # Another process may have written since we last read; keep its changes
+                try:
+                    changed = os.stat(self.preferences_file).st_mtime_ns != self._mtime
+                except FileNotFoundError:
+                    changed = False
+                if changed:
+                    self._merge_stored()
+                preferences = self.preferences
+                if self.alert_store is not None:
+                    preferences = {**preferences, 'price_alerts': {}}
+                # Write next to the target so the rename stays on one filesystem
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=self.preferences_file.parent,
+                    prefix='.preferences.',
+                    suffix='.tmp'
+                )
+                try:
+                    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                        json.dump(preferences, f, separators=(',', ':'), ensure_ascii=False)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.preferences_file)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+                self._mtime = os.stat(self.preferences_file).st_mtime_ns
+                self._dirty_keys.clear()
+                self._dirty_alerts.clear()
+            except Exception as e:
+                print(f"Error saving preferences: {e}")
+
+    def subscribe(self, key, callback):
+        """Call callback(key, old_value, new_value) whenever key changes
+        
+        Changes merged from another process's writes may be delivered on
+        the flush timer's thread, so GUI callbacks should hand the work to
+        their own thread (e.g. with root.after).
+        """
+        self.observers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, key, callback):
+        if callback in self.observers.get(key, []):
+            self.observers[key].remove(callback)
+
+    def _update(self, key, value):
+        """Store a value and notify observers only if it actually changed"""
+        old_value = self.preferences.get(key)
+        if old_value == value:
+            return False
+        self.preferences[key] = value
+        self._notify(key, old_value, value)
+        return True
+
+    def _notify(self, key, old_value, new_value):
+        for callback in list(self.observers.get(key, [])):
+            try:
+                callback(key, old_value, new_value)
+            except Exception as e:
+                print(f"Error in preference observer: {e}")
+
+    def _set(self, key, value):
+        with self._lock:
+            old_value = self.preferences.get(key)
+            if self._update(key, value):
+                self._dirty_keys.add(key)
+                if key == 'price_alerts':
+                    old_value, value = old_value or {}, value or {}
+                    self._dirty_alerts.update(
+                        name for name in old_value.keys() | value.keys()
+                        if old_value.get(name) != value.get(name)
+                    )
+                self.save_preferences()
+
     def get_preference(self, key):
         """Get a specific preference value"""
+        self.reload_if_changed()
         return self.preferences.get(key, self.default_preferences.get(key))
-        
+
     def set_preference(self, key, value):
         """Set a specific preference value"""
-        self.preferences[key] = value
-        self.save_preferences()
-        
+        self._set(key, value)
+
     def add_price_alert(self, product_name, max_price):
         """Add a price alert for a specific product"""
-        self.preferences['price_alerts'][product_name] = max_price
-        self.save_preferences()
-        
+        if self.alert_store is not None:
+            alerts = self.alert_store.get_all()
+            self.alert_store.set(product_name, max_price)
+            if alerts.get(product_name) != max_price:
+                self._notify('price_alerts', alerts, {**alerts, product_name: max_price})
+            return
+        self._set('price_alerts', {**self.get_price_alerts(), product_name: max_price})
+
     def remove_price_alert(self, product_name):
         """Remove a price alert for a specific product"""
-        if product_name in self.preferences['price_alerts']:
-            del self.preferences['price_alerts'][product_name]
-            self.save_preferences()
-            
+        if self.alert_store is not None:
+            alerts = self.alert_store.get_all()
+            if product_name in alerts:
+                self.alert_store.remove(product_name)
+                self._notify('price_alerts', alerts, {k: v for k, v in alerts.items() if k != product_name})
+            return
+        alerts = self.get_price_alerts()
+        if product_name in alerts:
+            self._set('price_alerts', {k: v for k, v in alerts.items() if k != product_name})
+
     def toggle_favorite_store(self, store_name):
         """Toggle a store as favorite"""
-        if store_name in self.preferences['favorite_stores']:
-            self.preferences['favorite_stores'].remove(store_name)
+        stores = list(self.get_favorite_stores())
+        if store_name in stores:
+            stores.remove(store_name)
         else:
-            self.preferences['favorite_stores'].append(store_name)
-        self.save_preferences()
-        
+            stores.append(store_name)
+        self._set('favorite_stores', stores)
+
     def get_price_alerts(self):
         """Get all price alerts"""
-        return self.preferences['price_alerts']
-        
+        if self.alert_store is not None:
+            return self.alert_store.get_all()
+        return self.get_preference('price_alerts')
+
     def get_favorite_stores(self):
         """Get list of favorite stores"""
-        return self.preferences['favorite_stores']
+        return self.get_preference('favorite_stores')
+
+    def _migrate_alerts(self):
+        """Move alerts out of the JSON file when switching to the SQLite backend"""
+        alerts = self.preferences.get('price_alerts')
+        if alerts:
+            self.alert_store.set_many(alerts)
+            with self._lock:
+                self.preferences['price_alerts'] = {}
+                self._dirty_keys.add('price_alerts')
+                self.flush()
@@ -1,116 +1,263 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import pandas as pd
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import matplotlib.dates as mdates
+from utils.autocomplete import AutocompleteCombobox
+
+TIME_RANGES = OrderedDict([
+    ("1 Week", 7),
+    ("1 Month", 30),
+    ("3 Months", 90),
+    ("6 Months", 180),
+    ("1 Year", 365)
+])
+
+
+def lttb(x, y, threshold):
+    """Downsample a series with Largest-Triangle-Three-Buckets
+
+    Keeps the first and last points and, from every bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Preserves the visual shape of the
+    series far better than taking every n-th point.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    bucket_size = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third triangle vertex
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+class PriceSeriesCache:
+    """LRU cache of parsed price series per (product, store, range)"""
+
+    def __init__(self, db_manager, max_entries=64):
+        self.db_manager = db_manager
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, product_name: str, store: str, days: int, max_points: int = None):
+        """Get (dates, prices) as float arrays in chronological order
+
+        With max_points the series is downsampled with lttb, and the
+        downsampled copy is what gets cached.
+        """
+        key = (product_name, store, days, max_points)
+        series = self._entries.get(key)
+        if series is not None:
+            self._entries.move_to_end(key)
+            return series
+
+        series = self.load(product_name, store, days)
+        if max_points:
+            series = lttb(series[0], series[1], max_points)
+        self._entries[key] = series
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return series
+
+    def load(self, product_name: str, store: str, days: int):
+        """Load and parse one series from the database, bypassing the cache"""
+        history = self.db_manager.get_product_price_history_by_name(product_name, store)
+        start_date = datetime.now() - timedelta(days=days)
+
+        dates = []
+        prices = []
+        # History comes newest first; stop at the start of the range
+        for price, recorded_at in history:
+            recorded = datetime.fromisoformat(recorded_at)
+            if recorded < start_date:
+                break
+            dates.append(recorded)
+            prices.append(price)
+        dates.reverse()
+        prices.reverse()
+        return (
+            np.asarray(mdates.date2num(dates), dtype=float) if dates else np.empty(0),
+            np.asarray(prices, dtype=float)
+        )
+
+    def invalidate(self, product_name: str = None, store: str = None):
+        """Drop cached series for a product, or everything"""
+        if product_name is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k[0] == product_name and (store is None or k[1] == store)]:
+            del self._entries[key]
+
 
 class PriceHistoryViewer:
-    def __init__(self, parent, db_manager):
+    # Series shorter than this are drawn with point markers
+    MARKER_LIMIT = 60
+
+    def __init__(self, parent, db_manager, series_cache=None, product_index=None):
         self.parent = parent
         self.db_manager = db_manager
-        
+        self.product_index = product_index
+        self.series_cache = series_cache or PriceSeriesCache(db_manager)
+        self.overlay = []  # (product_name, store) pairs drawn besides the selection
+        self.lines = {}  # (product_name, store) -> Line2D
+
         # Create main frame
         self.frame = ttk.Frame(parent)
         self.setup_ui()
-        
+
     def setup_ui(self):
         # Product selection
         selection_frame = ttk.Frame(self.frame)
         selection_frame.pack(fill=tk.X, padx=10, pady=5)
-        
+
         ttk.Label(selection_frame, text="Select Product:").pack(side=tk.LEFT)
         self.product_var = tk.StringVar()
-        self.product_combo = ttk.Combobox(selection_frame, textvariable=self.product_var)
+        if self.product_index is not None:
+            self.product_combo = AutocompleteCombobox(
+                selection_frame,
+                self.product_index,
+                textvariable=self.product_var,
+                width=40
+            )
+        else:
+            self.product_combo = ttk.Combobox(selection_frame, textvariable=self.product_var)
         self.product_combo.pack(side=tk.LEFT, padx=5)
-        
+        ttk.Button(selection_frame, text="Add to Chart", command=self.add_overlay).pack(side=tk.LEFT, padx=5)
+        ttk.Button(selection_frame, text="Clear Chart", command=self.clear_overlay).pack(side=tk.LEFT)
+
         # Time range selection
         range_frame = ttk.Frame(self.frame)
         range_frame.pack(fill=tk.X, padx=10, pady=5)
-        
+
         ttk.Label(range_frame, text="Time Range:").pack(side=tk.LEFT)
         self.range_var = tk.StringVar(value="1 Month")
-        ranges = ["1 Week", "1 Month", "3 Months", "6 Months", "1 Year"]
-        range_combo = ttk.Combobox(range_frame, values=ranges, textvariable=self.range_var)
+        range_combo = ttk.Combobox(range_frame, values=list(TIME_RANGES), textvariable=self.range_var)
         range_combo.pack(side=tk.LEFT, padx=5)
-        
-        # Create matplotlib figure
-        self.figure, self.ax = plt.subplots(figsize=(8, 4))
+
+        # Create matplotlib figure outside of pyplot so no global state leaks
+        self.figure = Figure(figsize=(8, 4))
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlabel("Date")
+        self.ax.set_ylabel("Price (€)")
+        self.ax.grid(True)
+        locator = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+        self.ax.tick_params(axis='x', labelrotation=45)
+        self.figure.subplots_adjust(left=0.1, right=0.97, top=0.9, bottom=0.2)
+
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        
+
         # Bind events
         self.product_combo.bind('<<ComboboxSelected>>', self.update_graph)
         range_combo.bind('<<ComboboxSelected>>', self.update_graph)
-        
+
     def load_products(self):
         """Load available products into combobox"""
+        if self.product_index is not None:
+            # Suggestions come from the index as the user types
+            return
+            
         # Get products from database
         products = self.db_manager.get_all_products()
         self.product_combo['values'] = [f"{p['name']} ({p['store']})" for p in products]
         if products:
             self.product_combo.current(0)
-            
-    def update_graph(self, event=None):
-        """Update the price history graph"""
-        self.ax.clear()
-        
-        # Get selected product
+
+    def selected_product(self):
+        """Parse the combobox selection into (product_name, store)"""
         selected = self.product_var.get()
-        if not selected:
-            return
-            
-        # Parse product name and store
-        product_name = selected.split(" (")[0]
-        store = selected.split("(")[1].rstrip(")")
-        
-        # Get time range
-        range_text = self.range_var.get()
-        if range_text == "1 Week":
-            days = 7
-        elif range_text == "1 Month":
-            days = 30
-        elif range_text == "3 Months":
-            days = 90
-        elif range_text == "6 Months":
-            days = 180
-        else:  # 1 Year
-            days = 365
-            
-        # Get price history data
-        history = self.db_manager.get_product_price_history_by_name(product_name, store)
+        if not selected or " (" not in selected:
+            return None
+        product_name, store = selected.rsplit(" (", 1)
+        return product_name, store.rstrip(")")
+
+    def add_overlay(self):
+        """Keep the current product on the chart when the selection changes"""
+        product = self.selected_product()
+        if product and product not in self.overlay:
+            self.overlay.append(product)
+            self.update_graph()
+
+    def clear_overlay(self):
+        self.overlay = []
+        self.update_graph()
+
+    def select_product(self, product_name: str, store: str):
+        self.product_var.set(f"{product_name} ({store})")
         
-        if history:
-            # Convert to pandas DataFrame
-            df = pd.DataFrame(history, columns=['price', 'date'])
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # Filter by time range
-            start_date = datetime.now() - timedelta(days=days)
-            df = df[df['date'] >= start_date]
-            
-            # Plot data
-            self.ax.plot(df['date'], df['price'], marker='o')
-            self.ax.set_title(f"Price History: {product_name}")
-            self.ax.set_xlabel("Date")
-            self.ax.set_ylabel("Price (€)")
-            self.ax.grid(True)
-            
-            # Rotate x-axis labels for better readability
-            plt.xticks(rotation=45)
-            
-            # Adjust layout to prevent label cutoff
-            self.figure.tight_layout()
-            
+    def update_graph(self, event=None):
+        """Update the price history graph"""
+        days = TIME_RANGES.get(self.range_var.get(), 365)
+        products = list(self.overlay)
+        selected = self.selected_product()
+        if selected and selected not in products:
+            products.append(selected)
+
+        # Never draw more points than the axes has pixels
+        max_points = max(int(self.ax.get_window_extent().width), 100)
+
+        # Drop lines of products no longer shown
+        for product in [p for p in self.lines if p not in products]:
+            self.lines.pop(product).remove()
+
+        for product in products:
+            dates, prices = self.series_cache.get(product[0], product[1], days, max_points)
+            line = self.lines.get(product)
+            if line is None:
+                line, = self.ax.plot([], [], label=f"{product[0]} ({product[1]})")
+                self.lines[product] = line
+            # Update existing artists in place instead of re-plotting
+            line.set_data(dates, prices)
+            line.set_marker('o' if len(dates) <= self.MARKER_LIMIT else '')
+
+        if len(products) == 1:
+            self.ax.set_title(f"Price History: {products[0][0]}")
+        else:
+            self.ax.set_title("Price History")
+        legend = self.ax.get_legend()
+        if len(products) > 1:
+            self.ax.legend(loc='upper left', fontsize='small')
+        elif legend:
+            legend.remove()
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+
         # Update canvas
-        self.canvas.draw()
-        
+        self.canvas.draw_idle()
+
     def show(self):
         """Show the price history viewer"""
         self.frame.pack(fill=tk.BOTH, expand=True)
         self.load_products()
         self.update_graph()
-        
+
     def hide(self):
         """Hide the price history viewer"""
         self.frame.pack_forget()
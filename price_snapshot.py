@@ -0,0 +1,365 @@
+"""Read-optimised file of the latest price of every (product, store)
+
+The file is rebuilt from the products table and swapped in with
+os.replace, so readers mmap it without locks and never touch SQLite.
+A reader that still has the old file mapped keeps a consistent view
+until it notices the new one.
+
+Layout, little-endian, every array 8-byte aligned:
+
+    header            magic, format, counts, built_at, price_history version
+    section offsets   one uint64 per section below
+    stores            uint32 offsets into the store blob, then the blob
+    names             uint32 offsets into the name blob (sorted names), then the blob
+    entry_start       uint32 per name, its first entry (names own a run of entries)
+    entry_store       uint16 per entry
+    entry_price       int32 cents per entry
+    entry_updated     int64 epoch seconds per entry
+    lowest_price      int32 cents per name
+    lowest_store      uint16 per name
+
+Store indexes are uint16, so a snapshot holds at most MAX_STORES stores.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+from database.sharding import connect
+from utils.metrics import metrics
+
+MAGIC = b'GGLP'
+FORMAT_VERSION = 2
+MAX_STORES = 1 << 16
+HEADER = struct.Struct('<4sIIIIdQ')
+SECTIONS = (
+    'store_offsets', 'store_blob', 'name_offsets', 'name_blob', 'entry_start',
+    'entry_store', 'entry_price', 'entry_updated', 'lowest_price', 'lowest_store'
+)
+SECTION_TABLE = struct.Struct(f"<{len(SECTIONS)}Q")
+
+BUILD_SECONDS = metrics.histogram('price_snapshot_build_seconds', 'Time to rebuild the latest-price snapshot')
+
+
+def _align(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 8))
+
+
+def _timestamp(value):
+    if not value:
+        return 0
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return 0
+
+
+def build_snapshot(db_path, path):
+    """Write the latest prices in db_path to path atomically, returns the entry count"""
+    start = time.perf_counter()
+    with connect(db_path) as conn:
+        version = conn.execute('SELECT COALESCE(MAX(id), 0) FROM price_history').fetchone()[0]
+        rows = conn.execute('SELECT name, store, price, last_updated FROM products').fetchall()
+    # Sort on the encoded bytes, which is the order lookups compare in
+    rows = sorted(((name.encode('utf-8'), store, price, updated) for name, store, price, updated in rows))
+
+    stores = sorted({store for _, store, _, _ in rows})
+    if len(stores) > MAX_STORES:
+        raise ValueError(f"{db_path} has {len(stores)} stores, a price snapshot holds at most {MAX_STORES}")
+    store_ids = {store: i for i, store in enumerate(stores)}
+    names = []
+    entry_start = []
+    entry_store = []
+    entry_price = []
+    entry_updated = []
+    lowest_price = []
+    lowest_store = []
+    for encoded, store, price, updated in rows:
+        cents = round(price * 100)
+        if not names or names[-1] != encoded:
+            names.append(encoded)
+            entry_start.append(len(entry_price))
+            lowest_price.append(cents)
+            lowest_store.append(store_ids[store])
+        elif cents < lowest_price[-1]:
+            lowest_price[-1] = cents
+            lowest_store[-1] = store_ids[store]
+        entry_store.append(store_ids[store])
+        entry_price.append(cents)
+        entry_updated.append(_timestamp(updated))
+    entry_start.append(len(entry_price))
+
+    def offsets_and_blob(strings):
+        offsets, blob = [0], bytearray()
+        for value in strings:
+            blob.extend(value)
+            offsets.append(len(blob))
+        return struct.pack(f"<{len(offsets)}I", *offsets), bytes(blob)
+
+    store_offsets, store_blob = offsets_and_blob(store.encode('utf-8') for store in stores)
+    name_offsets, name_blob = offsets_and_blob(names)
+    sections = {
+        'store_offsets': store_offsets,
+        'store_blob': store_blob,
+        'name_offsets': name_offsets,
+        'name_blob': name_blob,
+        'entry_start': struct.pack(f"<{len(entry_start)}I", *entry_start),
+        'entry_store': struct.pack(f"<{len(entry_store)}H", *entry_store),
+        'entry_price': struct.pack(f"<{len(entry_price)}i", *entry_price),
+        'entry_updated': struct.pack(f"<{len(entry_updated)}q", *entry_updated),
+        'lowest_price': struct.pack(f"<{len(lowest_price)}i", *lowest_price),
+        'lowest_store': struct.pack(f"<{len(lowest_store)}H", *lowest_store)
+    }
+
+    buffer = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, len(names), len(entry_price), len(stores), time.time(), version))
+    buffer.extend(b'\0' * SECTION_TABLE.size)
+    _align(buffer)
+    offsets = []
+    for section in SECTIONS:
+        offsets.append(len(buffer))
+        buffer.extend(sections[section])
+        _align(buffer)
+    buffer[HEADER.size:HEADER.size + SECTION_TABLE.size] = SECTION_TABLE.pack(*offsets)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.prices.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    BUILD_SECONDS.observe(time.perf_counter() - start)
+    return len(entry_price)
+
+
+class PriceSnapshot:
+    """Zero-copy lookups into a snapshot file, remapped when it is replaced"""
+
+    # Minimum seconds between checks for a newer file
+    RELOAD_CHECK_INTERVAL = 1.0
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._identity = None
+        self._last_check = 0.0
+        self._view = None
+        self.reload()
+
+    def reload(self) -> bool:
+        """Map the file if it changed since it was last mapped, returns whether it did"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return False
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            view = _SnapshotView(mapped)
+        except ValueError as e:
+            # e.g. written in an older format; unavailable until it is rebuilt
+            self._identity = identity
+            logging.warning(f"Ignoring price snapshot {self.path}: {str(e)}")
+            return False
+        # Swapping one reference keeps readers lock-free: each call uses whichever view it grabbed
+        with self._lock:
+            self._view, self._identity = view, identity
+        return True
+
+    def _current(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.RELOAD_CHECK_INTERVAL:
+            self._last_check = now
+            try:
+                self.reload()
+            except Exception as e:
+                logging.error(f"Error reloading price snapshot: {str(e)}")
+        return self._view
+
+    @property
+    def available(self) -> bool:
+        return self._current() is not None
+
+    @property
+    def version(self) -> int:
+        view = self._current()
+        return view.version if view else 0
+
+    @property
+    def built_at(self) -> float:
+        view = self._current()
+        return view.built_at if view else 0.0
+
+    def __len__(self):
+        view = self._current()
+        return view.entry_count if view else 0
+
+    def prices(self, name) -> dict:
+        """{store: price} for a product name, empty if unknown"""
+        view = self._current()
+        if view is None:
+            return {}
+        index = view.find(name)
+        if index is None:
+            return {}
+        return {view.stores[store]: cents / 100 for store, cents, _ in view.entries(index)}
+
+    def price(self, name, store):
+        return self.prices(name).get(store)
+
+    def lowest(self, name):
+        """(price, store) of the cheapest store for a product, or None"""
+        view = self._current()
+        if view is None:
+            return None
+        index = view.find(name)
+        if index is None:
+            return None
+        return view.lowest_price[index] / 100, view.stores[view.lowest_store[index]]
+
+    def lowest_prices(self, names) -> dict:
+        """Same shape as DatabaseManager.get_lowest_prices"""
+        result = {}
+        for name in names:
+            lowest = self.lowest(name)
+            if lowest is not None:
+                result[name] = lowest[0]
+        return result
+
+    def stores(self) -> list:
+        view = self._current()
+        return list(view.stores) if view else []
+
+    def rows(self, stores=None):
+        """Yield a comparison table row per product: {'Product': name, store: price, ...}
+
+        stores fixes the row keys, prices of other stores are left out.
+        """
+        view = self._current()
+        if view is None:
+            return
+        empty = dict.fromkeys(stores or view.stores)
+        for index in range(view.name_count):
+            row = {'Product': view.name(index), **empty}
+            for store, cents, _ in view.entries(index):
+                store_name = view.stores[store]
+                if store_name in row:
+                    row[store_name] = cents / 100
+            yield row
+
+
+class _SnapshotView:
+    """Typed memoryviews over one mapped snapshot file"""
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+        buffer = memoryview(mapped)
+        magic, version, self.name_count, self.entry_count, store_count, self.built_at, self.version = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"not a price snapshot file of format {FORMAT_VERSION}")
+        offsets = dict(zip(SECTIONS, SECTION_TABLE.unpack_from(buffer, HEADER.size)))
+
+        def array(section, code, count):
+            size = struct.calcsize(code)
+            return buffer[offsets[section]:offsets[section] + size * count].cast(code)
+
+        store_offsets = array('store_offsets', 'I', store_count + 1)
+        store_blob = offsets['store_blob']
+        self.stores = tuple(
+            bytes(buffer[store_blob + store_offsets[i]:store_blob + store_offsets[i + 1]]).decode('utf-8')
+            for i in range(store_count)
+        )
+        self.name_offsets = array('name_offsets', 'I', self.name_count + 1)
+        self.name_blob = offsets['name_blob']
+        self.buffer = buffer
+        self.entry_start = array('entry_start', 'I', self.name_count + 1)
+        self.entry_store = array('entry_store', 'H', self.entry_count)
+        self.entry_price = array('entry_price', 'i', self.entry_count)
+        self.entry_updated = array('entry_updated', 'q', self.entry_count)
+        self.lowest_price = array('lowest_price', 'i', self.name_count)
+        self.lowest_store = array('lowest_store', 'H', self.name_count)
+
+    def name_bytes(self, index):
+        start = self.name_blob + self.name_offsets[index]
+        end = self.name_blob + self.name_offsets[index + 1]
+        return self.buffer[start:end]
+
+    def name(self, index):
+        return bytes(self.name_bytes(index)).decode('utf-8')
+
+    def find(self, name):
+        """Binary search the sorted name table, returns the name index or None"""
+        target = name.encode('utf-8')
+        mapped, offsets, blob = self.mapped, self.name_offsets, self.name_blob
+        low, high = 0, self.name_count
+        while low < high:
+            middle = (low + high) // 2
+            if mapped[blob + offsets[middle]:blob + offsets[middle + 1]] < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.name_count and mapped[blob + offsets[low]:blob + offsets[low + 1]] == target:
+            return low
+        return None
+
+    def entries(self, index):
+        for entry in range(self.entry_start[index], self.entry_start[index + 1]):
+            yield self.entry_store[entry], self.entry_price[entry], self.entry_updated[entry]
+
+
+class SnapshotMaintainer:
+    """Rebuilds the snapshot shortly after products are upserted
+
+    Registered as a DatabaseManager upsert listener. Upserts arrive one
+    product at a time, so rebuilds are debounced and run on a timer
+    thread, never on the caller's.
+    """
+
+    def __init__(self, db_manager, path, delay=2.0):
+        self.db_manager = db_manager
+        self.path = path
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._timer = None
+        db_manager.add_upsert_listener(self._on_upsert)
+
+    def _on_upsert(self, name, store, price):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.rebuild)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Rebuild now if a rebuild is pending, e.g. before the process exits"""
+        with self._lock:
+            pending = self._timer is not None
+        if pending:
+            self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+        try:
+            return build_snapshot(self.db_manager.db_path, self.path)
+        except Exception as e:
+            logging.error(f"Error rebuilding price snapshot: {str(e)}")
+            return None
+
+
+def snapshot_path(db_path):
+    """Default snapshot location, next to the database"""
+    return os.path.splitext(db_path)[0] + '.prices'
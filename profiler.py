@@ -0,0 +1,254 @@
+"""Low-overhead sampling profiler for search, crawl and export runs
+
+A daemon thread wakes every interval, reads every thread's Python stack
+with sys._current_frames() and counts it. Nothing is hooked into the
+code being profiled, so the cost is one stack walk per busy thread per
+tick (about 1% at the default 100 Hz).
+
+Samples are tagged with the spans open on the sampled thread: the
+outermost span names the operation (search.store, crawl.task,
+export.pdf, ...) and the nearest span with a store attribute names the
+store. Only threads inside a span are sampled unless all_threads is set,
+so an idle Tk main loop or idle pool threads do not drown the profile.
+
+Enable it for a run with GROCERY_GURU_PROFILE=1, or for a fraction of
+runs with e.g. GROCERY_GURU_PROFILE=0.05, or with --profile on the
+command-line entry points. On stop it writes, to GROCERY_GURU_PROFILE_DIR
+(default ./profiles):
+
+    <name>-<time>-<pid>.collapsed   one "frame;frame;... count" line per stack,
+                                    for flamegraph.pl, speedscope or inferno
+    <name>-<time>-<pid>.txt         top functions by self and total samples,
+                                    overall and per operation and store
+"""
+import atexit
+import logging
+import multiprocessing.util
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from utils.metrics import tracer
+
+DEFAULT_HZ = 100
+# Deeper stacks are cut at the root end, the hot leaf frames are what matter
+MAX_DEPTH = 128
+
+
+def _frame_label(code, labels):
+    label = labels.get(code)
+    if label is None:
+        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+class SamplingProfiler:
+    """Counts stack samples per (operation, store, stack) until stopped"""
+
+    def __init__(self, name='grocery-guru', hz=DEFAULT_HZ, output_dir=None, top=30, all_threads=False):
+        self.name = name
+        self.interval = 1.0 / hz
+        self.output_dir = output_dir or os.environ.get('GROCERY_GURU_PROFILE_DIR', 'profiles')
+        self.top = top
+        self.all_threads = all_threads
+        self.samples = Counter()  # (operation, store, stack tuple) -> count
+        self.ticks = 0
+        self.sampling_seconds = 0.0
+        self._labels = {}  # code object -> frame label
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        tracer.track_activity = True
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, write=True):
+        """Stop sampling, returns the paths written (or an empty dict)"""
+        if self._thread is None:
+            return {}
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        tracer.track_activity = False
+        if not write or not self.samples:
+            return {}
+        try:
+            return self.write()
+        except Exception as e:
+            logging.error(f"Error writing profile: {str(e)}")
+            return {}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            self._sample(own)
+            self.sampling_seconds += time.perf_counter() - start
+            self.ticks += 1
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay < 0:
+                # Fell behind (e.g. the GIL was busy): skip the missed ticks, don't burst
+                next_tick = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+
+    def _sample(self, own):
+        activity = tracer.activity
+        labels = self._labels
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            spans = activity.get(thread_id)
+            if not spans and not self.all_threads:
+                continue
+            operation, store = 'idle', None
+            if spans:
+                # A span can be pushed or popped while we read, copy first
+                spans = list(spans)
+                if spans:
+                    operation = spans[0][0]
+                    for _, attributes in reversed(spans):
+                        if 'store' in attributes:
+                            store = attributes['store']
+                            break
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_frame_label(frame.f_code, labels))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[(operation, store, tuple(stack))] += 1
+
+    def write(self) -> dict:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        base = os.path.join(self.output_dir, f"{self.name}-{stamp}-{os.getpid()}")
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for (operation, store, stack), count in self.samples.most_common():
+                tags = [f"op:{operation}"] + ([f"store:{store}"] if store else [])
+                # ';' separates frames in the collapsed format
+                frames = [frame.replace(';', ':') for frame in tags + list(stack)]
+                f.write(f"{';'.join(frames)} {count}\n")
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self.summary())
+        logging.info(f"Profile written to {base}.collapsed and {base}.txt")
+        return {'collapsed': base + '.collapsed', 'summary': base + '.txt'}
+
+    def hot_functions(self, operation=None, store=None):
+        """(self counts, total counts, samples) over samples matching operation and store"""
+        self_counts, total_counts, total = Counter(), Counter(), 0
+        for (sample_operation, sample_store, stack), count in self.samples.items():
+            if operation is not None and sample_operation != operation:
+                continue
+            if store is not None and sample_store != store:
+                continue
+            total += count
+            if stack:
+                self_counts[stack[-1]] += count
+            # Recursive functions count once per sample
+            for frame in set(stack):
+                total_counts[frame] += count
+        return self_counts, total_counts, total
+
+    def summary(self) -> str:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        lines = [
+            f"{self.name}: {sum(self.samples.values())} samples over {elapsed:.1f}s "
+            f"at {1 / self.interval:.0f} Hz, sampler busy {self.sampling_seconds / elapsed:.2%} of the time",
+            ''
+        ]
+        groups = defaultdict(int)
+        for (operation, store, _), count in self.samples.items():
+            groups[(operation, store)] += count
+        lines.append('Samples by operation and store')
+        for (operation, store), count in sorted(groups.items(), key=lambda item: -item[1]):
+            lines.append(f"  {count:8d}  {operation}{' / ' + store if store else ''}")
+        lines.append('')
+
+        sections = [(None, None)] + sorted(groups, key=lambda key: -groups[key])
+        for operation, store in sections:
+            self_counts, total_counts, total = self.hot_functions(operation, store)
+            if not total:
+                continue
+            title = 'All operations' if operation is None else f"{operation}{' / ' + store if store else ''}"
+            lines.append(f"{title}: top {self.top} of {total} samples")
+            lines.append(f"  {'self':>7} {'total':>7}  function")
+            for frame, count in self_counts.most_common(self.top):
+                lines.append(f"  {count / total:7.1%} {total_counts[frame] / total:7.1%}  {frame}")
+            lines.append('')
+        return '\n'.join(lines)
+
+
+def profile_fraction(value) -> float:
+    """Parse a --profile or GROCERY_GURU_PROFILE value: '1' always, '0.05' for 5% of runs"""
+    if value in (None, '', '0', 'false', 'off'):
+        return 0.0
+    if value in ('true', 'on', 'yes'):
+        return 1.0
+    return min(1.0, max(0.0, float(value)))
+
+
+# The profiler started by start_profiler in this process, if any
+_profiler = None
+
+
+def start_profiler(name, fraction=None, **options):
+    """Start a SamplingProfiler for this run if enabled, writing its output at exit
+
+    fraction defaults to GROCERY_GURU_PROFILE. The decision is written
+    back to GROCERY_GURU_PROFILE, so worker processes that call this with
+    no fraction are profiled exactly when their parent is. Returns the
+    profiler, or None when profiling is off or this run was not picked.
+    """
+    global _profiler
+    # A forked child inherits the object but not its sampling thread
+    if _profiler is not None and _profiler.running:
+        return _profiler
+    if fraction is None:
+        try:
+            fraction = profile_fraction(os.environ.get('GROCERY_GURU_PROFILE'))
+        except ValueError:
+            logging.error("GROCERY_GURU_PROFILE must be a fraction between 0 and 1")
+            return None
+    picked = fraction > 0 and random.random() < fraction
+    # Worker processes started from here follow this run's decision
+    os.environ['GROCERY_GURU_PROFILE'] = '1' if picked else '0'
+    if not picked:
+        return None
+    hz = os.environ.get('GROCERY_GURU_PROFILE_HZ')
+    if hz:
+        options.setdefault('hz', float(hz))
+    _profiler = SamplingProfiler(name, **options).start()
+    atexit.register(_profiler.stop)
+    # multiprocessing workers leave through os._exit and skip atexit, but run finalizers
+    multiprocessing.util.Finalize(_profiler, _profiler.stop, exitpriority=10)
+    logging.info(f"Sampling profiler on for {name}")
+    return _profiler
+
+
+def add_profile_argument(parser):
+    """Add --profile [FRACTION] to an entry point's argument parser"""
+    parser.add_argument(
+        '--profile', nargs='?', const='1', type=profile_fraction, metavar='FRACTION',
+        help="sample stacks and write a flamegraph and hot-function summary, for all or FRACTION of runs"
+    )
@@ -0,0 +1,115 @@
+import sys
+
+
+def to_cents(price) -> int:
+    """Parse a price such as 1.99, '1,99' or '€1.99' into integer cents"""
+    if isinstance(price, str):
+        price = price.strip().replace('€', '').replace(',', '.')
+    return round(float(price) * 100)
+
+
+class ProductRecord:
+    """One scraped product, a slotted stand-in for the old product dicts
+
+    Store names are interned so thousands of records share one string,
+    and prices are kept as integer cents. Item access (record['price'],
+    record.get('url')) still works for code written against dicts.
+    """
+    __slots__ = ('name', 'store', 'price_cents', 'url', 'image_url')
+
+    def __init__(self, name: str, store: str, price_cents: int, url: str = None, image_url: str = None):
+        self.name = name
+        self.store = sys.intern(store)
+        self.price_cents = price_cents
+        self.url = url
+        self.image_url = image_url
+
+    @classmethod
+    def from_price(cls, name, store, price, url=None, image_url=None):
+        return cls(name, store, to_cents(price), url, image_url)
+
+    @property
+    def price(self) -> float:
+        return self.price_cents / 100
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'price': self.price, 'store': self.store, 'url': self.url, 'image_url': self.image_url}
+
+    def __reduce__(self):
+        return ProductRecord, (self.name, self.store, self.price_cents, self.url, self.image_url)
+
+    def __eq__(self, other):
+        return isinstance(other, ProductRecord) and (
+            (self.name, self.store, self.price_cents, self.url, self.image_url)
+            == (other.name, other.store, other.price_cents, other.url, other.image_url)
+        )
+
+    def __repr__(self):
+        return f"ProductRecord({self.name!r}, {self.store!r}, {self.price_cents}, {self.url!r}, {self.image_url!r})"
+
+
+class DiscountRecord:
+    """One scraped promotion, prices in integer cents"""
+    __slots__ = ('name', 'store', 'original_cents', 'discount_cents', 'url', 'valid_until', 'image_url')
+
+    def __init__(self, name: str, store: str, original_cents: int, discount_cents: int,
+                 url: str = None, valid_until: str = None, image_url: str = None):
+        self.name = name
+        self.store = sys.intern(store)
+        self.original_cents = original_cents
+        self.discount_cents = discount_cents
+        self.url = url
+        self.valid_until = valid_until
+        self.image_url = image_url
+
+    @classmethod
+    def from_prices(cls, name, store, original_price, discount_price, url=None, valid_until=None, image_url=None):
+        return cls(name, store, to_cents(original_price), to_cents(discount_price), url, valid_until, image_url)
+
+    @property
+    def original_price(self) -> float:
+        return self.original_cents / 100
+
+    @property
+    def discount_price(self) -> float:
+        return self.discount_cents / 100
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'store': self.store,
+            'original_price': self.original_price,
+            'discount_price': self.discount_price,
+            'url': self.url,
+            'valid_until': self.valid_until,
+            'image_url': self.image_url
+        }
+
+    def __reduce__(self):
+        return DiscountRecord, (
+            self.name, self.store, self.original_cents, self.discount_cents, self.url, self.valid_until, self.image_url
+        )
+
+    def __repr__(self):
+        return (
+            f"DiscountRecord({self.name!r}, {self.store!r}, {self.original_cents}, "
+            f"{self.discount_cents}, {self.url!r}, {self.valid_until!r}, {self.image_url!r})"
+        )
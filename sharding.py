@@ -0,0 +1,371 @@
+"""Per-store SQLite shards for products and price history
+
+In the sharded layout each store's products and price_history live in
+their own file, so ingests for different stores take different write
+locks and run in parallel:
+
+    grocery_guru.db                 shopping lists, preferences, the
+                                    crawl queue and the shards table
+    grocery_guru.shards/1-rimi.db   Rimi's products and price_history
+    grocery_guru.shards/2-maxima.db ...
+
+Readers connect to the main file with connect(), which ATTACHes every
+shard and puts TEMP views named products and price_history over them,
+so queries written for the single-file layout run unchanged across
+stores. Writers for one store open that store's shard directly.
+
+Product and price history ids stay unique across shards: a shard's new
+ids start at its number << SHARD_ID_BITS, and rows migrated from the
+single-file layout keep their ids, which are all below that. Shopping
+list items therefore keep pointing at the right product.
+
+Snapshot sync and the Parquet export track what they have copied with a
+watermark, {shard id: highest price_history id}, shard 0 standing for a
+single-file database. Ids only grow within a shard, and rows migrated
+from a single file keep ids a pre-migration watermark already covers.
+
+SQLite attaches at most 10 databases by default, so this layout holds at
+most MAX_SHARDS stores: a write for an eleventh store, or migrating a
+database with more, raises ShardLimitError instead of leaving readers
+unable to attach every shard.
+
+Usage:
+    python sharding.py migrate --db grocery_guru.db
+    python sharding.py status --db grocery_guru.db
+"""
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import time
+
+SHARD_ID_BITS = 40
+SHARD_TABLES = ('products', 'price_history')
+PRODUCT_COLUMNS = 'id, name, store, price, url, last_updated, image_url'
+HISTORY_COLUMNS = 'id, product_id, price, recorded_at'
+# SQLite's default SQLITE_MAX_ATTACHED, connect() attaches every shard
+MAX_SHARDS = 10
+# Bits per shard in a packed watermark, every shard's ids are below (MAX_SHARDS + 1) << SHARD_ID_BITS
+WATERMARK_BITS = 44
+
+
+class ShardLimitError(RuntimeError):
+    """A store needs a shard but the database already has MAX_SHARDS"""
+
+
+def shard_dir(db_path):
+    """Directory holding the shards of a main database file"""
+    return os.path.splitext(db_path)[0] + '.shards'
+
+
+def _shard_filename(shard_id, store):
+    """File name of a shard, unique per shard even when store names slug alike ('Top!', 'top?')"""
+    slug = re.sub(r'[^\w-]', '_', store.lower())
+    return f"{shard_id}-{slug}.db"
+
+
+def _ensure_registry(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shards (
+            id INTEGER PRIMARY KEY,
+            store TEXT UNIQUE NOT NULL,
+            path TEXT NOT NULL
+        )
+    ''')
+
+
+def is_sharded(db_path) -> bool:
+    """Whether db_path uses the sharded layout, i.e. has a shards table"""
+    if not os.path.exists(db_path):
+        return False
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shards'"
+        ).fetchone() is not None
+
+
+def _registered(conn, db_path):
+    """[(shard id, store, absolute path)] from the main database's shards table"""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    return [
+        (shard_id, store, os.path.join(directory, path))
+        for shard_id, store, path in conn.execute('SELECT id, store, path FROM shards ORDER BY id')
+    ]
+
+
+def shard_paths(db_path) -> dict:
+    """store -> path of its shard"""
+    with sqlite3.connect(db_path) as conn:
+        return {store: path for _, store, path in _registered(conn, db_path)}
+
+
+def _create_shard(path, shard_id):
+    """Create a shard's tables, with ids starting at the shard's base"""
+    base = shard_id << SHARD_ID_BITS
+    with sqlite3.connect(path) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                store TEXT NOT NULL,
+                price REAL NOT NULL,
+                url TEXT,
+                last_updated TIMESTAMP,
+                image_url TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS price_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER,
+                price REAL NOT NULL,
+                recorded_at TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES products (id)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_products_name_store ON products (name, store)')
+        # Cross-store joins reach a shard's history through its products
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_price_history_product_time ON price_history (product_id, recorded_at)')
+        for table in SHARD_TABLES:
+            if not conn.execute('SELECT 1 FROM sqlite_sequence WHERE name = ?', (table,)).fetchone():
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, base))
+
+
+def ensure_shard(db_path, store) -> str:
+    """Path of a store's shard, creating and registering it if the store is new"""
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        _ensure_registry(conn)
+        for _, registered_store, path in _registered(conn, db_path):
+            if registered_store == store:
+                conn.rollback()
+                return path
+        if conn.execute('SELECT COUNT(*) FROM shards').fetchone()[0] >= MAX_SHARDS:
+            raise ShardLimitError(
+                f"{db_path} already has {MAX_SHARDS} store shards, the most SQLite can attach; "
+                f"cannot add a shard for {store}"
+            )
+        shard_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM shards').fetchone()[0]
+        directory = shard_dir(db_path)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, _shard_filename(shard_id, store))
+        _create_shard(path, shard_id)
+        relative = os.path.relpath(path, os.path.dirname(os.path.abspath(db_path)))
+        conn.execute('INSERT INTO shards (id, store, path) VALUES (?, ?, ?)', (shard_id, store, relative))
+        conn.commit()
+        logging.info(f"Created {store} shard {path}")
+        return path
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def attach_shards(conn, db_path):
+    """ATTACH every shard to conn and put TEMP products/price_history views over them"""
+    shards = _registered(conn, db_path)
+    for shard_id, _, path in shards:
+        conn.execute('ATTACH DATABASE ? AS ?', (path, f"shard_{shard_id}"))
+    for table, columns in (('products', PRODUCT_COLUMNS), ('price_history', HISTORY_COLUMNS)):
+        union = ' UNION ALL '.join(f"SELECT {columns} FROM shard_{shard_id}.{table}" for shard_id, _, _ in shards)
+        if not union:
+            # No store has written yet, keep the columns so queries still compile
+            union = f"SELECT {columns} FROM (SELECT NULL AS {columns.replace(', ', ', NULL AS ')}) WHERE 0"
+        conn.execute(f"CREATE TEMP VIEW {table} AS {union}")
+    return conn
+
+
+def connect(db_path, **kwargs) -> sqlite3.Connection:
+    """Connection for reading products and price history in either layout
+
+    On a sharded database the shards are attached and products and
+    price_history are cross-store views; otherwise it is a plain connection.
+    """
+    conn = sqlite3.connect(db_path, **kwargs)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shards'").fetchone():
+            attach_shards(conn, db_path)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def history_sources(conn) -> list:
+    """(shard id, schema, store) of every file holding price history on a connect() connection
+
+    A single-file database is [(0, 'main', None)].
+    """
+    attached = {row[1] for row in conn.execute('PRAGMA database_list')}
+    if 'shards' not in {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}:
+        return [(0, 'main', None)]
+    return [
+        (shard_id, f"shard_{shard_id}", store)
+        for shard_id, store in conn.execute('SELECT id, store FROM main.shards ORDER BY id')
+        # A store registered after conn was opened is not attached yet
+        if f"shard_{shard_id}" in attached
+    ]
+
+
+def watermark(conn) -> dict:
+    """{shard id: highest price_history id} on a connect() connection"""
+    return {
+        shard_id: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {schema}.price_history').fetchone()[0]
+        for shard_id, schema, _ in history_sources(conn)
+    }
+
+
+def watermark_floor(marks, shard_id) -> int:
+    """History ids of shard_id up to this one are covered by marks
+
+    A mark taken before migration (shard 0) covers the migrated rows of every shard.
+    """
+    return max(marks.get(shard_id, 0), marks.get(0, 0))
+
+
+def pack_watermark(marks) -> int:
+    """One integer for a watermark, a single file's is its highest id"""
+    return sum(mark << (WATERMARK_BITS * shard_id) for shard_id, mark in marks.items())
+
+
+def unpack_watermark(version) -> dict:
+    mask = (1 << WATERMARK_BITS) - 1
+    marks = {}
+    shard_id = 0
+    while version:
+        if version & mask:
+            marks[shard_id] = version & mask
+        version >>= WATERMARK_BITS
+        shard_id += 1
+    return marks
+
+
+def _copy_store(db_path, path, store):
+    """Copy one store's products and price history from the main file into its shard"""
+    shard = sqlite3.connect(path)
+    try:
+        shard.execute('ATTACH DATABASE ? AS source', (db_path,))
+        with shard:
+            products = shard.execute(f'''
+                INSERT INTO main.products ({PRODUCT_COLUMNS})
+                SELECT {PRODUCT_COLUMNS} FROM source.products WHERE store = ?
+            ''', (store,)).rowcount
+            history = shard.execute(f'''
+                INSERT INTO main.price_history ({HISTORY_COLUMNS})
+                SELECT ph.id, ph.product_id, ph.price, ph.recorded_at
+                FROM source.price_history ph
+                JOIN source.products p ON p.id = ph.product_id
+                WHERE p.store = ?
+            ''', (store,)).rowcount
+        return products, history
+    finally:
+        shard.close()
+
+
+def migrate_to_shards(db_path) -> dict:
+    """Move products and price_history of a single-file database into per-store shards
+
+    Ids are kept, so shopping lists stay valid. The main file's write lock
+    is held from the first check to the end, so writers wait and two
+    processes migrating at once do it once. Registering the shards and
+    dropping the old tables commit together: an interrupted migration
+    leaves the single-file layout as it was. Returns a summary.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        has_registry = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'shards'"
+        ).fetchone()
+        has_products = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products'"
+        ).fetchone()
+        if has_registry and not has_products:
+            conn.rollback()
+            return {'stores': {}, 'already_sharded': True}
+        if has_registry:
+            raise ValueError(f"{db_path} has both shards and a products table, it needs checking by hand")
+
+        summary = {'stores': {}, 'already_sharded': False}
+        _ensure_registry(conn)
+        stores = [row[0] for row in conn.execute('SELECT DISTINCT store FROM products ORDER BY store')]
+        if len(stores) > MAX_SHARDS:
+            raise ShardLimitError(
+                f"{db_path} has {len(stores)} stores, the sharded layout holds at most {MAX_SHARDS}"
+            )
+        directory = shard_dir(db_path)
+        os.makedirs(directory, exist_ok=True)
+        for shard_id, store in enumerate(stores, start=1):
+            path = os.path.join(directory, _shard_filename(shard_id, store))
+            # Left over from an interrupted migration, never registered: the
+            # registry is created in this transaction, so no store owns it
+            if os.path.exists(path):
+                os.unlink(path)
+            _create_shard(path, shard_id)
+            # Other connections can still read the main file under our write lock
+            products, history = _copy_store(db_path, path, store)
+            relative = os.path.relpath(path, os.path.dirname(os.path.abspath(db_path)))
+            conn.execute('INSERT INTO shards (id, store, path) VALUES (?, ?, ?)', (shard_id, store, relative))
+            summary['stores'][store] = {'products': products, 'price_history': history, 'path': path}
+        summary['orphaned_history'] = conn.execute('''
+            SELECT COUNT(*) FROM price_history
+            WHERE product_id NOT IN (SELECT id FROM products)
+        ''').fetchone()[0]
+        conn.execute('DROP TABLE price_history')
+        conn.execute('DROP TABLE products')
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-store sharded storage for Grocery Guru")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = commands.add_parser('migrate', help="move a single-file database into per-store shards")
+    migrate_parser.add_argument('--db', default='grocery_guru.db')
+    migrate_parser.add_argument('--vacuum', action='store_true', help="reclaim the moved tables' space in the main file")
+
+    status_parser = commands.add_parser('status', help="list the shards and their row counts")
+    status_parser.add_argument('--db', default='grocery_guru.db')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'migrate':
+        from database.db_manager import DatabaseManager
+        DatabaseManager(args.db)  # bring the schema up to date first
+        summary = migrate_to_shards(args.db)
+        if summary['already_sharded']:
+            print(f"{args.db} is already sharded")
+            return
+        for store, counts in summary['stores'].items():
+            print(f"{store:<10} {counts['products']:>9} products {counts['price_history']:>11} history rows -> {counts['path']}")
+        if summary['orphaned_history']:
+            print(f"Left out {summary['orphaned_history']} history rows of deleted products")
+        print(f"Migrated in {summary['seconds']:.1f}s")
+        if args.vacuum:
+            with sqlite3.connect(args.db) as conn:
+                conn.execute('VACUUM')
+    else:
+        if not is_sharded(args.db):
+            print(f"{args.db} uses the single-file layout")
+            return
+        for store, path in shard_paths(args.db).items():
+            with sqlite3.connect(path) as conn:
+                products = conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+                history = conn.execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
+            print(f"{store:<10} {products:>9} products {history:>11} history rows  {path}")
+
+
+if __name__ == '__main__':
+    main()
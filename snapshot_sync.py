@@ -0,0 +1,459 @@
+"""Compact binary price snapshots and deltas for syncing clients
+
+Usage:
+    python snapshot_sync.py export --db grocery_guru.db --out full.ggsnap
+    python snapshot_sync.py export --db grocery_guru.db --since 120345 --out delta.ggsnap
+    python snapshot_sync.py apply --db client.db delta.ggsnap
+    python snapshot_sync.py info delta.ggsnap
+
+A snapshot's version is the highest price_history id it contains, so a
+delta since version V holds every price change recorded after V and the
+products they belong to. On a sharded database it is the packed
+per-shard watermark (see sharding.py), an opaque integer to clients.
+Layout:
+
+    header   b'GGSN', format, kind (full/delta), base version, version, created
+    chunks   type byte, varint length, zlib payload, CRC32 of the payload
+    end      a chunk of type END
+
+Store and product names are dictionary encoded, prices are integer cents
+and history timestamps are zigzag varint deltas in microseconds, with
+each product's price delta encoded against its previous row.
+"""
+import argparse
+import heapq
+import io
+import sqlite3
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta
+from database.sharding import (
+    connect, ensure_shard, history_sources, is_sharded, pack_watermark, unpack_watermark, watermark, watermark_floor
+)
+from utils.metrics import span
+from utils.profiler import add_profile_argument, start_profiler
+
+MAGIC = b'GGSN'
+FORMAT_VERSION = 1
+FULL, DELTA = 0, 1
+
+# Chunk types
+END, STORES, NAMES, PRODUCTS, HISTORY = 0, 1, 2, 3, 4
+
+# Entries per chunk, so a corrupt chunk is detected before much is read
+CHUNK_ROWS = 50000
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class SnapshotError(ValueError):
+    """A snapshot is corrupt or does not apply to this database"""
+
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def to_micros(timestamp):
+    return (datetime.fromisoformat(timestamp) - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return (EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+def to_cents(price):
+    return round(price * 100)
+
+
+def write_string(out, text):
+    encoded = (text or '').encode('utf-8')
+    write_varint(out, len(encoded))
+    out.extend(encoded)
+
+
+def read_string(data, pos):
+    length, pos = read_varint(data, pos)
+    return data[pos:pos + length].decode('utf-8'), pos + length
+
+
+def write_chunk(f, chunk_type, payload):
+    compressed = zlib.compress(bytes(payload), 6)
+    header = bytearray([chunk_type])
+    write_varint(header, len(compressed))
+    f.write(header)
+    f.write(compressed)
+    f.write(struct.pack('>I', zlib.crc32(compressed)))
+
+
+def read_file_varint(f):
+    result = shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise SnapshotError("snapshot is truncated")
+        result |= (byte[0] & 0x7f) << shift
+        if byte[0] < 0x80:
+            return result
+        shift += 7
+
+
+def read_chunks(f):
+    """Yield (type, payload) for each chunk, checking every checksum"""
+    while True:
+        chunk_type = f.read(1)
+        if not chunk_type:
+            raise SnapshotError("snapshot is truncated, no end chunk")
+        length = read_file_varint(f)
+        compressed = f.read(length)
+        checksum = f.read(4)
+        if len(compressed) != length or len(checksum) != 4:
+            raise SnapshotError("snapshot is truncated")
+        if struct.unpack('>I', checksum)[0] != zlib.crc32(compressed):
+            raise SnapshotError(f"checksum mismatch in chunk of type {chunk_type[0]}")
+        if chunk_type[0] == END:
+            return
+        yield chunk_type[0], zlib.decompress(compressed)
+
+
+def _batches(rows, size=CHUNK_ROWS):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def current_version(conn):
+    """Version of everything on a connect() connection"""
+    return pack_watermark(watermark(conn))
+
+
+def export_snapshot(db_path, out, since_version=None, include_history=True):
+    """Write a full snapshot, or a delta of changes after since_version, to a path or binary file
+
+    Returns the header fields as a dict.
+    """
+    since = unpack_watermark(since_version or 0)
+    with connect(db_path) as conn:
+        # A client already at or past the latest version gets an empty delta
+        upto = dict(since)
+        for shard_id, mark in watermark(conn).items():
+            upto[shard_id] = max(mark, since.get(shard_id, 0))
+        version = pack_watermark(upto)
+        # Each file is read in order on its own, the shards are merged below
+        product_parts, history_parts = [], []
+        for shard_id, schema, _ in history_sources(conn):
+            if since_version is None:
+                product_parts.append(conn.execute(f'''
+                    SELECT id, name, store, price, url, last_updated FROM {schema}.products ORDER BY id
+                ''').fetchall())
+                history_parts.append(conn.execute(f'''
+                    SELECT product_id, price, recorded_at, id FROM {schema}.price_history
+                    WHERE id <= ? ORDER BY recorded_at, id
+                ''', (upto[shard_id],)).fetchall() if include_history else [])
+            else:
+                bounds = (watermark_floor(since, shard_id), upto[shard_id])
+                history_parts.append(conn.execute(f'''
+                    SELECT product_id, price, recorded_at, id FROM {schema}.price_history
+                    WHERE id > ? AND id <= ? ORDER BY recorded_at, id
+                ''', bounds).fetchall())
+                product_parts.append(conn.execute(f'''
+                    SELECT id, name, store, price, url, last_updated FROM {schema}.products
+                    WHERE id IN (SELECT product_id FROM {schema}.price_history WHERE id > ? AND id <= ?)
+                    ORDER BY id
+                ''', bounds).fetchall())
+    products = list(heapq.merge(*product_parts))
+    history = [row[:3] for row in heapq.merge(*history_parts, key=lambda row: (row[2], row[3]))]
+
+    header = {
+        'kind': FULL if since_version is None else DELTA,
+        'base_version': since_version or 0,
+        'version': version,
+        'created': int(time.time()),
+        'products': len(products),
+        'history': len(history)
+    }
+
+    stores, names = {}, {}
+    for _, name, store, _, _, _ in products:
+        stores.setdefault(store, len(stores))
+        names.setdefault(name, len(names))
+    positions = {row[0]: position for position, row in enumerate(products)}
+
+    if isinstance(out, (str, bytes)) or hasattr(out, '__fspath__'):
+        with open(out, 'wb') as f:
+            _write(f, header, stores, names, products, positions, history)
+    else:
+        _write(out, header, stores, names, products, positions, history)
+    return header
+
+
+def _write(f, header, stores, names, products, positions, history):
+    head = bytearray(MAGIC)
+    head.append(FORMAT_VERSION)
+    head.append(header['kind'])
+    for field in ('base_version', 'version', 'created'):
+        write_varint(head, header[field])
+    f.write(head)
+
+    payload = bytearray()
+    write_varint(payload, len(stores))
+    for store in stores:
+        write_string(payload, store)
+    write_chunk(f, STORES, payload)
+
+    for batch in _batches(list(names)):
+        payload = bytearray()
+        write_varint(payload, len(batch))
+        for name in batch:
+            write_string(payload, name)
+        write_chunk(f, NAMES, payload)
+
+    for batch in _batches(products):
+        payload = bytearray()
+        write_varint(payload, len(batch))
+        previous = 0
+        for _, name, store, price, url, last_updated in batch:
+            write_varint(payload, names[name])
+            write_varint(payload, stores[store])
+            write_varint(payload, zigzag(to_cents(price)))
+            updated = to_micros(last_updated) if last_updated else 0
+            write_varint(payload, zigzag(updated - previous))
+            previous = updated
+            write_string(payload, url)
+        write_chunk(f, PRODUCTS, payload)
+
+    # Each chunk starts its deltas from zero so chunks decode independently
+    for batch in _batches(history):
+        payload = bytearray()
+        write_varint(payload, len(batch))
+        previous_time = 0
+        previous_price = {}
+        for product_id, price, recorded_at in batch:
+            position = positions[product_id]
+            cents = to_cents(price)
+            micros = to_micros(recorded_at)
+            write_varint(payload, position)
+            write_varint(payload, zigzag(cents - previous_price.get(position, 0)))
+            write_varint(payload, zigzag(micros - previous_time))
+            previous_price[position] = cents
+            previous_time = micros
+        write_chunk(f, HISTORY, payload)
+
+    write_chunk(f, END, b'')
+
+
+def read_snapshot(source):
+    """Decode a snapshot from a path, bytes or binary file
+
+    Returns (header, products, history) where products are
+    (name, store, price, url, last_updated) and history rows are
+    (product_position, price, recorded_at).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        f = io.BytesIO(source)
+    elif hasattr(source, 'read'):
+        f = source
+    else:
+        f = open(source, 'rb')
+    try:
+        return _read(f)
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _read(f):
+    head = f.read(6)
+    if head[:4] != MAGIC:
+        raise SnapshotError("not a Grocery Guru snapshot")
+    if head[4] != FORMAT_VERSION:
+        raise SnapshotError(f"unsupported snapshot format {head[4]}")
+    header = {'kind': head[5]}
+    for field in ('base_version', 'version', 'created'):
+        header[field] = read_file_varint(f)
+
+    stores, names, products, history = [], [], [], []
+    for chunk_type, data in read_chunks(f):
+        count, pos = read_varint(data, 0)
+        if chunk_type == STORES:
+            for _ in range(count):
+                store, pos = read_string(data, pos)
+                stores.append(store)
+        elif chunk_type == NAMES:
+            for _ in range(count):
+                name, pos = read_string(data, pos)
+                names.append(name)
+        elif chunk_type == PRODUCTS:
+            previous = 0
+            for _ in range(count):
+                name_index, pos = read_varint(data, pos)
+                store_index, pos = read_varint(data, pos)
+                cents, pos = read_varint(data, pos)
+                delta, pos = read_varint(data, pos)
+                url, pos = read_string(data, pos)
+                previous += unzigzag(delta)
+                products.append((
+                    names[name_index], stores[store_index], unzigzag(cents) / 100,
+                    url or None, from_micros(previous) if previous else None
+                ))
+        elif chunk_type == HISTORY:
+            previous_time = 0
+            previous_price = {}
+            for _ in range(count):
+                position, pos = read_varint(data, pos)
+                price_delta, pos = read_varint(data, pos)
+                time_delta, pos = read_varint(data, pos)
+                cents = previous_price.get(position, 0) + unzigzag(price_delta)
+                previous_price[position] = cents
+                previous_time += unzigzag(time_delta)
+                history.append((position, cents / 100, from_micros(previous_time)))
+        else:
+            raise SnapshotError(f"unknown chunk type {chunk_type}")
+
+    header['products'] = len(products)
+    header['history'] = len(history)
+    return header, products, history
+
+
+def _ensure_sync_state(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def local_version(db_path):
+    """Snapshot version the database was last synced to, 0 if never"""
+    with sqlite3.connect(db_path) as conn:
+        _ensure_sync_state(conn)
+        row = conn.execute("SELECT value FROM sync_state WHERE key = 'snapshot_version'").fetchone()
+        return int(row[0]) if row else 0
+
+
+def apply_snapshot(db_path, source):
+    """Apply a full snapshot or a delta onto the products/price_history tables
+
+    A delta must start at the version the database is synced to. Returns
+    the snapshot header.
+    """
+    header, products, history = read_snapshot(source)
+    if is_sharded(db_path):
+        # New stores need a shard before connect() can attach it
+        for store in {product[1] for product in products}:
+            ensure_shard(db_path, store)
+    conn = connect(db_path)
+    try:
+        _ensure_sync_state(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        schemas = {store: schema for _, schema, store in history_sources(conn)}
+        row = conn.execute("SELECT value FROM sync_state WHERE key = 'snapshot_version'").fetchone()
+        synced = int(row[0]) if row else 0
+        if header['kind'] == DELTA and header['base_version'] != synced:
+            raise SnapshotError(
+                f"delta applies to version {header['base_version']}, database is at version {synced}"
+            )
+        if header['kind'] == FULL and synced:
+            raise SnapshotError(f"database is already synced to version {synced}, apply deltas instead")
+
+        # (schema, id) per product; a single file has one schema for every store
+        product_ids = []
+        for name, store, price, url, last_updated in products:
+            schema = schemas.get(store, 'main')
+            existing = conn.execute(
+                f'SELECT id FROM {schema}.products WHERE name = ? AND store = ?', (name, store)
+            ).fetchone()
+            if existing:
+                conn.execute(f'''
+                    UPDATE {schema}.products SET price = ?, url = COALESCE(?, url), last_updated = ? WHERE id = ?
+                ''', (price, url, last_updated, existing[0]))
+                product_ids.append((schema, existing[0]))
+            else:
+                cursor = conn.execute(f'''
+                    INSERT INTO {schema}.products (name, store, price, url, last_updated) VALUES (?, ?, ?, ?, ?)
+                ''', (name, store, price, url, last_updated))
+                product_ids.append((schema, cursor.lastrowid))
+
+        by_schema = {}
+        for position, price, recorded_at in history:
+            schema, product_id = product_ids[position]
+            by_schema.setdefault(schema, []).append((product_id, price, recorded_at))
+        for schema, rows in by_schema.items():
+            conn.executemany(f'INSERT INTO {schema}.price_history (product_id, price, recorded_at) VALUES (?, ?, ?)', rows)
+        conn.execute('''
+            INSERT INTO sync_state (key, value) VALUES ('snapshot_version', ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        ''', (str(header['version']),))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and apply Grocery Guru price snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="write a full snapshot or a delta")
+    export_parser.add_argument('--db', default='grocery_guru.db')
+    export_parser.add_argument('--out', required=True)
+    export_parser.add_argument('--since', type=int, help="only changes after this version")
+    export_parser.add_argument('--no-history', action='store_true', help="full snapshot of current prices only")
+
+    apply_parser = commands.add_parser('apply', help="apply snapshots to a database, in order")
+    apply_parser.add_argument('--db', default='grocery_guru.db')
+    apply_parser.add_argument('snapshots', nargs='+')
+
+    info_parser = commands.add_parser('info', help="print a snapshot's header")
+    info_parser.add_argument('snapshot')
+
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    start_profiler(f"snapshot-{args.command}", args.profile)
+    with span(f"snapshot.{args.command}"):
+        if args.command == 'export':
+            from database.db_manager import DatabaseManager
+            DatabaseManager(args.db)  # make sure the schema exists
+            header = export_snapshot(args.db, args.out, args.since, include_history=not args.no_history)
+            print(f"Wrote version {header['version']}: {header['products']} products, {header['history']} history rows")
+        elif args.command == 'apply':
+            from database.db_manager import DatabaseManager
+            DatabaseManager(args.db)
+            for path in args.snapshots:
+                start = time.perf_counter()
+                header = apply_snapshot(args.db, path)
+                print(f"Applied {path} -> version {header['version']} in {(time.perf_counter() - start) * 1000:.1f} ms")
+        else:
+            header, _, _ = read_snapshot(args.snapshot)
+            header['kind'] = 'full' if header['kind'] == FULL else 'delta'
+            print(header)
+
+
+if __name__ == '__main__':
+    main()
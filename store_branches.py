@@ -0,0 +1,84 @@
+"""Bundled offline list of supermarket branches and markets in Latvia
+
+Locations are approximate: each branch is placed at the centre of its
+town or Riga neighbourhood, good to a few kilometres, so nearest-store
+answers work offline out of the box, and the API flags them as
+approximate. For street-level positions load an OpenStreetMap export
+instead:
+
+    python store_locator.py import-osm --db grocery_guru.db supermarkets.json
+
+Chains are named as the products table names stores, so a branch's
+prices are its chain's. Markets use the store names bulk_import gives
+them.
+"""
+from database.bulk_import import MARKETS as BULK_IMPORT_MARKETS
+
+# place -> (city, lat, lon, chains with a branch there)
+PLACES = {
+    'Centrs': ('Rīga', 56.9496, 24.1052, ('Rimi', 'Maxima', 'Lidl')),
+    'Purvciems': ('Rīga', 56.9560, 24.1990, ('Rimi', 'Maxima', 'Lidl')),
+    'Pļavnieki': ('Rīga', 56.9410, 24.2110, ('Rimi', 'Maxima')),
+    'Imanta': ('Rīga', 56.9540, 23.9990, ('Rimi', 'Maxima', 'Lidl')),
+    'Zolitūde': ('Rīga', 56.9450, 23.9770, ('Rimi', 'Maxima')),
+    'Āgenskalns': ('Rīga', 56.9380, 24.0780, ('Rimi', 'Maxima')),
+    'Ziepniekkalns': ('Rīga', 56.9130, 24.0930, ('Rimi', 'Maxima', 'Lidl')),
+    'Ķengarags': ('Rīga', 56.9190, 24.1740, ('Rimi', 'Maxima', 'Lidl')),
+    'Teika': ('Rīga', 56.9750, 24.1680, ('Rimi', 'Maxima')),
+    'Mežciems': ('Rīga', 56.9720, 24.2230, ('Rimi', 'Maxima')),
+    'Jugla': ('Rīga', 56.9880, 24.2490, ('Rimi', 'Maxima', 'Lidl')),
+    'Sarkandaugava': ('Rīga', 56.9920, 24.1300, ('Rimi', 'Maxima')),
+    'Vecmīlgrāvis': ('Rīga', 57.0280, 24.1160, ('Rimi', 'Maxima')),
+    'Bolderāja': ('Rīga', 57.0320, 24.0540, ('Rimi', 'Maxima')),
+    'Jūrmala': ('Jūrmala', 56.9680, 23.7700, ('Rimi', 'Maxima', 'Lidl')),
+    'Salaspils': ('Salaspils', 56.8614, 24.3497, ('Rimi', 'Maxima', 'Lidl')),
+    'Olaine': ('Olaine', 56.7853, 23.9383, ('Rimi', 'Maxima')),
+    'Ogre': ('Ogre', 56.8162, 24.6140, ('Rimi', 'Maxima', 'Lidl')),
+    'Sigulda': ('Sigulda', 57.1537, 24.8531, ('Rimi', 'Maxima', 'Lidl')),
+    'Jelgava': ('Jelgava', 56.6511, 23.7214, ('Rimi', 'Maxima', 'Lidl')),
+    'Tukums': ('Tukums', 56.9669, 23.1553, ('Rimi', 'Maxima', 'Lidl')),
+    'Dobele': ('Dobele', 56.6257, 23.2789, ('Rimi', 'Maxima')),
+    'Bauska': ('Bauska', 56.4079, 24.1944, ('Rimi', 'Maxima', 'Lidl')),
+    'Liepāja': ('Liepāja', 56.5047, 21.0108, ('Rimi', 'Maxima', 'Lidl')),
+    'Liepāja Ezerkrasts': ('Liepāja', 56.5290, 21.0330, ('Rimi', 'Maxima')),
+    'Ventspils': ('Ventspils', 57.3894, 21.5644, ('Rimi', 'Maxima', 'Lidl')),
+    'Kuldīga': ('Kuldīga', 56.9677, 21.9681, ('Rimi', 'Maxima', 'Lidl')),
+    'Talsi': ('Talsi', 57.2455, 22.5890, ('Rimi', 'Maxima', 'Lidl')),
+    'Saldus': ('Saldus', 56.6637, 22.4881, ('Rimi', 'Maxima', 'Lidl')),
+    'Valmiera': ('Valmiera', 57.5385, 25.4264, ('Rimi', 'Maxima', 'Lidl')),
+    'Cēsis': ('Cēsis', 57.3119, 25.2746, ('Rimi', 'Maxima', 'Lidl')),
+    'Limbaži': ('Limbaži', 57.5133, 24.7136, ('Rimi', 'Maxima')),
+    'Smiltene': ('Smiltene', 57.4244, 25.9016, ('Rimi', 'Maxima')),
+    'Gulbene': ('Gulbene', 57.1775, 26.7527, ('Rimi', 'Maxima')),
+    'Alūksne': ('Alūksne', 57.4242, 27.0466, ('Rimi', 'Maxima')),
+    'Madona': ('Madona', 56.8541, 26.2172, ('Rimi', 'Maxima', 'Lidl')),
+    'Aizkraukle': ('Aizkraukle', 56.6048, 25.2551, ('Rimi', 'Maxima', 'Lidl')),
+    'Jēkabpils': ('Jēkabpils', 56.4990, 25.8574, ('Rimi', 'Maxima', 'Lidl')),
+    'Daugavpils': ('Daugavpils', 55.8747, 26.5362, ('Rimi', 'Maxima', 'Lidl')),
+    'Rēzekne': ('Rēzekne', 56.5099, 27.3331, ('Rimi', 'Maxima', 'Lidl')),
+    'Preiļi': ('Preiļi', 56.2943, 26.7246, ('Rimi', 'Maxima')),
+    'Krāslava': ('Krāslava', 55.8951, 27.1681, ('Rimi', 'Maxima')),
+    'Ludza': ('Ludza', 56.5464, 27.7189, ('Rimi', 'Maxima')),
+    'Balvi': ('Balvi', 57.1313, 27.2654, ('Rimi', 'Maxima'))
+}
+
+# store -> (branch name, city, lat, lon) of every market bulk_import knows
+MARKET_LOCATIONS = {
+    'Liepājas Pētertirgus': ('Pētertirgus', 'Liepāja', 56.5093, 21.0124),
+    'Liepājas Ezerkrasta tirgus': ('Ezerkrasta tirgus', 'Liepāja', 56.5240, 21.0290),
+    'Rīgas Centrāltirgus': ('Centrāltirgus', 'Rīga', 56.9436, 24.1146),
+    'Āgenskalna tirgus': ('Āgenskalna tirgus', 'Rīga', 56.9402, 24.0790),
+    'Kalnciema tirgus': ('Kalnciema tirgus', 'Rīga', 56.9446, 24.0630),
+    'Ventspils tirgus': ('Ventspils tirgus', 'Ventspils', 57.3960, 21.5650)
+}
+
+# (store, branch name, city, lat, lon); a market added to bulk_import
+# without a location here fails at import rather than going missing
+MARKETS = [(store, *MARKET_LOCATIONS[store]) for store in BULK_IMPORT_MARKETS]
+
+# (chain, branch name, city, lat, lon), one row per branch
+BRANCHES = [
+    (chain, f"{chain} {place}", city, lat, lon)
+    for place, (city, lat, lon, chains) in PLACES.items()
+    for chain in chains
+] + MARKETS
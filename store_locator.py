@@ -0,0 +1,405 @@
+"""Nearest supermarket branches and the cheapest basket within reach
+
+Branches live in the store_branches table of the main database file,
+seeded from the bundled list in store_branches.py the first time it is
+opened and replaceable with an OpenStreetMap export. BranchIndex keeps
+them in memory on a grid of square cells, cell_km on a side, so a
+nearest or within-radius query looks at a few cells around the point
+instead of every branch. Distances are equirectangular, within a few
+metres of the great-circle distance at the scale of a shopping trip.
+
+BasketPlanner combines the nearest branch of every chain within a radius
+with the latest prices from the price snapshot: one store, or a route
+over up to max_stops stores buying each item where it is cheapest, with
+travel priced per kilometre.
+
+Usage:
+    python store_locator.py nearest --lat 56.95 --lon 24.11 -k 5
+    python store_locator.py import-osm --db grocery_guru.db supermarkets.json
+
+The OSM file is Overpass JSON, e.g. the result of
+    [out:json]; area["ISO3166-1"="LV"]->.lv;
+    nwr["shop"~"supermarket|marketplace"](area.lv); out center;
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import sqlite3
+from collections import namedtuple
+from itertools import combinations, permutations
+from database.store_branches import BRANCHES
+from utils.profiler import add_profile_argument, start_profiler
+
+KM_PER_DEGREE = 111.195
+
+# Upper bounds on query work, so one request cannot ask for the whole country
+MAX_RADIUS_KM = 50.0
+MAX_STOPS = 3
+
+# source is 'bundled' for the approximate built-in list, 'osm' for imported shops
+Branch = namedtuple('Branch', 'id chain name city address lat lon source')
+
+
+def _ensure_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS store_branches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chain TEXT NOT NULL,
+            name TEXT NOT NULL,
+            city TEXT,
+            address TEXT,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            source TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_store_branches_chain ON store_branches (chain)')
+
+
+def load_branches(db_path='grocery_guru.db') -> list:
+    """Every branch in db_path, seeding the table from the bundled list if it is empty"""
+    with sqlite3.connect(db_path, timeout=30.0) as conn:
+        _ensure_table(conn)
+        if not conn.execute('SELECT 1 FROM store_branches LIMIT 1').fetchone():
+            conn.executemany(
+                "INSERT INTO store_branches (chain, name, city, lat, lon, source) VALUES (?, ?, ?, ?, ?, 'bundled')",
+                BRANCHES
+            )
+            logging.info(f"Seeded {len(BRANCHES)} store branches from the bundled list")
+        rows = conn.execute('SELECT id, chain, name, city, address, lat, lon, source FROM store_branches ORDER BY id').fetchall()
+    return [Branch(*row) for row in rows]
+
+
+def _chain_names():
+    """folded OSM brand or name -> chain, and the chain names matched by prefix"""
+    chains = sorted({chain for chain, *_ in BRANCHES}, key=len, reverse=True)
+    exact = {}
+    for chain, name, *_ in BRANCHES:
+        exact.setdefault(name.casefold(), chain)
+        exact.setdefault(chain.casefold(), chain)
+    return exact, chains
+
+
+def read_osm(path) -> list:
+    """(chain, name, city, address, lat, lon) of the known chains' shops in an Overpass JSON file
+
+    Supermarkets match on brand or name prefix ('Rimi Hyper' is Rimi),
+    markets on their full name. Ways and relations need 'out center'.
+    """
+    exact, chains = _chain_names()
+    with open(path, encoding='utf-8') as f:
+        elements = json.load(f).get('elements', [])
+    branches = []
+    for element in elements:
+        tags = element.get('tags', {})
+        position = element if 'lat' in element else element.get('center')
+        if not position:
+            continue
+        chain = None
+        for label in (tags.get('brand'), tags.get('name')):
+            if not label:
+                continue
+            folded = label.casefold()
+            chain = exact.get(folded) or next((c for c in chains if folded.startswith(c.casefold())), None)
+            if chain:
+                break
+        if chain is None:
+            continue
+        street = ' '.join(filter(None, (tags.get('addr:street'), tags.get('addr:housenumber'))))
+        branches.append((
+            chain,
+            tags.get('name') or chain,
+            tags.get('addr:city'),
+            street or None,
+            float(position['lat']),
+            float(position['lon'])
+        ))
+    return branches
+
+
+def import_osm(db_path, path) -> dict:
+    """Replace the branches of every chain found in an Overpass JSON file, returns counts per chain"""
+    branches = read_osm(path)
+    counts = {}
+    for chain, *_ in branches:
+        counts[chain] = counts.get(chain, 0) + 1
+    with sqlite3.connect(db_path, timeout=30.0) as conn:
+        _ensure_table(conn)
+        # Chains missing from the export keep their bundled branches
+        conn.executemany('DELETE FROM store_branches WHERE chain = ?', [(chain,) for chain in counts])
+        conn.executemany(
+            "INSERT INTO store_branches (chain, name, city, address, lat, lon, source) VALUES (?, ?, ?, ?, ?, ?, 'osm')",
+            branches
+        )
+    return counts
+
+
+class BranchIndex:
+    """k-nearest and within-radius queries over branches held on a grid
+
+    Cells are cell_km tall and at least cell_km wide at every latitude up
+    to the northernmost branch plus a margin; queries further from the
+    equator than that, and queries whose ring of cells would visit more
+    cells than there are branches, scan the branches instead.
+    """
+
+    def __init__(self, branches, cell_km=2.0):
+        self.branches = list(branches)
+        self.cell_km = cell_km
+        self._dlat = cell_km / KM_PER_DEGREE
+        self._max_lat = max((abs(b.lat) for b in self.branches), default=0.0) + 1.0
+        self._dlon = cell_km / (KM_PER_DEGREE * math.cos(math.radians(min(self._max_lat, 89.0))))
+        self._grids = {None: self._grid(self.branches)}
+        for chain in {b.chain for b in self.branches}:
+            self._grids[chain] = self._grid([b for b in self.branches if b.chain == chain])
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self._dlat), math.floor(lon / self._dlon)
+
+    def _grid(self, branches):
+        """(cell -> entries, all entries); entries are (lat, lon, branch) to skip attribute lookups"""
+        cells = {}
+        entries = [(b.lat, b.lon, b) for b in branches]
+        for entry in entries:
+            cells.setdefault(self._cell(entry[0], entry[1]), []).append(entry)
+        return cells, entries
+
+    @property
+    def chains(self) -> list:
+        return sorted(chain for chain in self._grids if chain is not None)
+
+    def __len__(self):
+        return len(self.branches)
+
+    @staticmethod
+    def distance(lat1, lon1, lat2, lon2) -> float:
+        """Equirectangular distance in km, longitude scaled at the first point's latitude"""
+        x = (lon2 - lon1) * math.cos(math.radians(lat1))
+        return KM_PER_DEGREE * math.hypot(x, lat2 - lat1)
+
+    def _ring(self, cells, ci, cj, r):
+        """Entries in the cells at Chebyshev distance r from (ci, cj)"""
+        if r == 0:
+            yield from cells.get((ci, cj), ())
+            return
+        for i in (ci - r, ci + r):
+            for j in range(cj - r, cj + r + 1):
+                yield from cells.get((i, j), ())
+        for j in (cj - r, cj + r):
+            for i in range(ci - r + 1, ci + r):
+                yield from cells.get((i, j), ())
+
+    @staticmethod
+    def _measure(lat, lon, entries):
+        """(distance_km, Branch) per entry, the same distances as distance(lat, lon, ...)"""
+        kx = math.cos(math.radians(lat))
+        return [
+            (KM_PER_DEGREE * math.hypot((b_lon - lon) * kx, b_lat - lat), branch)
+            for b_lat, b_lon, branch in entries
+        ]
+
+    def nearest(self, lat, lon, k=1, chain=None, max_km=None) -> list:
+        """Up to k (distance_km, Branch) closest to the point, nearest first"""
+        if chain not in self._grids or k <= 0:
+            return []
+        cells, entries = self._grids[chain]
+        if abs(lat) > self._max_lat:
+            found = self._measure(lat, lon, entries)
+        else:
+            ci, cj = self._cell(lat, lon)
+            found = []
+            kth = None
+            r = 0
+            while True:
+                ring = self._measure(lat, lon, self._ring(cells, ci, cj, r))
+                if ring:
+                    found.extend(ring)
+                    if len(found) >= k:
+                        kth = heapq.nsmallest(k, found, key=_first)[-1][0]
+                # Everything outside rings 0..r is further than r cells away
+                reach = r * self.cell_km
+                if kth is not None and kth <= reach:
+                    break
+                if max_km is not None and reach >= max_km:
+                    break
+                r += 1
+                if (2 * r + 1) ** 2 > len(entries):
+                    found = self._measure(lat, lon, entries)
+                    break
+        if max_km is not None:
+            found = [item for item in found if item[0] <= max_km]
+        return heapq.nsmallest(k, found, key=_first)
+
+    def within(self, lat, lon, radius_km, chain=None) -> list:
+        """(distance_km, Branch) of every branch within radius_km, nearest first"""
+        if chain not in self._grids:
+            return []
+        cells, entries = self._grids[chain]
+        rings = math.ceil(radius_km / self.cell_km)
+        if abs(lat) > self._max_lat or (2 * rings + 1) ** 2 > len(entries):
+            candidates = self._measure(lat, lon, entries)
+        else:
+            ci, cj = self._cell(lat, lon)
+            candidates = self._measure(lat, lon, (e for r in range(rings + 1) for e in self._ring(cells, ci, cj, r)))
+        found = [item for item in candidates if item[0] <= radius_km]
+        found.sort(key=_first)
+        return found
+
+    def nearest_per_chain(self, lat, lon, radius_km) -> dict:
+        """chain -> (distance_km, Branch) of its closest branch within radius_km"""
+        closest = {}
+        for distance, branch in self.within(lat, lon, radius_km):
+            closest.setdefault(branch.chain, (distance, branch))
+        return closest
+
+
+def _first(item):
+    return item[0]
+
+
+def branch_json(branch, distance=None) -> dict:
+    """JSON-ready fields of a branch, with its distance when given
+
+    Bundled branches sit at the centre of their town or neighbourhood, so
+    they are flagged approximate until an OSM export replaces them.
+    """
+    result = {
+        'id': branch.id,
+        'chain': branch.chain,
+        'name': branch.name,
+        'city': branch.city,
+        'address': branch.address,
+        'lat': branch.lat,
+        'lon': branch.lon,
+        'source': branch.source,
+        'approximate': branch.source == 'bundled'
+    }
+    if distance is not None:
+        result['distance_km'] = round(distance, 2)
+    return result
+
+
+class BasketPlanner:
+    """Cheapest way to buy a shopping list at the branches within reach
+
+    Prices are per chain, from a PriceSnapshot. A plan visits one to
+    max_stops of the nearest branches, buying each item at the cheapest
+    of them, and pays cost_per_km for the shortest round trip from home.
+    Plans rank by items missing, then total cost.
+    """
+
+    def __init__(self, index, price_snapshot, cost_per_km=0.0):
+        self.index = index
+        self.price_snapshot = price_snapshot
+        self.cost_per_km = cost_per_km
+
+    def _tour_km(self, lat, lon, branches):
+        """Shortest round trip from (lat, lon) through every branch"""
+        best = None
+        for order in permutations(branches):
+            km = 0.0
+            here = (lat, lon)
+            for branch in order:
+                km += self.index.distance(here[0], here[1], branch.lat, branch.lon)
+                here = (branch.lat, branch.lon)
+            km += self.index.distance(here[0], here[1], lat, lon)
+            if best is None or km < best:
+                best = km
+        return best or 0.0
+
+    def plan(self, lat, lon, items, radius_km=3.0, max_stops=1, cost_per_km=None, limit=5) -> dict:
+        """Rank ways to buy items ({name: quantity}) within radius_km of the point"""
+        cost_per_km = self.cost_per_km if cost_per_km is None else cost_per_km
+        max_stops = max(1, min(max_stops, MAX_STOPS))
+        nearby = self.index.nearest_per_chain(lat, lon, radius_km)
+        # name -> {chain: price} restricted to the chains in reach
+        prices = {}
+        for name in items:
+            store_prices = self.price_snapshot.prices(name)
+            prices[name] = {chain: price for chain, price in store_prices.items() if chain in nearby}
+
+        plans = []
+        # Chains in reach that sell none of the items cannot improve a plan
+        chains = sorted(chain for chain in nearby if any(chain in offers for offers in prices.values()))
+        for size in range(1, min(max_stops, len(chains)) + 1):
+            for stops in combinations(chains, size):
+                plan = self._plan(lat, lon, items, prices, nearby, stops, cost_per_km)
+                if plan is not None:
+                    plans.append(plan)
+        plans.sort(key=lambda plan: (len(plan['missing']), plan['total']))
+        return {
+            'stores_nearby': [branch_json(branch, distance) for distance, branch in sorted(nearby.values(), key=_first)],
+            'unpriced': sorted(name for name, chain_prices in prices.items() if not chain_prices),
+            'plans': plans[:limit],
+            'cheapest': plans[0] if plans else None
+        }
+
+    def _plan(self, lat, lon, items, prices, nearby, stops, cost_per_km):
+        """One plan over the given chains, None if a stop would buy nothing"""
+        basket = {chain: [] for chain in stops}
+        missing = []
+        items_total = 0.0
+        for name, quantity in items.items():
+            offers = [(prices[name][chain], chain) for chain in stops if chain in prices[name]]
+            if not offers:
+                missing.append(name)
+                continue
+            price, chain = min(offers)
+            basket[chain].append({'name': name, 'quantity': quantity, 'price': price})
+            items_total += price * quantity
+        # A stop where nothing is cheapest only adds travel, a smaller plan beats it
+        if len(stops) > 1 and not all(basket.values()):
+            return None
+        branches = [nearby[chain][1] for chain in stops]
+        travel_km = self._tour_km(lat, lon, branches)
+        travel_cost = travel_km * cost_per_km
+        return {
+            'stops': [
+                {
+                    **branch_json(nearby[chain][1], nearby[chain][0]),
+                    'items': basket[chain],
+                    'subtotal': round(sum(item['price'] * item['quantity'] for item in basket[chain]), 2)
+                }
+                for chain in sorted(stops, key=lambda chain: nearby[chain][0])
+            ],
+            'missing': missing,
+            'items_total': round(items_total, 2),
+            'travel_km': round(travel_km, 2),
+            'travel_cost': round(travel_cost, 2),
+            'total': round(items_total + travel_cost, 2)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store branch locations for Grocery Guru")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    nearest_parser = commands.add_parser('nearest', help="list the branches nearest to a point")
+    nearest_parser.add_argument('--db', default='grocery_guru.db')
+    nearest_parser.add_argument('--lat', type=float, required=True)
+    nearest_parser.add_argument('--lon', type=float, required=True)
+    nearest_parser.add_argument('-k', type=int, default=5)
+    nearest_parser.add_argument('--chain')
+
+    osm_parser = commands.add_parser('import-osm', help="replace branches with those in an Overpass JSON file")
+    osm_parser.add_argument('path')
+    osm_parser.add_argument('--db', default='grocery_guru.db')
+
+    add_profile_argument(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    start_profiler(f"locator-{args.command}", args.profile)
+    if args.command == 'nearest':
+        index = BranchIndex(load_branches(args.db))
+        for distance, branch in index.nearest(args.lat, args.lon, args.k, args.chain):
+            approximate = ' (approximate)' if branch.source == 'bundled' else ''
+            print(f"{distance:7.2f} km  {branch.chain:<10} {branch.name}, {branch.city}{approximate}")
+    else:
+        for chain, count in sorted(import_osm(args.db, args.path).items()):
+            print(f"{chain:<28} {count:>5} branches")
+
+
+if __name__ == '__main__':
+    main()
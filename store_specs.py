@@ -0,0 +1,183 @@
+"""Declarative definitions of the stores Grocery Guru scrapes
+
+Each store is data rather than code. extraction.compile_spec turns a spec
+into an extraction plan once, and a SpecScraper subclass runs it, so a
+new chain (Top!, Elvi, Mego, ...) is a spec here plus a two-line class.
+
+Store keys:
+    store        store name as saved in the database
+    base_url     site root, endpoint paths hang off it
+    pagination   search paging: 'param' and 'start' for the page number,
+                 optional 'size_param' and 'size', and 'pages' read per search
+    endpoints    page kind ('search', 'promotions', 'product') -> endpoint
+
+Endpoint keys:
+    path         path below base_url; product pages are fetched by URL instead
+    params       fixed query parameters, the value '{query}' is the search term
+    format       'json' or 'html'
+    items        where the items are: a dotted path into the JSON or a CSS
+                 selector; product pages have no items, they are one item
+    fields       record field -> source. JSON sources are dotted paths
+                 ('price.amount', 'images.0.url'). HTML sources are CSS
+                 selectors read as stripped text, or with '@attr' as an
+                 attribute, '@data-src|src' taking the first one present
+    optional     fields that may be missing, read as None
+    defaults     HTML: value of a field whose element has no such attribute
+    templates    field -> format string for the value, e.g. '/p/{}'
+    skip_without HTML: items without this field's element are skipped quietly,
+                 e.g. placeholder cards without a price
+    embedded     HTML: product JSON embedded in the page, read before the DOM.
+                 'json_ld' for schema.org blocks; 'card_marker', 'card_json'
+                 and 'original_price_class' for per-card analytics JSON;
+                 'fields' maps record fields to the embedded product's name,
+                 price, original_price, href and image
+    price        'decimal' for prices such as 1.99, '1,99' or '€1.99' (the
+                 default), 'cents' for integer cents
+
+Search records read name, price, url and image; promotions read name,
+original_price, discount_price, url, valid_until and image; product pages
+read price. url and image are resolved against the store's site.
+"""
+
+RIMI = {
+    'store': 'Rimi',
+    'base_url': 'https://www.rimi.lv',
+    'pagination': {'param': 'page', 'start': 1},
+    'endpoints': {
+        'search': {
+            'path': '/e-veikals/meklet',
+            'params': {'q': '{query}'},
+            'format': 'html',
+            'embedded': {
+                'json_ld': True,
+                'card_marker': 'product-grid__item',
+                'card_json': 'data-gtm-eec-product',
+                'original_price_class': 'price-tag__original-price',
+                'fields': {'name': 'name', 'price': 'price', 'url': 'href', 'image': 'image'}
+            },
+            'items': 'div.product-grid__item',
+            'fields': {
+                'name': 'p.card__name',
+                'price': 'div.price-tag@data-price',
+                'url': 'a@href',
+                'image': 'img@data-src|src'
+            },
+            'optional': ('url', 'image'),
+            'defaults': {'price': 0},
+            'skip_without': 'price'
+        },
+        'promotions': {
+            'path': '/e-veikals/akcijas',
+            'format': 'html',
+            'embedded': {
+                'json_ld': True,
+                'card_marker': 'product-grid__item',
+                'card_json': 'data-gtm-eec-product',
+                'original_price_class': 'price-tag__original-price',
+                'fields': {
+                    'name': 'name',
+                    'original_price': 'original_price',
+                    'discount_price': 'price',
+                    'url': 'href',
+                    'image': 'image'
+                }
+            },
+            'items': 'div.product-grid__item',
+            'fields': {
+                'name': 'p.card__name',
+                'original_price': 'span.price-tag__original-price',
+                'discount_price': 'div.price-tag@data-price',
+                'url': 'a@href',
+                'image': 'img@data-src|src'
+            },
+            'optional': ('url', 'image'),
+            'defaults': {'discount_price': 0},
+            'skip_without': 'discount_price'
+        },
+        'product': {
+            'format': 'html',
+            # Only JSON-LD describes the page's own product; the first card
+            # may belong to a carousel of similar products
+            'embedded': {
+                'json_ld': True,
+                'fields': {'price': 'price'}
+            },
+            'fields': {'price': 'div.price-tag@data-price'},
+            'defaults': {'price': 0}
+        }
+    }
+}
+
+MAXIMA = {
+    'store': 'Maxima',
+    'base_url': 'https://www.maxima.lv',
+    'pagination': {'param': 'page', 'start': 1, 'size_param': 'limit', 'size': 20},
+    'endpoints': {
+        'search': {
+            'path': '/api/products/search',
+            'params': {'q': '{query}'},
+            'format': 'json',
+            'items': 'items',
+            'fields': {'name': 'name', 'price': 'price', 'url': 'slug', 'image': 'image'},
+            'optional': ('image',),
+            'templates': {'url': '/products/{}'}
+        },
+        'promotions': {
+            'path': '/api/promotions',
+            'format': 'json',
+            'items': 'items',
+            'fields': {
+                'name': 'name',
+                'original_price': 'original_price',
+                'discount_price': 'discount_price',
+                'url': 'slug',
+                'valid_until': 'valid_until',
+                'image': 'image'
+            },
+            'optional': ('valid_until', 'image'),
+            'templates': {'url': '/promotions/{}'}
+        },
+        'product': {
+            'format': 'html',
+            'fields': {'price': 'span.product-price'}
+        }
+    }
+}
+
+LIDL = {
+    'store': 'Lidl',
+    'base_url': 'https://www.lidl.lv',
+    'pagination': {'param': 'page', 'start': 1, 'size_param': 'pageSize', 'size': 20},
+    'endpoints': {
+        'search': {
+            'path': '/api/search',
+            'params': {'query': '{query}'},
+            'format': 'json',
+            'items': 'products',
+            'fields': {'name': 'name', 'price': 'price.amount', 'url': 'slug', 'image': 'images.0.url'},
+            'optional': ('image',),
+            'templates': {'url': '/p/{}'}
+        },
+        'promotions': {
+            'path': '/api/promotions/current',
+            'format': 'json',
+            'items': 'items',
+            'fields': {
+                'name': 'name',
+                'original_price': 'regularPrice.amount',
+                'discount_price': 'discountPrice.amount',
+                'url': 'slug',
+                'valid_until': 'validUntil',
+                'image': 'images.0.url'
+            },
+            'optional': ('valid_until', 'image'),
+            'templates': {'url': '/offers/{}'}
+        },
+        'product': {
+            'format': 'html',
+            'fields': {'price': 'span.pricebox__price'}
+        }
+    }
+}
+
+STORE_SPECS = {spec['store']: spec for spec in (RIMI, MAXIMA, LIDL)}
@@ -0,0 +1,219 @@
+"""Fill a Grocery Guru database with realistic synthetic data
+
+Usage:
+    python synthetic_data.py --db synthetic.db --products 100000 --history 10000000
+    python synthetic_data.py --submissions market.csv --submission-rows 1000000
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from database.db_manager import DatabaseManager
+
+STORES = ('Rimi', 'Maxima', 'Lidl')
+
+BRANDS = [
+    'Tukuma', 'Valmieras', 'Smiltenes', 'Rīgas', 'Cēsu', 'Druva', 'Lāči', 'Baltais',
+    'Zemnieku', 'Kārums', 'Limbažu', 'Jaunpils', 'Madonas', 'Talsu', 'Rūjienas',
+    'Daugavpils', 'Bauskas', 'Ogres', 'Aizkraukles', 'Latvijas', 'Rimi', 'Maxima', 'Pilos'
+]
+PRODUCTS = [
+    'piens', 'kefīrs', 'jogurts', 'biezpiens', 'krējums', 'sviests', 'siers', 'maize',
+    'rupjmaize', 'baltmaize', 'olas', 'vistas fileja', 'cūkgaļa', 'liellopu gaļa', 'desa',
+    'cīsiņi', 'šķiņķis', 'kartupeļi', 'burkāni', 'sīpoli', 'kāposti', 'āboli', 'banāni',
+    'tomāti', 'gurķi', 'rīsi', 'griķi', 'milti', 'cukurs', 'sāls', 'kafija', 'tēja',
+    'sula', 'ūdens', 'alus', 'šokolāde', 'cepumi', 'saldējums', 'sēnes', 'zivis', 'siļķe'
+]
+DESCRIPTORS = [
+    'klasiskais', 'bioloģiskais', 'lauku', 'svaigs', 'kūpināts', 'vājpiena', 'pilnpiena',
+    'bez laktozes', 'ar zemenēm', 'ar ķiplokiem', 'mājas', 'premium', 'ekonomiskais', ''
+]
+SIZES = ['100g', '200g', '250g', '400g', '500g', '750g', '1kg', '0.5l', '1l', '1.5l', '2l', '6gab', '10gab']
+
+BATCH_SIZE = 50000
+
+
+def product_name(rng: random.Random, serial: int) -> str:
+    """Build a Latvian-looking product name, unique thanks to the serial suffix"""
+    parts = [rng.choice(BRANDS), rng.choice(PRODUCTS), rng.choice(DESCRIPTORS), rng.choice(SIZES)]
+    return ' '.join(p for p in parts if p) + f' #{serial}'
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(db_path, products=100000, history_rows=10000000, lists=1000, items_per_list=20,
+             days=3 * 365, seed=42, progress=print):
+    """Generate products, price history and shopping lists into db_path
+
+    Each product name is sold by one to three stores. History rows are a
+    random walk per product spread over the last `days` days, and each
+    product's current price is its last history entry.
+    """
+    rng = random.Random(seed)
+    DatabaseManager(db_path)  # creates the schema
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    now = datetime.now()
+    start = now - timedelta(days=days)
+    span_seconds = days * 86400
+    history_per_product = max(1, history_rows // max(products, 1))
+    started = time.perf_counter()
+
+    # Product rows: names shared across stores so comparisons are meaningful
+    product_rows = []
+    serial = 0
+    while len(product_rows) < products:
+        serial += 1
+        name = product_name(rng, serial)
+        base_price = round(rng.uniform(0.3, 15.0), 2)
+        for store in rng.sample(STORES, rng.randint(1, 3)):
+            if len(product_rows) == products:
+                break
+            product_rows.append((name, store, base_price * rng.uniform(0.85, 1.15)))
+
+    next_id = (conn.execute('SELECT COALESCE(MAX(id), 0) FROM products').fetchone()[0]) + 1
+    first_id = next_id
+
+    def history():
+        product_id = first_id
+        for name, store, price in product_rows:
+            # Random walk of prices, timestamps in increasing order
+            count = max(1, int(rng.gauss(history_per_product, history_per_product / 4)))
+            step = span_seconds / count
+            for i in range(count):
+                price = max(0.05, price * (1 + rng.gauss(0, 0.02)))
+                recorded = start + timedelta(seconds=i * step + rng.random() * step)
+                yield (product_id, round(price, 2), recorded.isoformat())
+            product_id += 1
+
+    final_prices = {}
+    inserted = 0
+    with conn:
+        conn.executemany(
+            'INSERT INTO products (id, name, store, price, url, last_updated) VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                (first_id + i, name, store, round(price, 2), f"https://example.lv/{store.lower()}/{first_id + i}", now.isoformat())
+                for i, (name, store, price) in enumerate(product_rows)
+            )
+        )
+    progress(f"products: {len(product_rows)} rows")
+
+    for batch in _batched(history()):
+        with conn:
+            conn.executemany('INSERT INTO price_history (product_id, price, recorded_at) VALUES (?, ?, ?)', batch)
+        for product_id, price, recorded_at in batch:
+            final_prices[product_id] = (price, recorded_at)
+        inserted += len(batch)
+        if inserted % (BATCH_SIZE * 20) == 0:
+            progress(f"price_history: {inserted} rows")
+        if inserted >= history_rows:
+            break
+    progress(f"price_history: {inserted} rows")
+
+    with conn:
+        conn.executemany(
+            'UPDATE products SET price = ?, last_updated = ? WHERE id = ?',
+            ((price, recorded_at, product_id) for product_id, (price, recorded_at) in final_prices.items())
+        )
+
+        product_count = len(product_rows)
+        for list_number in range(lists):
+            cursor = conn.execute(
+                'INSERT INTO shopping_lists (name, created_at) VALUES (?, ?)',
+                (f"Saraksts {list_number + 1}", (now - timedelta(days=rng.randint(0, days))).isoformat())
+            )
+            list_id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO shopping_list_items (list_id, product_id, quantity) VALUES (?, ?, ?)',
+                [
+                    (list_id, first_id + rng.randrange(product_count), rng.randint(1, 5))
+                    for _ in range(items_per_list)
+                ]
+            )
+    progress(f"shopping_lists: {lists} lists with {items_per_list} items each")
+    conn.close()
+    progress(f"done in {time.perf_counter() - started:.1f}s")
+    return {'products': len(product_rows), 'price_history': inserted, 'shopping_lists': lists}
+
+
+MARKET_PRODUCTS = [
+    ('kartupeļi', 'kg', 0.6), ('burkāni', 'kg', 0.9), ('sīpoli', 'kg', 1.1), ('āboli', 'kg', 1.5),
+    ('zemenes', 'kg', 6.0), ('gurķi', 'kg', 2.5), ('tomāti', 'kg', 3.2), ('dille', 'saišķis', 0.8),
+    ('olas', 'gab', 0.3), ('medus', 'kg', 12.0), ('biezpiens', 'kg', 5.5), ('kūpināta zivs', 'kg', 11.0),
+    ('sēnes', 'l', 4.0), ('mellenes', 'l', 5.0), ('rupjmaize', 'gab', 2.8)
+]
+MARKET_NAMES = [
+    ('Pētertirgus', ''), ('Liepājas Pētertirgus', ''), ('peter market', ''), ('', 'Pētertirgus'),
+    ('Centrāltirgus', ''), ('Rīgas Centrāltirgus', ''), ('Āgenskalna tirgus', ''), ('Ezerkrasta tirgus', '')
+]
+
+
+def write_market_submissions(path, rows=1000000, days=90, bad_fraction=0.02, seed=42):
+    """Write a CSV of crowd-sourced market prices as bulk_import reads them
+
+    About bad_fraction of the rows are broken in the ways contributors
+    break them: prices that are not numbers or far out of range, unknown
+    units, missing names and repeated rows.
+    """
+    rng = random.Random(seed)
+    today = datetime.now().date()
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('name;price;unit;quantity;market;stall;date\n')
+        previous = None
+        for i in range(rows):
+            product, unit, price = rng.choice(MARKET_PRODUCTS)
+            market, stall = rng.choice(MARKET_NAMES)
+            quantity = rng.choice(('', '1', '0,5')) if unit == 'kg' else ''
+            scale = 0.5 if quantity == '0,5' else 1.0
+            date = (today - timedelta(days=rng.randrange(days))).strftime(rng.choice(('%Y-%m-%d', '%d.%m.%Y')))
+            row = [
+                f"{rng.choice(BRANDS)} {product}",
+                f"{price * scale * rng.uniform(0.7, 1.4):.2f}".replace('.', rng.choice('.,')),
+                unit, quantity, market, stall or f"stends {rng.randint(1, 40)}", date
+            ]
+            if rng.random() < bad_fraction:
+                fault = rng.randrange(4)
+                if fault == 0:
+                    row[1] = rng.choice(('lēti', '', '12.5.3', '9999'))
+                elif fault == 1:
+                    row[2] = rng.choice(('mārciņa', 'kaste'))
+                elif fault == 2:
+                    row[0] = ''
+                elif previous:
+                    row = previous
+            f.write(';'.join(row) + '\n')
+            previous = row
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Grocery Guru data")
+    parser.add_argument('--db', default='synthetic.db', help="database file to fill")
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--history', type=int, default=10000000, help="price history rows")
+    parser.add_argument('--lists', type=int, default=1000)
+    parser.add_argument('--items-per-list', type=int, default=20)
+    parser.add_argument('--days', type=int, default=3 * 365, help="days of history to spread rows over")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--submissions', metavar='CSV', help="write crowd-sourced market prices for bulk_import instead")
+    parser.add_argument('--submission-rows', type=int, default=1000000)
+    args = parser.parse_args()
+    if args.submissions:
+        write_market_submissions(args.submissions, args.submission_rows, seed=args.seed)
+        return
+    generate(args.db, args.products, args.history, args.lists, args.items_per_list, args.days, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskCancelled(Exception):
+    """Raised inside a worker when its task has been cancelled"""
+    pass
+
+
+class Task:
+    """Handle for a unit of background work"""
+
+    def __init__(self, runner, group=None, on_result=None, on_error=None, on_progress=None):
+        self.runner = runner
+        self.group = group
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        """Stop the worker early if the task was cancelled"""
+        if self._cancelled.is_set():
+            raise TaskCancelled()
+
+    def report_progress(self, value):
+        """Report progress from the worker thread, e.g. a percentage"""
+        self.runner._post('progress', self, value)
+
+
+class TaskRunner:
+    """Runs blocking work off the Tk thread and delivers results back on it
+
+    Workers never touch widgets. Results, errors and progress go through a
+    thread-safe queue that is drained from the Tk event loop via root.after,
+    so every callback runs on the Tk thread.
+    """
+
+    def __init__(self, root, max_workers=6, poll_interval_ms=50, max_messages_per_poll=100):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.max_messages_per_poll = max_messages_per_poll
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='grocery-guru')
+        self.messages = queue.Queue()
+        self.groups = {}  # group name -> set of live tasks
+        self._lock = threading.Lock()
+        self._closed = False
+        self._poll_id = self.root.after(self.poll_interval_ms, self._drain)
+
+    def submit(self, fn, *args, group=None, on_result=None, on_error=None, on_progress=None) -> Task:
+        """Run fn(task, *args) in a worker thread"""
+        task = Task(self, group, on_result, on_error, on_progress)
+        if group is not None:
+            with self._lock:
+                self.groups.setdefault(group, set()).add(task)
+        # Carry context variables such as the current trace span into the worker
+        self.executor.submit(contextvars.copy_context().run, self._run, task, fn, args)
+        return task
+
+    def cancel_group(self, group):
+        """Cancel every live task in a group, dropping their pending results"""
+        with self._lock:
+            tasks = self.groups.pop(group, set())
+        for task in tasks:
+            task.cancel()
+
+    def has_running(self, group) -> bool:
+        with self._lock:
+            return bool(self.groups.get(group))
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            groups = list(self.groups)
+        for group in groups:
+            self.cancel_group(group)
+        try:
+            self.root.after_cancel(self._poll_id)
+        except Exception:
+            pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, task, fn, args):
+        if task.cancelled:
+            return
+        try:
+            result = fn(task, *args)
+            self._post('result', task, result)
+        except TaskCancelled:
+            pass
+        except Exception as e:
+            logging.error(f"Error in background task: {str(e)}")
+            self._post('error', task, e)
+        finally:
+            if task.group is not None:
+                with self._lock:
+                    self.groups.get(task.group, set()).discard(task)
+
+    def _post(self, kind, task, payload):
+        if not task.cancelled:
+            self.messages.put((kind, task, payload))
+
+    def _drain(self):
+        """Deliver queued messages on the Tk thread"""
+        # Bound the work per tick so a flood of results cannot stall the UI
+        for _ in range(self.max_messages_per_poll):
+            try:
+                kind, task, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if task.cancelled:
+                continue
+            callback = {
+                'result': task.on_result,
+                'error': task.on_error,
+                'progress': task.on_progress
+            }[kind]
+            if callback:
+                try:
+                    callback(payload)
+                except Exception as e:
+                    logging.error(f"Error in task callback: {str(e)}")
+        if not self._closed:
+            self._poll_id = self.root.after(self.poll_interval_ms, self._drain)
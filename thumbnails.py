@@ -0,0 +1,279 @@
+"""Product thumbnails fetched in the background and cached on disk and in memory
+
+Each lookup tries three tiers in turn:
+
+    memory   PhotoImages already made, keyed by (url, size), least recently used dropped
+    disk     downscaled PNGs named after a hash of the original image bytes, so a
+             photo shared by several URLs is stored once; the least recently used
+             files are deleted once the cache outgrows max_bytes
+    network  a few worker threads sharing a bounded connection pool, serving the
+             most recently requested images first
+
+Downloading, decoding and resizing run on the workers. Only the PhotoImage
+is made on the Tk thread, which Tk requires.
+"""
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from utils.metrics import metrics
+from utils.task_runner import TaskRunner
+
+THUMBNAIL_LOADS = metrics.counter('thumbnail_loads_total', 'Thumbnails served by cache tier', ('source',))
+CACHE_BYTES = metrics.gauge('thumbnail_cache_bytes', 'Size of the on-disk thumbnail cache')
+
+# (width, height) of the images made from every photo
+SIZES = {
+    'row': (32, 32),
+    'detail': (200, 200)
+}
+
+# Photos larger than this are not downloaded in full
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser('~'), '.grocery_guru', 'thumbnails')
+
+
+def downscale(data: bytes) -> dict:
+    """Decode a photo and return {size name: PNG bytes} for every entry in SIZES"""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        # Let JPEG decode at a reduced scale, much cheaper than decoding full size
+        image.draft('RGB', max(SIZES.values()))
+        image = image.convert('RGBA')
+    thumbnails = {}
+    for name, size in SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size, Image.LANCZOS)
+        # Centre on a transparent canvas so every row image lines up
+        canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+        canvas.paste(thumbnail, ((size[0] - thumbnail.width) // 2, (size[1] - thumbnail.height) // 2))
+        buffer = io.BytesIO()
+        canvas.save(buffer, 'PNG', optimize=True)
+        thumbnails[name] = buffer.getvalue()
+    return thumbnails
+
+
+class ThumbnailCache:
+    """Content-addressed thumbnail files with a size-bounded LRU index"""
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_files_last_used ON files (last_used)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM files').fetchone()[0]
+        CACHE_BYTES.set(self.total_bytes)
+
+    @staticmethod
+    def _file_name(digest, size):
+        return f"{digest[:2]}/{digest}-{size}.png"
+
+    def load(self, url, size):
+        """PNG bytes of a cached thumbnail, or None on a miss"""
+        with self._lock:
+            row = self.conn.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return None
+            name = self._file_name(row[0], size)
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return None
+            self.conn.execute('UPDATE files SET last_used = ? WHERE name = ?', (time.time(), name))
+            self.conn.commit()
+            return data
+
+    def store(self, url, original: bytes, thumbnails: dict):
+        """Save the thumbnails of a downloaded photo, evicting old ones if over budget"""
+        digest = hashlib.sha256(original).hexdigest()
+        with self._lock:
+            now = time.time()
+            for size, data in thumbnails.items():
+                name = self._file_name(digest, size)
+                path = os.path.join(self.directory, name)
+                existing = self.conn.execute('SELECT bytes FROM files WHERE name = ?', (name,)).fetchone()
+                if existing is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # A cache file can be rebuilt, so replacing atomically is enough, no fsync
+                    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'wb') as f:
+                            f.write(data)
+                        os.replace(tmp_path, path)
+                    except BaseException:
+                        os.unlink(tmp_path)
+                        raise
+                    self.total_bytes += len(data)
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO files (name, bytes, last_used) VALUES (?, ?, ?)',
+                    (name, len(data), now)
+                )
+            self.conn.execute('INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)', (url, digest))
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+            CACHE_BYTES.set(self.total_bytes)
+
+    def _evict(self):
+        # Go a little below the budget so the next few stores don't evict again
+        target = self.max_bytes * 0.9
+        digests = set()
+        for name, size in self.conn.execute('SELECT name, bytes FROM files ORDER BY last_used').fetchall():
+            if self.total_bytes <= target:
+                break
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            self.conn.execute('DELETE FROM files WHERE name = ?', (name,))
+            self.total_bytes -= size
+            digests.add(os.path.basename(name).split('-')[0])
+        # Forget URLs once none of their thumbnails are left
+        for digest in digests:
+            prefix = f"{digest[:2]}/{digest}-"
+            remaining = self.conn.execute(
+                'SELECT 1 FROM files WHERE name >= ? AND name < ? LIMIT 1', (prefix, prefix[:-1] + '.')
+            ).fetchone()
+            if remaining is None:
+                self.conn.execute('DELETE FROM urls WHERE digest = ?', (digest,))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class ThumbnailService:
+    """Hands out PhotoImages for product photos, loading missing ones in the background
+
+    Call image(url) from the Tk thread while rendering. A miss returns None
+    and queues the photo; listeners run on the Tk thread once it is ready,
+    and the next image(url) returns it.
+    """
+
+    # Queued photos beyond this are dropped, oldest first, as they have scrolled out of view
+    MAX_QUEUED = 200
+    # URLs that failed are not retried for this long
+    RETRY_SECONDS = 300.0
+
+    def __init__(self, root, cache=None, max_connections=4, memory_items=1000, timeout=10.0):
+        self.root = root
+        self.cache = cache or ThumbnailCache()
+        self.memory_items = memory_items
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # One worker per connection, so the pool never has to wait for a free socket
+        self.tasks = TaskRunner(root, max_workers=max_connections)
+        self.photos = OrderedDict()  # (url, size) -> PhotoImage
+        self.failed = {}  # url -> time it failed
+        self.listeners = []
+        self._queued = OrderedDict()  # (url, size) -> None, newest last
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Register callback() to run on the Tk thread whenever new images are ready"""
+        self.listeners.append(callback)
+
+    def image(self, url, size='row'):
+        """PhotoImage for url at a SIZES entry, or None while it loads"""
+        if not url:
+            return None
+        key = (url, size)
+        photo = self.photos.get(key)
+        if photo is not None:
+            self.photos.move_to_end(key)
+            THUMBNAIL_LOADS.inc(source='memory')
+            return photo
+        failed_at = self.failed.get(url)
+        if failed_at is not None:
+            if time.monotonic() - failed_at < self.RETRY_SECONDS:
+                return None
+            del self.failed[url]
+        with self._lock:
+            if key in self._queued:
+                self._queued.move_to_end(key)
+                return None
+            self._queued[key] = None
+            while len(self._queued) > self.MAX_QUEUED:
+                self._queued.popitem(last=False)
+        self.tasks.submit(self._load_newest, group='thumbnails', on_result=self._on_loaded)
+        return None
+
+    def _load_newest(self, task):
+        """Worker: load whichever queued photo was asked for most recently"""
+        with self._lock:
+            if not self._queued:
+                return None
+            key, _ = self._queued.popitem()
+        url, size = key
+        try:
+            data = self.cache.load(url, size)
+            if data is not None:
+                THUMBNAIL_LOADS.inc(source='disk')
+            else:
+                data = self._download(url, size)
+                THUMBNAIL_LOADS.inc(source='network')
+            from PIL import Image
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            return key, image
+        except Exception as e:
+            logging.error(f"Error loading thumbnail {url}: {str(e)}")
+            THUMBNAIL_LOADS.inc(source='failed')
+            return key, None
+
+    def _download(self, url, size):
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            original = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+        if len(original) > MAX_IMAGE_BYTES:
+            raise ValueError(f"image larger than {MAX_IMAGE_BYTES} bytes")
+        thumbnails = downscale(original)
+        self.cache.store(url, original, thumbnails)
+        return thumbnails[size]
+
+    def _on_loaded(self, result):
+        """Tk thread: turn a decoded thumbnail into a PhotoImage and tell the listeners"""
+        if result is None:
+            return
+        key, image = result
+        if image is None:
+            self.failed[key[0]] = time.monotonic()
+            return
+        from PIL import ImageTk
+        self.photos[key] = ImageTk.PhotoImage(image)
+        while len(self.photos) > self.memory_items:
+            self.photos.popitem(last=False)
+        for callback in self.listeners:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Error in thumbnail listener: {str(e)}")
+
+    def shutdown(self):
+        self.tasks.shutdown()
+        self.cache.close()
@@ -0,0 +1,349 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class ColumnarModel:
+    """In-memory column store with sort and filter over row indices"""
+
+    def __init__(self, columns, key=None):
+        self.columns = tuple(columns)
+        self.key = key or (lambda row: row[self.columns[0]])
+        self.data = {col: [] for col in self.columns}
+        self.keys = []
+        self.positions = {}  # key -> row index
+        self.view = []  # row indices in display order
+        self.sort_column = None
+        self.sort_reverse = False
+        self.filter_text = ''
+        self.column_filters = {}
+        self._folded = {}  # column -> casefolded copy for text filters
+
+    def __len__(self):
+        return len(self.view)
+
+    def row(self, position: int) -> dict:
+        """Get the row displayed at a view position"""
+        index = self.view[position]
+        return {col: self.data[col][index] for col in self.columns}
+
+    def values(self, position: int) -> tuple:
+        """Get the raw column values displayed at a view position"""
+        index = self.view[position]
+        return tuple(self.data[col][index] for col in self.columns)
+
+    def key_at(self, position: int):
+        return self.keys[self.view[position]]
+
+    def position_of(self, key):
+        """Get the view position of a key, or None if hidden or missing"""
+        index = self.positions.get(key)
+        if index is None:
+            return None
+        try:
+            return self.view.index(index)
+        except ValueError:
+            return None
+
+    def upsert(self, row: dict) -> bool:
+        """Insert or update a row in place, returns True if anything changed"""
+        key = self.key(row)
+        index = self.positions.get(key)
+        if index is None:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            for col in self.columns:
+                self.data[col].append(row.get(col))
+            self._folded.clear()
+            return True
+
+        changed = False
+        for col in self.columns:
+            value = row.get(col, self.data[col][index])
+            if self.data[col][index] != value:
+                self.data[col][index] = value
+                changed = True
+        if changed:
+            self._folded.clear()
+        return changed
+
+    def remove(self, key) -> bool:
+        """Remove a row by swapping the last row into its slot"""
+        index = self.positions.pop(key, None)
+        if index is None:
+            return False
+        last = len(self.keys) - 1
+        if index != last:
+            moved_key = self.keys[last]
+            self.keys[index] = moved_key
+            self.positions[moved_key] = index
+            for col in self.columns:
+                self.data[col][index] = self.data[col][last]
+        self.keys.pop()
+        for col in self.columns:
+            self.data[col].pop()
+        self._folded.clear()
+        return True
+
+    def apply(self, rows, replace=False) -> bool:
+        """Apply a batch of rows as a diff against the current contents"""
+        changed = False
+        seen = set()
+        for row in rows:
+            seen.add(self.key(row))
+            changed = self.upsert(row) or changed
+        if replace:
+            for key in [k for k in self.keys if k not in seen]:
+                changed = self.remove(key) or changed
+        if changed:
+            self.refresh_view()
+        return changed
+
+    def clear(self):
+        self.data = {col: [] for col in self.columns}
+        self.keys = []
+        self.positions = {}
+        self.view = []
+        self._folded.clear()
+
+    def sort(self, column, reverse=False):
+        self.sort_column = column
+        self.sort_reverse = reverse
+        self.refresh_view()
+
+    def set_filter(self, text='', column_filters=None):
+        """Filter rows by substring over text columns and exact column values"""
+        text = (text or '').casefold()
+        narrowing = (
+            column_filters is None
+            and self.filter_text
+            and text.startswith(self.filter_text)
+        )
+        self.filter_text = text
+        if column_filters is not None:
+            self.column_filters = {c: v for c, v in column_filters.items() if v is not None}
+        if narrowing:
+            # A longer query can only match a subset of the current view
+            self.view = self._filter(self.view)
+        else:
+            self.refresh_view()
+
+    def refresh_view(self):
+        """Rebuild the display order from the current sort and filters"""
+        indices = self._filter(range(len(self.keys)))
+        if self.sort_column is not None:
+            indices = self._sorted(indices)
+        self.view = list(indices)
+
+    def _filter(self, indices):
+        for col, wanted in self.column_filters.items():
+            column = self.data[col]
+            indices = [i for i in indices if column[i] == wanted]
+        if self.filter_text:
+            text = self.filter_text
+            folded = [self._folded_column(col) for col in self._text_columns()]
+            indices = [i for i in indices if any(text in f[i] for f in folded)]
+        return indices
+
+    def _text_columns(self):
+        return [col for col in self.columns if any(isinstance(v, str) for v in self.data[col][:50])]
+
+    def _folded_column(self, col):
+        folded = self._folded.get(col)
+        if folded is None:
+            folded = [v.casefold() if isinstance(v, str) else '' for v in self.data[col]]
+            self._folded[col] = folded
+        return folded
+
+    def _sorted(self, indices):
+        column = self.data[self.sort_column]
+        present = [i for i in indices if column[i] is not None]
+        missing = [i for i in indices if column[i] is None]
+        if present and isinstance(column[present[0]], str):
+            folded = self._folded_column(self.sort_column)
+            present.sort(key=folded.__getitem__, reverse=self.sort_reverse)
+        else:
+            present.sort(key=column.__getitem__, reverse=self.sort_reverse)
+        # Rows without a value always sink to the bottom
+        return present + missing
+
+
+class VirtualTable(ttk.Frame):
+    """Treeview that only renders the visible window of a ColumnarModel"""
+
+    def __init__(self, parent, columns, key=None, formatters=None, widths=None, height=10,
+                 image=None, image_size=None, **kwargs):
+        """image(key) returns the PhotoImage shown in front of a row, or None.
+        It is only called for visible rows, so it may load images lazily and
+        call refresh() once they arrive.
+        """
+        super().__init__(parent, **kwargs)
+        self.model = ColumnarModel(columns, key=key)
+        self.formatters = formatters or {}
+        self.image = image
+        self.height = height
+        self.offset = 0
+        self._slots = []
+        self._rendered = []
+        self._selected_key = None
+        self._render_pending = False
+
+        tree_options = {}
+        if image is not None:
+            width, row_height = image_size or (32, 32)
+            style = f"Image{row_height}.Treeview"
+            ttk.Style(self).configure(style, rowheight=row_height + 4)
+            tree_options['style'] = style
+        self.tree = ttk.Treeview(
+            self,
+            columns=self.model.columns,
+            show='tree headings' if image is not None else 'headings',
+            height=height,
+            selectmode='browse',
+            **tree_options
+        )
+        if image is not None:
+            self.tree.column('#0', width=width + 16, stretch=False)
+        widths = widths or {}
+        for col in self.model.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=widths.get(col, 150))
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        # Bind events
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+        self.tree.bind('<Prior>', lambda e: self.scroll(-self.height))
+        self.tree.bind('<Next>', lambda e: self.scroll(self.height))
+
+    def set_rows(self, rows):
+        """Replace the table contents, touching only rows that changed"""
+        self.model.apply(rows, replace=True)
+        self._schedule_render()
+
+    def upsert_rows(self, rows):
+        """Insert or update rows without dropping the others"""
+        if self.model.apply(rows):
+            self._schedule_render()
+
+    def remove_rows(self, keys):
+        if any([self.model.remove(key) for key in keys]):
+            self.model.refresh_view()
+            self._schedule_render()
+
+    def refresh(self):
+        """Redraw the visible rows, e.g. once their images have loaded"""
+        self._schedule_render()
+
+    def clear(self):
+        self.model.clear()
+        self.offset = 0
+        self._schedule_render()
+
+    def sort_by(self, column, reverse=None):
+        """Sort by a column, toggling direction when it is already sorted"""
+        if reverse is None:
+            reverse = self.model.sort_column == column and not self.model.sort_reverse
+        self.model.sort(column, reverse)
+        self._schedule_render()
+
+    def set_filter(self, text='', column_filters=None):
+        self.model.set_filter(text, column_filters)
+        self.offset = 0
+        self._schedule_render()
+
+    def selection(self) -> list:
+        """Get keys of the selected rows"""
+        return [self._selected_key] if self._selected_key is not None else []
+
+    def selected_row(self):
+        """Get the selected row as a dict, or None"""
+        position = self.model.position_of(self._selected_key)
+        return self.model.row(position) if position is not None else None
+
+    def scroll(self, rows: int):
+        self._scroll_to(self.offset + rows)
+
+    def _scroll_to(self, offset: int):
+        offset = max(0, min(offset, len(self.model) - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self._schedule_render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto':
+            self._scroll_to(int(float(value) * len(self.model)))
+        elif action == 'scroll':
+            step = self.height if unit == 'pages' else 1
+            self.scroll(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return 'break'
+
+    def _on_select(self, event=None):
+        selected = self.tree.selection()
+        if selected and selected[0] in self._slots:
+            position = self.offset + self._slots.index(selected[0])
+            if position < len(self.model):
+                self._selected_key = self.model.key_at(position)
+
+    def _schedule_render(self):
+        # Coalesce bursts of updates into one redraw per idle cycle
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _format(self, values):
+        return tuple(
+            self.formatters[col](value) if col in self.formatters else value
+            for col, value in zip(self.model.columns, values)
+        )
+
+    def _render(self):
+        """Diff the visible window against the rendered slots"""
+        self._render_pending = False
+        total = len(self.model)
+        self.offset = max(0, min(self.offset, total - self.height))
+        visible = min(self.height, total - self.offset)
+
+        # Grow or shrink the pool of reusable rows
+        while len(self._slots) < visible:
+            self._slots.append(self.tree.insert('', 'end', values=()))
+            self._rendered.append(None)
+        if len(self._slots) > visible:
+            self.tree.delete(*self._slots[visible:])
+            del self._slots[visible:]
+            del self._rendered[visible:]
+
+        selected_slot = None
+        for i, slot in enumerate(self._slots):
+            position = self.offset + i
+            key = self.model.key_at(position)
+            values = self._format(self.model.values(position))
+            # Holding the image in _rendered keeps it alive while the row shows it
+            image = self.image(key) if self.image is not None else None
+            if (values, image) != self._rendered[i]:
+                if self.image is not None:
+                    self.tree.item(slot, values=values, image=image or '')
+                else:
+                    self.tree.item(slot, values=values)
+                self._rendered[i] = (values, image)
+            if self._selected_key is not None and key == self._selected_key:
+                selected_slot = slot
+
+        if selected_slot:
+            self.tree.selection_set(selected_slot)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + visible) / total)
+        else:
+            self.scrollbar.set(0, 1)